@@ -84,16 +84,13 @@ class User(AbstractBaseUser, PermissionsMixin):
 
     def get_current_booking(self):
         """
-        Gets this user's current booking
+        Gets this user's current booking, in one query on the index of the user's bookings by end time, which only
+        reads bookings that haven't ended yet however long the user's history is.
+        Templates should use the current_booking context variable, which is only looked up once per request.
         """
-        current_bookings = self.booking_set.all()
-        active_bookings = [b for b in current_bookings if b.is_active()]
         # Should only ever be one active booking (enforced via validation when creating a booking),
-        # but it's technically possible so we always return the first one.
-        if active_bookings:
-            return active_bookings[0]
-        else:
-            return None
+        # but it's technically possible so we always return the one ending first.
+        return self.booking_set.active().order_by('schedule_end', 'id').first()
 
 
 class Address(models.Model):
@@ -1,6 +1,10 @@
 from django.core import mail
 from django.test import TestCase
+from django.utils import timezone
 
+from datetime import timedelta
+
+from carshare.models import Booking, Pod, Vehicle, VehicleType
 from ..models import *
 
 
@@ -13,6 +17,28 @@ class AccountsUserModelTests(TestCase):
     def test_short_name(self):
         self.assertEqual(self.user.get_short_name(), 'John')
 
+    def test_current_booking(self):
+        """
+        Current booking ignores finished, future and cancelled bookings, and is found in one query
+        """
+        vt = VehicleType.objects.create(description='Premium', hourly_rate=12.50, daily_rate=80.00)
+        p1 = Pod.objects.create(latitude='-39.34523453', longitude='139.53524344', description='Pod 1')
+        v1 = Vehicle.objects.create(pod=p1, type=vt, name='Vehicle1', make='Toyota', model='Yaris', year=2012,
+                                    registration='AAA222')
+        user = User.objects.create(email='test1@test.com', first_name='John', last_name='Doe',
+                                   date_of_birth='1980-01-01')
+        now = timezone.now()
+        for days in (-2, 2):
+            Booking.objects.create(user=user, vehicle=v1, schedule_start=now + timedelta(days=days),
+                                   schedule_end=now + timedelta(days=days, hours=1))
+        Booking.objects.create(user=user, vehicle=v1, schedule_start=now - timedelta(hours=1),
+                               schedule_end=now + timedelta(hours=1), cancelled=now)
+        self.assertIsNone(user.get_current_booking())
+        current = Booking.objects.create(user=user, vehicle=v1, schedule_start=now - timedelta(hours=1),
+                                         schedule_end=now + timedelta(hours=1))
+        with self.assertNumQueries(1):
+            self.assertEqual(user.get_current_booking(), current)
+
 
 class AccountsAddressModelTests(TestCase):
     address = Address(address_line_1='Address Line 1', address_line_2='Address Line 2', city='City', state='VIC',
@@ -41,9 +41,13 @@ class PodAdmin(admin.ModelAdmin):
 
 
 class BookingAdmin(admin.ModelAdmin):
-    list_display = ['id', 'user', 'vehicle', 'schedule_start', 'schedule_end']
+    list_display = ['id', 'user', 'vehicle', 'schedule_start', 'schedule_end', 'cost']
+    list_select_related = ['user', 'vehicle__type']
     ordering = ['schedule_start']
 
+    def cost(self, booking):
+        return '${0:.2f}'.format(booking.get_cost())
+
 
 class InvoiceAdmin(admin.ModelAdmin):
     list_display = ['id', 'booking', 'amount']
@@ -0,0 +1,199 @@
+#
+#   Author(s): Huon Imberger
+#   Description: Builds availability information for vehicles from a single bookings query
+#
+
+from django.utils import timezone
+
+import datetime as dt
+from itertools import chain, islice
+from math import ceil
+
+from .models import Booking, BookingHold, Vehicle, VehicleType
+from .pricing import price
+from .spatial import get_pod_index
+
+
+AVAILABLE = 'available'
+BOOKED_BY_USER = 'booked_by_user'
+UNAVAILABLE = 'unavailable'
+
+
+def get_day_hours(date):
+    """
+    Returns the 24 aware datetimes for the start of each hour of the given date, in the current timezone
+    """
+    return [
+        timezone.make_aware(dt.datetime.combine(date, dt.time(hour=i, minute=0)), timezone.get_current_timezone())
+        for i in range(0, 24)
+    ]
+
+
+def sweep_bookings_at(bookings, datetimes):
+    """
+    Finds the booking in progress at each of the given times in a single pass.
+    Where bookings overlap, the one with the lowest id wins (matching Vehicle.get_booking_at).
+    :param bookings: bookings for one vehicle
+    :param datetimes: times to check, in ascending order
+    :return: list with the booking (or None) at each time
+    """
+    bookings = sorted(bookings, key=lambda b: b.schedule_start)
+    result = []
+    in_progress = []
+    i = 0
+    for datetime in datetimes:
+        # Start tracking bookings that have begun, and stop tracking the ones that have finished
+        while i < len(bookings) and bookings[i].schedule_start <= datetime:
+            in_progress.append(bookings[i])
+            i += 1
+        in_progress = [b for b in in_progress if b.schedule_end > datetime]
+        result.append(min(in_progress, key=lambda b: b.id) if in_progress else None)
+    return result
+
+
+def label_hours(vehicle, hours, user):
+    """
+    Labels each of the given hours as available, booked by the given user, or unavailable.
+    Only bookings that overlap the hours are fetched, in one query. Slots held by other users are unavailable.
+    :param hours: aware datetimes for the start of each hour, in ascending order
+    :return: list of labels, one per hour
+    """
+    start, end = hours[0], hours[-1] + dt.timedelta(hours=1)
+    bookings = list(vehicle.booking_set.overlapping(start, end).only(
+        'id', 'user_id', 'vehicle_id', 'schedule_start', 'schedule_end'
+    ))
+    bookings += vehicle.bookinghold_set.live().overlapping(start, end).exclude(user=user).only(
+        'id', 'user_id', 'vehicle_id', 'schedule_start', 'schedule_end'
+    )
+    # Allow booking the current hour, e.g. at 11:15 the 11:00 slot is still available
+    earliest = timezone.localtime() - dt.timedelta(hours=1)
+    labels = []
+    for i, booking in enumerate(sweep_bookings_at(bookings, hours)):
+        if booking is None and hours[i] > earliest:
+            labels.append(AVAILABLE)
+        elif booking is not None and booking.user_id == user.id:
+            labels.append(BOOKED_BY_USER)
+        else:
+            labels.append(UNAVAILABLE)
+    return labels
+
+
+def get_hourly_availability(vehicle, date, user):
+    """
+    Labels each hour of the given date as available, booked by the given user, or unavailable
+    :return: dict of hour (0-23) to label
+    """
+    return dict(enumerate(label_hours(vehicle, get_day_hours(date), user)))
+
+
+def get_availability_bitmaps(vehicle, start_date, days, user):
+    """
+    Builds compact per-hour availability for a number of consecutive days, from one bookings query.
+    Each day is represented by a string of 24 characters, one per hour, where '1' means the hour is set.
+    :return: dict with a list of 'available' and a list of 'booked_by_user' day strings
+    """
+    dates = [start_date + dt.timedelta(days=i) for i in range(days)]
+    hours = [hour for date in dates for hour in get_day_hours(date)]
+    labels = label_hours(vehicle, hours, user)
+    bitmaps = {AVAILABLE: [], BOOKED_BY_USER: []}
+    for i in range(days):
+        day_labels = labels[i * 24:(i + 1) * 24]
+        for key, day_bitmaps in bitmaps.items():
+            day_bitmaps.append(''.join('1' if label == key else '0' for label in day_labels))
+    return bitmaps
+
+
+def get_occupancy(vehicles, start, end):
+    """
+    Builds a vehicles x hours occupancy matrix for the window [start, end) from one bookings query (and one query
+    for held slots). Each row is an int bitmask where bit k is set if the vehicle is booked or held at any time
+    during hour k of the window.
+    :param vehicles: queryset of vehicles to include
+    :return: dict of vehicle id to bitmask
+    """
+    occupancy = dict.fromkeys(vehicles.values_list('id', flat=True), 0)
+    bookings = Booking.objects.overlapping(start, end).filter(vehicle__in=vehicles).values_list(
+        'vehicle_id', 'schedule_start', 'schedule_end'
+    )
+    holds = BookingHold.objects.live().overlapping(start, end).filter(vehicle__in=vehicles).values_list(
+        'vehicle_id', 'schedule_start', 'schedule_end'
+    )
+    for vehicle_id, booking_start, booking_end in chain(bookings, holds):
+        first = int((max(booking_start, start) - start).total_seconds() // 3600)
+        last = int(ceil((min(booking_end, end) - start).total_seconds() / 3600))
+        occupancy[vehicle_id] |= ((1 << (last - first)) - 1) << first
+    return occupancy
+
+
+def get_free_vehicles(start, end, vehicles=None):
+    """
+    Finds every vehicle that is free for the whole of [start, end)
+    :param vehicles: queryset of vehicles to search, defaults to all active vehicles that have been assigned to a pod
+    :return: list of vehicles, in queryset order
+    """
+    if vehicles is None:
+        vehicles = Vehicle.objects.filter(active=True).exclude(pod__isnull=True)
+    occupancy = get_occupancy(vehicles, start, end)
+    free_ids = {vehicle_id for vehicle_id, row in occupancy.items() if not row}
+    return [v for v in vehicles if v.id in free_ids]
+
+
+def get_vehicle_type_quotes(start, end):
+    """
+    Prices a booking over [start, end) for every vehicle type, and counts the active vehicles of each type that are
+    free for the whole window. Bookings are read in one query, and held slots in another.
+    :return: list of dicts with the vehicle type, its BookingPrice and number of free vehicles, cheapest first
+    """
+    vehicles = Vehicle.objects.filter(active=True).exclude(pod__isnull=True)
+    booked = set(Booking.objects.overlapping(start, end).filter(vehicle__in=vehicles).values_list('vehicle_id',
+                                                                                                  flat=True))
+    booked.update(BookingHold.objects.live().overlapping(start, end).filter(vehicle__in=vehicles).values_list(
+        'vehicle_id', flat=True
+    ))
+    free = {}
+    for vehicle_id, vehicle_type_id in vehicles.values_list('id', 'type_id'):
+        free.setdefault(vehicle_type_id, 0)
+        if vehicle_id not in booked:
+            free[vehicle_type_id] += 1
+    quotes = [
+        {
+            'vehicle_type': vehicle_type,
+            'price': price(end - start, vehicle_type.hourly_rate, vehicle_type.daily_rate),
+            'free': free.get(vehicle_type.id, 0),
+        }
+        for vehicle_type in VehicleType.objects.all()
+    ]
+    return sorted(quotes, key=lambda quote: (quote['price'].cost, quote['vehicle_type'].description))
+
+
+# Most candidates checked for availability in one query, keeping the list of ids well under SQLite's limit of 999
+# query parameters
+MAX_BATCH_SIZE = 500
+
+
+def get_nearest_available_vehicles(latitude, longitude, k, start=None, end=None):
+    """
+    Finds the k closest active vehicles that are free right now, or for the whole of [start, end) if given.
+    Candidates come from the in-memory pod index nearest first, and are checked for availability in batches that
+    double in size each round, so it takes few queries even when most vehicles are booked.
+    :return: list of vehicles, nearest first, each with a distance attribute in km
+    """
+    candidates = get_pod_index().nearest(latitude, longitude)
+    batch_size = min(max(2 * k, 16), MAX_BATCH_SIZE)
+    found = []
+    while len(found) < k:
+        batch = list(islice(candidates, batch_size))
+        if not batch:
+            break
+        distances = dict(batch)
+        # Re-check the vehicles are still active with a pod, since the index may be slightly out of date
+        vehicles = Vehicle.objects.filter(id__in=distances, active=True).exclude(pod__isnull=True)
+        if start is None:
+            free = [v for v in vehicles.select_related('pod', 'type').with_available_now() if v.available_now]
+        else:
+            free = get_free_vehicles(start, end, vehicles=vehicles.select_related('pod', 'type'))
+        for vehicle in free:
+            vehicle.distance = distances[vehicle.id]
+        found.extend(sorted(free, key=lambda v: v.distance))
+        batch_size = min(2 * batch_size, MAX_BATCH_SIZE)
+    return found[:k]
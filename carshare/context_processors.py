@@ -0,0 +1,24 @@
+#
+#   Author(s): Huon Imberger
+#   Description: Template context processors, providing values used on every page
+#
+
+from django.utils.functional import SimpleLazyObject
+
+
+def get_current_booking(request):
+    """
+    Gets the logged in user's current booking, looking it up at most once per request
+    :return: Booking, or None
+    """
+    if not hasattr(request, '_current_booking'):
+        user = getattr(request, 'user', None)
+        request._current_booking = user.get_current_booking() if user and user.is_authenticated else None
+    return request._current_booking
+
+
+def current_booking(request):
+    """
+    Adds the user's current booking, shown in the navigation bar. It is only looked up if a template uses it.
+    """
+    return {'current_booking': SimpleLazyObject(lambda: get_current_booking(request))}
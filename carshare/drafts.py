@@ -0,0 +1,51 @@
+#
+#   Author(s): Huon Imberger
+#   Description: Signed booking drafts, which carry a reviewed booking to the confirm step in the review form rather
+#                than in the session
+#
+
+from django.core import signing
+from django.utils import timezone
+
+import datetime as dt
+
+
+DRAFT_SALT = 'carshare.booking_draft'
+# Drafts outlive their hold, since confirming re-checks the slot anyway
+DRAFT_MAX_AGE = 60 * 60
+
+
+class InvalidDraft(Exception):
+    """
+    Raised when a booking draft has been tampered with, has expired, or belongs to another user
+    """
+    pass
+
+
+def dump_draft(user, vehicle, start, end):
+    """
+    Signs the details of a booking being reviewed
+    :return: URL-safe token
+    """
+    return signing.dumps(
+        [user.id, vehicle.id, int(start.timestamp()), int(end.timestamp())], salt=DRAFT_SALT, compress=True
+    )
+
+
+def load_draft(token, user):
+    """
+    Checks a booking draft was signed for the user within DRAFT_MAX_AGE, without touching the database
+    :raises InvalidDraft: if it wasn't
+    :return: (vehicle id, schedule start, schedule end)
+    """
+    try:
+        user_id, vehicle_id, start, end = signing.loads(token, salt=DRAFT_SALT, max_age=DRAFT_MAX_AGE)
+    except (signing.BadSignature, TypeError, ValueError):
+        raise InvalidDraft()
+    if user_id != user.id:
+        raise InvalidDraft()
+    return (
+        vehicle_id,
+        dt.datetime.fromtimestamp(start, tz=timezone.utc),
+        dt.datetime.fromtimestamp(end, tz=timezone.utc),
+    )
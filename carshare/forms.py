@@ -14,6 +14,7 @@ from datetimewidget.widgets import DateWidget
 import datetime as dt
 
 from .models import Booking
+from .recurring import MAX_WEEKS
 
 
 class ContactForm(forms.Form):
@@ -184,6 +185,8 @@ class ExtendBookingForm(forms.Form):
 
     def clean(self):
         cleaned_data = super(ExtendBookingForm, self).clean()
+        if 'new_end_date' not in cleaned_data or 'new_end_time' not in cleaned_data:
+            return cleaned_data
         new_schedule_end = timezone.make_aware(
             dt.datetime.combine(cleaned_data['new_end_date'], cleaned_data['new_end_time']),
             timezone=timezone.get_current_timezone()
@@ -192,14 +195,23 @@ class ExtendBookingForm(forms.Form):
             # Make sure new end date is not before previous end date
             if new_schedule_end <= self.current_booking_end:
                 raise forms.ValidationError('New end time must be later than current end time')
+            # Make sure the booking doesn't run into the next booking of the vehicle or user
+            if self.latest_booking_end and new_schedule_end > self.latest_booking_end:
+                raise forms.ValidationError('The new end time overlaps with another booking. The latest end time you '
+                                            'can choose is {0:%d/%m/%Y %H:%M}'.format(
+                                                timezone.localtime(self.latest_booking_end)))
         # Insert parsed date into cleaned_data so the view doesn't have to
         cleaned_data['new_schedule_end'] = new_schedule_end
         return cleaned_data
 
     def __init__(self, *args, **kwargs):
         self.current_booking_end = kwargs.pop('current_booking_end', None)
+        self.latest_booking_end = kwargs.pop('latest_booking_end', None)
         super(ExtendBookingForm, self).__init__(*args, **kwargs)
-        # Set date minimum
+        # Set date minimum and maximum, on a copy of the options so other forms aren't affected
+        self.dateTimeOptions = dict(self.dateTimeOptions)
+        if self.latest_booking_end:
+            self.dateTimeOptions['endDate'] = timezone.localtime(self.latest_booking_end).date().isoformat()
         if self.current_booking_end:
             self.dateTimeOptions['startDate'] = self.current_booking_end.isoformat()
             self.fields['new_end_date'].widget = DateWidget(options=self.dateTimeOptions, bootstrap_version=3)
@@ -277,3 +289,41 @@ class ExtendBookingForm(forms.Form):
                 )
             ),
         )
+
+
+class RecurringBookingForm(BookingForm):
+    """
+    Booking form with the booking repeated weekly, e.g. every Monday from 08:00 to 17:00 for 12 weeks
+    """
+    weeks = forms.IntegerField(min_value=2, max_value=MAX_WEEKS, initial=4,
+                               help_text='Number of weeks to book, up to {0}'.format(MAX_WEEKS))
+
+    def clean(self):
+        cleaned_data = super(RecurringBookingForm, self).clean()
+        if 'schedule_start' in cleaned_data and 'schedule_end' in cleaned_data:
+            # Make sure each booking ends before the next week's begins
+            if cleaned_data['schedule_end'] - cleaned_data['schedule_start'] > dt.timedelta(weeks=1):
+                raise forms.ValidationError('Recurring bookings cannot be longer than a week')
+        return cleaned_data
+
+    def __init__(self, *args, **kwargs):
+        super(RecurringBookingForm, self).__init__(*args, **kwargs)
+        self.helper.layout.append(
+            Fieldset(
+                'Repeat Weekly',
+                Div(
+                    Div(
+                        Field('weeks', placeholder='Weeks'),
+                        css_class='col-sm-12',
+                    ),
+                    css_class='row',
+                )
+            )
+        )
+
+
+class WaitlistForm(BookingForm):
+    """
+    Joins the waitlist for the vehicle, or any vehicle of its type, over the times entered in the booking form
+    """
+    any_vehicle = forms.BooleanField(required=False)
@@ -0,0 +1,120 @@
+#
+#   Author(s): Huon Imberger
+#   Description: Renders invoices to PDF and emails them. wkhtmltopdf takes seconds, so this runs in a background job
+#                (see carshare.jobs) rather than in the request that paid the booking. Rendered PDFs are kept in
+#                file storage, named by invoice and template version, so each is only rendered once.
+#
+
+from django.contrib.staticfiles import finders
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.template.loader import get_template
+from django.utils import timezone
+
+from functools import lru_cache
+import hashlib
+
+from wkhtmltopdf.utils import render_pdf_from_template
+
+from .jobs import enqueue
+from .models import Invoice, Job
+
+
+INVOICE_TEMPLATE = 'carshare/pdf/invoice.html'
+# Stylesheets used by the invoice template, which change the rendered PDF as much as the template does
+INVOICE_STYLESHEETS = ['css/bootstrap.css', 'carshare/css/pdf/invoice.css']
+INVOICE_DIR = 'invoices'
+
+
+def invoice_job_key(invoice):
+    return 'invoice:{0}'.format(invoice.id)
+
+
+def render_invoice_pdf(invoice):
+    """
+    Renders an invoice with wkhtmltopdf
+    :return: PDF as bytes
+    """
+    return render_pdf_from_template(get_template(INVOICE_TEMPLATE), None, None, context={'invoice': invoice})
+
+
+@lru_cache()
+def get_template_version():
+    """
+    Hash of the invoice template and its stylesheets. Read once per process, so changes take effect on restart.
+    :return: hex string
+    """
+    digest = hashlib.sha256(get_template(INVOICE_TEMPLATE).template.source.encode())
+    for stylesheet in INVOICE_STYLESHEETS:
+        with open(finders.find(stylesheet), 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()[:16]
+
+
+def get_invoice_pdf_name(invoice):
+    """
+    Name of the invoice's PDF in file storage, for the current template version
+    """
+    return '{0}/{1}/{2}.pdf'.format(INVOICE_DIR, invoice.id, get_template_version())
+
+
+def get_invoice_pdf(invoice):
+    """
+    Makes sure the invoice's PDF for the current template version is in file storage, rendering it if it isn't.
+    PDFs rendered with earlier versions of the template are deleted.
+    :return: name of the PDF in file storage
+    """
+    name = get_invoice_pdf_name(invoice)
+    if default_storage.exists(name):
+        return name
+    saved = default_storage.save(name, ContentFile(render_invoice_pdf(invoice)))
+    if saved != name:
+        # Rendered by another request at the same time, so keep theirs. The contents are the same either way.
+        default_storage.delete(saved)
+    directory = name.rsplit('/', 1)[0]
+    for filename in default_storage.listdir(directory)[1]:
+        if '{0}/{1}'.format(directory, filename) != name:
+            default_storage.delete('{0}/{1}'.format(directory, filename))
+    return name
+
+
+def send_invoice(invoice_id):
+    """
+    Renders an invoice and emails it to the user. Run as a background job, see queue_invoice. Invoices that have
+    already been sent, e.g. by a slow worker whose job was reclaimed, aren't sent again.
+    """
+    invoice = Invoice.objects.select_related('booking__user', 'booking__vehicle').get(pk=invoice_id)
+    if invoice.sent:
+        return
+    with default_storage.open(get_invoice_pdf(invoice)) as f:
+        pdf = f.read()
+    # Mark the invoice sent before sending, so only one worker sends it
+    if not Invoice.objects.filter(pk=invoice.pk, sent__isnull=True).update(sent=timezone.now()):
+        return
+    try:
+        invoice.booking.user.send_email(
+            template_name='Booking Invoice',
+            context={'invoice': invoice},
+            attachment_filename='invoice_{0}.pdf'.format(invoice.id),
+            attachment_data=pdf,
+        )
+    except Exception:
+        # Sent when the job is retried
+        Invoice.objects.filter(pk=invoice.pk).update(sent=None)
+        raise
+
+
+def get_invoice_status(invoice):
+    """
+    Status of the job emailing the invoice: Job.PENDING, RUNNING, DONE or FAILED
+    """
+    # Invoices from before the job queue were emailed as soon as they were created
+    return Job.objects.status_of(invoice_job_key(invoice)) or Job.DONE
+
+
+def queue_invoice(invoice):
+    """
+    Queues rendering and emailing an invoice
+    :return: Job
+    """
+    return enqueue('carshare.invoices.send_invoice', invoice_job_key(invoice), invoice_id=invoice.id)
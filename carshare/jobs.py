@@ -0,0 +1,96 @@
+#
+#   Author(s): Huon Imberger
+#   Description: Local background job queue, backed by the Job table and run by the run_jobs command. Jobs are
+#                claimed with a conditional UPDATE, so any number of workers can share the queue on any database.
+#
+
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+import datetime as dt
+import json
+import traceback
+
+from .models import Job
+
+
+def enqueue(task, key, **kwargs):
+    """
+    Queues a function to be run by a worker
+    :param task: dotted path of the function, e.g. 'carshare.invoices.send_invoice'
+    :param key: what the job is for, e.g. 'invoice:12', used to look up its status
+    :param kwargs: JSON serializable keyword arguments for the function
+    :return: Job
+    """
+    return Job.objects.create(task=task, key=key, kwargs=json.dumps(kwargs))
+
+
+def claim_next():
+    """
+    Claims the next job that is due. A job is only claimed by one worker, as the claim only succeeds if the job hasn't
+    changed since it was read. Reclaiming a stalled job counts as another attempt, and stalled jobs that have used
+    all their attempts fail instead.
+    :return: Job, or None if no jobs are due
+    """
+    for job in Job.objects.due()[:10]:
+        now = timezone.now()
+        if job.status == Job.RUNNING and job.attempts >= Job.MAX_ATTEMPTS:
+            Job.objects.filter(pk=job.pk, status=job.status, attempts=job.attempts).update(
+                status=Job.FAILED, finished=now, error='Timed out after {0} attempts'.format(job.attempts)
+            )
+            continue
+        claimed = Job.objects.filter(pk=job.pk, status=job.status, attempts=job.attempts).update(
+            status=Job.RUNNING, attempts=F('attempts') + 1, started=now
+        )
+        if claimed:
+            job.refresh_from_db()
+            return job
+    return None
+
+
+def run_job(job):
+    """
+    Runs a claimed job. Failed jobs are retried later, with a longer wait after each attempt, until they have been
+    tried Job.MAX_ATTEMPTS times. If the job took so long that another worker has reclaimed it, its result is left
+    to that worker.
+    :return: True if the job succeeded
+    """
+    try:
+        import_string(job.task)(**json.loads(job.kwargs))
+    except Exception:
+        if job.attempts < Job.MAX_ATTEMPTS:
+            finish_job(job, status=Job.PENDING, error=traceback.format_exc(),
+                       run_after=timezone.now() + dt.timedelta(minutes=job.attempts ** 2))
+        else:
+            finish_job(job, status=Job.FAILED, error=traceback.format_exc(), finished=timezone.now())
+        return False
+    finish_job(job, status=Job.DONE, error='', finished=timezone.now())
+    return True
+
+
+def finish_job(job, **fields):
+    """
+    Records the result of a claimed job, unless it has since been reclaimed by another worker
+    :return: True if the result was recorded
+    """
+    updated = Job.objects.filter(pk=job.pk, status=Job.RUNNING, attempts=job.attempts).update(**fields)
+    for name, value in fields.items():
+        setattr(job, name, value)
+    return bool(updated)
+
+
+def run_pending(limit=None):
+    """
+    Runs jobs until none are due
+    :param limit: most jobs to run, or None for no limit
+    :return: list of the jobs run
+    """
+    jobs = []
+    while limit is None or len(jobs) < limit:
+        job = claim_next()
+        if job is None:
+            break
+        run_job(job)
+        jobs.append(job)
+    return jobs
@@ -0,0 +1,87 @@
+#
+#   Author(s): Huon Imberger
+#   Description: Shared helpers for benchmark management commands
+#
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+import datetime as dt
+import timeit
+
+from accounts.models import User
+from carshare.models import VehicleType, Pod, Vehicle
+from carshare.spatial import grid_cell
+
+
+class Rollback(Exception):
+    """
+    Raised to discard benchmark data once a benchmark has finished
+    """
+    pass
+
+
+class BenchmarkCommand(BaseCommand):
+    """
+    Base command for benchmarks. Sample data is generated inside a transaction that is always rolled back, so
+    benchmarks can be run against any database without leaving anything behind.
+    """
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=5, help='Number of timed runs for each case')
+
+    def handle(self, *args, **options):
+        self.repeat = options['repeat']
+        try:
+            with transaction.atomic():
+                self.run_benchmark(*args, **options)
+                raise Rollback()
+        except Rollback:
+            pass
+
+    def run_benchmark(self, *args, **options):
+        raise NotImplementedError('Subclasses of BenchmarkCommand must provide a run_benchmark() method')
+
+    def time(self, label, func, number=1):
+        """
+        Times func and writes the best time per call to stdout
+        :return: best time per call, in seconds
+        """
+        best = min(timeit.repeat(func, repeat=self.repeat, number=number)) / number
+        self.stdout.write('{0:<50} {1:>12.3f} ms'.format(label, best * 1000))
+        return best
+
+    def compare(self, label, baseline, candidate, number=1):
+        """
+        Times a baseline and a candidate implementation and reports the speedup
+        """
+        baseline_time = self.time('{0} (baseline)'.format(label), baseline, number=number)
+        candidate_time = self.time('{0} (new)'.format(label), candidate, number=number)
+        self.stdout.write('{0:<50} {1:>12.1f} x'.format('{0} speedup'.format(label), baseline_time / candidate_time))
+
+
+def create_user(email='benchmark@test.com'):
+    return User.objects.create(email=email, first_name='Bench', last_name='Mark', date_of_birth=dt.date(1980, 1, 1))
+
+
+def create_vehicles(count, vehicle_type=None, prefix='Bench'):
+    """
+    Creates count active vehicles, each with its own pod, spread over a grid around Melbourne
+    """
+    if vehicle_type is None:
+        vehicle_type = VehicleType.objects.create(description='Standard', hourly_rate='12.50', daily_rate='80.00')
+    coordinates = [(-37.9 + (i % 100) * 0.002, 144.9 + (i // 100) * 0.002) for i in range(count)]
+    # bulk_create skips signals, so set the grid cell here
+    pods = Pod.objects.bulk_create([
+        Pod(latitude='{0:.8f}'.format(latitude), longitude='{0:.8f}'.format(longitude),
+            grid_cell=grid_cell(latitude, longitude), description='{0} Pod {1}'.format(prefix, i))
+        for i, (latitude, longitude) in enumerate(coordinates)
+    ])
+    # bulk_create does not set primary keys on every backend, so re-fetch the pods
+    if pods and pods[0].pk is None:
+        pods = list(Pod.objects.filter(description__startswith='{0} Pod '.format(prefix)).order_by('id'))
+    Vehicle.objects.bulk_create([
+        Vehicle(type=vehicle_type, pod=pod, name='{0}{1}'.format(prefix, i), make='Toyota', model='Corolla',
+                year=2015, registration='{0:06d}'.format(i))
+        for i, pod in enumerate(pods)
+    ])
+    return list(Vehicle.objects.filter(name__startswith=prefix).select_related('pod', 'type').order_by('id'))
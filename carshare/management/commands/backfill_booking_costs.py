@@ -0,0 +1,60 @@
+#
+#   Author(s): Huon Imberger
+#   Description: Stores the cost, billable days and hours, and duration of bookings saved before they were priced
+#
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from collections import defaultdict
+from decimal import Decimal
+
+from carshare.models import Booking
+from carshare.pricing import get_rates, price, with_length
+from carshare.stats import rebuild_site_stats
+
+
+class Command(BaseCommand):
+    help = 'Prices bookings that have no stored cost, in chunks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Number of bookings to price per transaction')
+        parser.add_argument('--all', action='store_true', help='Reprice every booking, e.g. after changing rates')
+
+    def handle(self, *args, **options):
+        bookings = Booking.objects.all()
+        if not options['all']:
+            bookings = bookings.filter(cost__isnull=True)
+        rates = get_rates()
+        last_id = 0
+        priced = 0
+        while True:
+            # Walk the primary key, so each chunk is an index range scan however many rows have been done
+            rows = list(
+                with_length(bookings.filter(pk__gt=last_id)).order_by('pk').values_list(
+                    'id', 'length', 'vehicle__type_id'
+                )[:options['chunk_size']]
+            )
+            if not rows:
+                break
+            # Bookings with the same length and vehicle type have the same price, so update them together
+            groups = defaultdict(list)
+            for booking_id, length, vehicle_type_id in rows:
+                groups[(length, vehicle_type_id)].append(booking_id)
+            with transaction.atomic():
+                for (length, vehicle_type_id), booking_ids in groups.items():
+                    booking_price = price(length, *rates[vehicle_type_id])
+                    Booking.objects.filter(pk__in=booking_ids).update(
+                        cost=Decimal(str(booking_price.cost)),
+                        billable_days=booking_price.days,
+                        billable_hours=booking_price.hours,
+                        duration=length,
+                    )
+            last_id = rows[-1][0]
+            priced += len(rows)
+            self.stdout.write('Priced {0} bookings'.format(priced))
+        if options['all'] and priced:
+            # Repricing bypasses signals, so the stats still hold the old costs
+            rebuild_site_stats()
+            self.stdout.write('Recounted site stats')
+        self.stdout.write(self.style.SUCCESS('Done, priced {0} bookings'.format(priced)))
@@ -0,0 +1,68 @@
+#
+#   Author(s): Huon Imberger
+#   Description: Benchmarks vehicle availability lookups against the original booking_set scan
+#
+
+from django.utils import timezone
+
+import datetime as dt
+
+from carshare.models import Booking
+from ._benchmark import BenchmarkCommand, create_user, create_vehicles
+
+
+def scan_is_available_at(vehicle, datetime):
+    """
+    Original implementation of Vehicle.is_available_at, kept as a baseline
+    """
+    for booking in vehicle.booking_set.all():
+        if booking.schedule_start <= datetime < booking.schedule_end and not booking.is_cancelled():
+            return False
+    return True
+
+
+def scan_get_booking_at(vehicle, datetime):
+    """
+    Original implementation of Vehicle.get_booking_at, kept as a baseline
+    """
+    for booking in vehicle.booking_set.all():
+        if booking.schedule_start <= datetime < booking.schedule_end and not booking.is_cancelled():
+            return booking
+    return None
+
+
+class Command(BenchmarkCommand):
+    help = 'Benchmarks Vehicle.is_available_at and Vehicle.get_booking_at for a vehicle with a long booking history'
+
+    def add_arguments(self, parser):
+        super(Command, self).add_arguments(parser)
+        parser.add_argument('--bookings', type=int, default=5000, help='Number of bookings for the vehicle')
+
+    def run_benchmark(self, *args, **options):
+        user = create_user()
+        vehicle = create_vehicles(1)[0]
+        # Back-to-back three hour bookings with a one hour gap, every tenth one cancelled
+        start = timezone.now() - dt.timedelta(hours=4 * options['bookings'])
+        Booking.objects.bulk_create([
+            Booking(
+                user=user,
+                vehicle=vehicle,
+                schedule_start=start + dt.timedelta(hours=4 * i),
+                schedule_end=start + dt.timedelta(hours=4 * i + 3),
+                cancelled=timezone.now() if i % 10 == 0 else None,
+            )
+            for i in range(options['bookings'])
+        ])
+        self.stdout.write('{0} bookings for one vehicle'.format(options['bookings']))
+
+        booked = start + dt.timedelta(hours=4 * (options['bookings'] // 2) + 1)
+        free = booked + dt.timedelta(hours=2, minutes=30)
+        for label, datetime in (('booked', booked), ('free', free)):
+            assert scan_is_available_at(vehicle, datetime) == vehicle.is_available_at(datetime)
+            assert scan_get_booking_at(vehicle, datetime) == vehicle.get_booking_at(datetime)
+            self.compare('is_available_at ({0})'.format(label),
+                         lambda: scan_is_available_at(vehicle, datetime),
+                         lambda: vehicle.is_available_at(datetime))
+            self.compare('get_booking_at ({0})'.format(label),
+                         lambda: scan_get_booking_at(vehicle, datetime),
+                         lambda: vehicle.get_booking_at(datetime))
@@ -0,0 +1,52 @@
+#
+#   Author(s): Huon Imberger
+#   Description: Benchmarks finding a user's current booking by loading all their bookings against the indexed
+#                query, and against the per-request lookup used by the navigation bar
+#
+
+from django.http import HttpRequest
+from django.utils import timezone
+
+import datetime as dt
+
+from carshare.context_processors import get_current_booking
+from carshare.models import Booking
+from ._benchmark import BenchmarkCommand, create_user, create_vehicles
+
+
+class Command(BenchmarkCommand):
+    help = 'Benchmarks looking up the current booking of a user with many bookings'
+
+    def add_arguments(self, parser):
+        super(Command, self).add_arguments(parser)
+        parser.add_argument('--bookings', type=int, default=10000, help='Number of bookings the user has made')
+
+    def run_benchmark(self, *args, **options):
+        user = create_user()
+        vehicles = create_vehicles(10)
+        # A long history of 2 hour bookings, one every day, with the current booking in the middle of it
+        now = timezone.now()
+        first = now - dt.timedelta(days=options['bookings'] // 2, hours=1)
+        Booking.objects.bulk_create([
+            Booking(user=user, vehicle=vehicles[i % len(vehicles)], schedule_start=first + dt.timedelta(days=i),
+                    schedule_end=first + dt.timedelta(days=i, hours=2))
+            for i in range(options['bookings'])
+        ], batch_size=500)
+        self.stdout.write('{0} bookings'.format(options['bookings']))
+
+        def scan():
+            # The previous implementation of User.get_current_booking
+            active_bookings = [b for b in user.booking_set.all() if b.is_active()]
+            return active_bookings[0] if active_bookings else None
+
+        current = user.get_current_booking()
+        assert current is not None and scan() == current
+        self.compare('current booking', scan, user.get_current_booking)
+
+        def page():
+            # Every page used to look up the current booking up to 5 times in the navigation bar
+            request = HttpRequest()
+            request.user = user
+            return [get_current_booking(request) for i in range(5)]
+
+        self.compare('navigation bar', lambda: [scan() for i in range(5)], page)
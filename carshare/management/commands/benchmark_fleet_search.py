@@ -0,0 +1,49 @@
+#
+#   Author(s): Huon Imberger
+#   Description: Benchmarks the fleet-wide free vehicle search against checking each vehicle in turn
+#
+
+from django.utils import timezone
+
+import datetime as dt
+import random
+
+from carshare.availability import get_free_vehicles
+from carshare.models import Booking, Vehicle
+from ._benchmark import BenchmarkCommand, create_user, create_vehicles
+
+
+class Command(BenchmarkCommand):
+    help = 'Benchmarks get_free_vehicles for a large fleet'
+
+    def add_arguments(self, parser):
+        super(Command, self).add_arguments(parser)
+        parser.add_argument('--vehicles', type=int, default=2000, help='Number of vehicles in the fleet')
+        parser.add_argument('--bookings', type=int, default=20, help='Number of bookings per vehicle')
+
+    def run_benchmark(self, *args, **options):
+        random.seed(0)
+        user = create_user()
+        vehicles = create_vehicles(options['vehicles'])
+        start = timezone.now().replace(minute=0, second=0, microsecond=0)
+        bookings = []
+        for vehicle in vehicles:
+            for i in range(options['bookings']):
+                booking_start = start + dt.timedelta(hours=random.randrange(24 * 14))
+                bookings.append(Booking(user=user, vehicle=vehicle, schedule_start=booking_start,
+                                        schedule_end=booking_start + dt.timedelta(hours=random.randint(1, 8))))
+        Booking.objects.bulk_create(bookings, batch_size=500)
+        self.stdout.write('{0} vehicles, {1} bookings'.format(len(vehicles), len(bookings)))
+
+        window_start = start + dt.timedelta(days=7)
+        window_end = window_start + dt.timedelta(hours=6)
+        fleet = Vehicle.objects.filter(active=True).exclude(pod__isnull=True)
+
+        def per_vehicle():
+            return [v for v in fleet if v.is_available_between(window_start, window_end)]
+
+        def search():
+            return get_free_vehicles(window_start, window_end, vehicles=fleet)
+
+        assert per_vehicle() == search()
+        self.compare('free vehicles for a 6 hour window', per_vehicle, search)
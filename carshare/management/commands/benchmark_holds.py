@@ -0,0 +1,98 @@
+#
+#   Author(s): Huon Imberger
+#   Description: Benchmarks booking holds with many users reviewing the same slots, and sweeping expired holds.
+#                Requests are run one at a time on one connection, so this measures how holds change who gets a
+#                slot, not how they perform under concurrent load.
+#
+
+from django.utils import timezone
+
+from itertools import cycle
+import datetime as dt
+import random
+import timeit
+
+from carshare.managers import BookingClash
+from carshare.models import Booking, BookingHold
+from ._benchmark import BenchmarkCommand, create_user, create_vehicles
+
+
+class Command(BenchmarkCommand):
+    help = 'Benchmarks holding slots during booking review, with many users reviewing the same slots'
+
+    def add_arguments(self, parser):
+        super(Command, self).add_arguments(parser)
+        parser.add_argument('--users', type=int, default=500, help='Number of users reviewing bookings')
+        parser.add_argument('--vehicles', type=int, default=20, help='Number of vehicles they compete for')
+        parser.add_argument('--expired', type=int, default=50000, help='Number of expired holds to sweep')
+
+    def run_benchmark(self, *args, **options):
+        random.seed(0)
+        users = [create_user('bench{0}@test.com'.format(i)) for i in range(options['users'])]
+        vehicles = create_vehicles(options['vehicles'])
+        day = timezone.now().replace(minute=0, second=0, microsecond=0) + dt.timedelta(days=30)
+        # Each user reviews a 2 hour slot starting at one of 12 popular times of day
+        requests = []
+        for user in users:
+            start = day + dt.timedelta(hours=random.randint(8, 19))
+            requests.append((user, random.choice(vehicles), start, start + dt.timedelta(hours=2)))
+        self.stdout.write('{0} users, {1} vehicles'.format(len(users), len(vehicles)))
+
+        # Requests run one after another in this process, in the order of the worst case for concurrent users:
+        # everyone reviews before anyone confirms, then everyone confirms in a random order
+        def simulate(use_holds):
+            Booking.objects.filter(user__in=users).delete()
+            BookingHold.objects.all().delete()
+            reviewed = []
+            rejected_at_review = 0
+            for user, vehicle, start, end in requests:
+                if use_holds:
+                    try:
+                        BookingHold.objects.hold(user, vehicle, start, end)
+                    except BookingClash:
+                        rejected_at_review += 1
+                        continue
+                elif Booking.objects.clashes(user, vehicle, start, end):
+                    rejected_at_review += 1
+                    continue
+                reviewed.append((user, vehicle, start, end))
+            random.shuffle(reviewed)
+            lost_at_confirm = 0
+            for user, vehicle, start, end in reviewed:
+                try:
+                    Booking.objects.create_if_available(user, vehicle, start, end)
+                except BookingClash:
+                    lost_at_confirm += 1
+            return rejected_at_review, lost_at_confirm
+
+        for use_holds, label in [(False, 'without holds'), (True, 'with holds')]:
+            rejected, lost = simulate(use_holds)
+            self.stdout.write('{0:<50} {1:>12d}'.format('rejected at review {0}'.format(label), rejected))
+            self.stdout.write('{0:<50} {1:>12d}'.format('lost at confirm {0}'.format(label), lost))
+
+        # Time per hold on a single connection, with every user replacing their hold in turn
+        Booking.objects.filter(user__in=users).delete()
+        BookingHold.objects.all().delete()
+        next_request = cycle(requests)
+
+        def hold():
+            user, vehicle, start, end = next(next_request)
+            try:
+                BookingHold.objects.hold(user, vehicle, start, end)
+            except BookingClash:
+                pass
+
+        hold_time = self.time('hold', hold, number=len(requests))
+        self.stdout.write('{0:<50} {1:>12.0f} /s'.format('holds per second (one connection)', 1 / hold_time))
+
+        # Sweeping is destructive, so time a single run
+        BookingHold.objects.all().delete()
+        expired = timezone.now() - dt.timedelta(minutes=1)
+        BookingHold.objects.bulk_create([
+            BookingHold(user=user, vehicle=vehicle, schedule_start=start, schedule_end=end, expires=expired)
+            for user, vehicle, start, end in (requests[i % len(requests)] for i in range(options['expired']))
+        ], batch_size=500)
+        started = timeit.default_timer()
+        deleted, _ = BookingHold.objects.expired().delete()
+        sweep_time = timeit.default_timer() - started
+        self.stdout.write('{0:<50} {1:>12.3f} ms'.format('sweep {0} expired holds'.format(deleted), sweep_time * 1000))
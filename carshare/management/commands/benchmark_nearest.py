@@ -0,0 +1,54 @@
+#
+#   Author(s): Huon Imberger
+#   Description: Benchmarks the nearest available vehicle search against sorting every pod by distance
+#
+
+from django.utils import timezone
+
+import datetime as dt
+import random
+
+from carshare.availability import get_nearest_available_vehicles
+from carshare.models import Booking, Vehicle
+from carshare.spatial import haversine_km, get_pod_index, invalidate_pod_index
+from ._benchmark import BenchmarkCommand, create_user, create_vehicles
+
+
+class Command(BenchmarkCommand):
+    help = 'Benchmarks get_nearest_available_vehicles for a large number of pods'
+
+    def add_arguments(self, parser):
+        super(Command, self).add_arguments(parser)
+        parser.add_argument('--pods', type=int, default=10000, help='Number of pods (one vehicle each)')
+        parser.add_argument('--k', type=int, default=5, help='Number of vehicles to find')
+
+    def run_benchmark(self, *args, **options):
+        random.seed(0)
+        user = create_user()
+        vehicles = create_vehicles(options['pods'])
+        # A third of the fleet is in use right now
+        now = timezone.now()
+        Booking.objects.bulk_create([
+            Booking(user=user, vehicle=v, schedule_start=now - dt.timedelta(hours=1),
+                    schedule_end=now + dt.timedelta(hours=1))
+            for v in vehicles if random.random() < 0.33
+        ], batch_size=500)
+        self.stdout.write('{0} pods'.format(len(vehicles)))
+        latitude, longitude = -37.8136, 144.9631
+        k = options['k']
+
+        def brute_force():
+            # Sort every pod by distance, then check availability in one query
+            fleet = Vehicle.objects.filter(active=True).exclude(pod__isnull=True).select_related('pod', 'type')
+            free = [v for v in fleet.with_available_now() if v.available_now]
+            return sorted(free, key=lambda v: haversine_km(latitude, longitude, v.pod.latitude, v.pod.longitude))[:k]
+
+        def build():
+            invalidate_pod_index()
+            get_pod_index()
+
+        assert brute_force() == get_nearest_available_vehicles(latitude, longitude, k)
+        self.time('index build', build)
+        self.compare('{0} nearest available'.format(k), brute_force,
+                     lambda: get_nearest_available_vehicles(latitude, longitude, k))
+        invalidate_pod_index()
@@ -0,0 +1,59 @@
+#
+#   Author(s): Huon Imberger
+#   Description: Benchmarks pricing a large number of bookings one at a time against carshare.pricing.price_bookings
+#
+
+from django.utils import timezone
+
+import datetime as dt
+import random
+
+from carshare.models import Booking, Vehicle, VehicleType
+from carshare.pricing import price_bookings, total_cost
+from ._benchmark import BenchmarkCommand, create_user, create_vehicles
+
+
+class Command(BenchmarkCommand):
+    help = 'Benchmarks pricing bookings one at a time against pricing a whole queryset'
+
+    def add_arguments(self, parser):
+        super(Command, self).add_arguments(parser)
+        parser.add_argument('--bookings', type=int, default=100000, help='Number of bookings to price')
+
+    def run_benchmark(self, *args, **options):
+        random.seed(0)
+        user = create_user()
+        vehicle_types = [
+            VehicleType.objects.create(description='Type {0}'.format(i), hourly_rate=hourly, daily_rate=daily)
+            for i, (hourly, daily) in enumerate([('12.50', '80.00'), ('15.00', '95.00'), ('9.00', '65.00')])
+        ]
+        vehicles = create_vehicles(150, vehicle_type=vehicle_types[0])
+        for i, vehicle_type in enumerate(vehicle_types[1:], start=1):
+            Vehicle.objects.filter(id__in=[v.id for v in vehicles[i::3]]).update(type=vehicle_type)
+        # Mostly whole hour bookings, with some arbitrary lengths
+        start = timezone.now()
+        bookings = []
+        for i in range(options['bookings']):
+            if random.random() < 0.9:
+                length = dt.timedelta(hours=random.randint(1, 72))
+            else:
+                length = dt.timedelta(minutes=random.randint(1, 14 * 24 * 60))
+            bookings.append(Booking(user=user, vehicle=random.choice(vehicles), schedule_start=start,
+                                    schedule_end=start + length))
+        Booking.objects.bulk_create(bookings, batch_size=500)
+        self.stdout.write('{0} bookings'.format(len(bookings)))
+
+        def per_booking():
+            # Best case for the per-object methods, with vehicles and types loaded up front
+            return {b.id: b.calculate_cost() for b in Booking.objects.select_related('vehicle__type').iterator()}
+
+        def batch():
+            return {booking_id: p.cost for booking_id, p in price_bookings(Booking.objects.all()).items()}
+
+        assert per_booking() == batch()
+        per_booking_time = self.time('per booking calculate_cost', per_booking)
+        batch_time = self.time('price_bookings', batch)
+        self.stdout.write('{0:<50} {1:>12.0f} /s'.format('per booking throughput', len(bookings) / per_booking_time))
+        self.stdout.write('{0:<50} {1:>12.0f} /s'.format('price_bookings throughput', len(bookings) / batch_time))
+        self.stdout.write('{0:<50} {1:>12.1f} x'.format('speedup', per_booking_time / batch_time))
+        self.compare('total cost', lambda: sum(per_booking().values()), lambda: total_cost(Booking.objects.all()))
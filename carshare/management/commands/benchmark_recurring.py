@@ -0,0 +1,56 @@
+#
+#   Author(s): Huon Imberger
+#   Description: Benchmarks booking a vehicle every week one booking at a time, against checking every week in one
+#                sweep and creating the bookings together
+#
+
+from django.utils import timezone
+
+import datetime as dt
+
+from carshare.managers import BookingClash
+from carshare.models import Booking
+from carshare.recurring import create_recurring_bookings, weekly_intervals
+from ._benchmark import BenchmarkCommand, create_user, create_vehicles
+
+
+class Command(BenchmarkCommand):
+    help = 'Benchmarks creating recurring weekly bookings on a busy vehicle'
+
+    def add_arguments(self, parser):
+        super(Command, self).add_arguments(parser)
+        parser.add_argument('--weeks', type=int, default=52, help='Number of weeks to book')
+        parser.add_argument('--bookings', type=int, default=5000, help='Number of bookings other users have made')
+
+    def run_benchmark(self, *args, **options):
+        user = create_user()
+        other = create_user('other@test.com')
+        vehicle = create_vehicles(1)[0]
+        # The vehicle is booked by someone else for a few hours most days, and every 10th Monday morning
+        start = timezone.now().replace(minute=0, second=0, microsecond=0) + dt.timedelta(days=1)
+        Booking.objects.bulk_create([
+            Booking(user=other, vehicle=vehicle, schedule_start=start + dt.timedelta(days=i, hours=18),
+                    schedule_end=start + dt.timedelta(days=i, hours=21))
+            for i in range(options['bookings'])
+        ] + [
+            Booking(user=other, vehicle=vehicle, schedule_start=start + dt.timedelta(weeks=i),
+                    schedule_end=start + dt.timedelta(weeks=i, hours=1))
+            for i in range(0, options['weeks'], 10)
+        ], batch_size=500)
+        intervals = weekly_intervals(start, start + dt.timedelta(hours=9), options['weeks'])
+        self.stdout.write('{0} weeks, {1} other bookings'.format(len(intervals), options['bookings']))
+
+        def one_at_a_time():
+            # What booking every week through the booking form amounts to
+            user.booking_set.all().delete()
+            for schedule_start, schedule_end in intervals:
+                try:
+                    Booking.objects.create_if_available(user, vehicle, schedule_start, schedule_end)
+                except BookingClash:
+                    pass
+
+        def recurring():
+            user.booking_set.all().delete()
+            create_recurring_bookings(user, vehicle, intervals)
+
+        self.compare('book {0} weeks'.format(len(intervals)), one_at_a_time, recurring)
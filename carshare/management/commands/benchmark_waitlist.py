@@ -0,0 +1,65 @@
+#
+#   Author(s): Huon Imberger
+#   Description: Benchmarks matching a cancelled booking against the waitlist by scanning every entry, against the
+#                indexed lookup used by carshare.waitlist
+#
+
+from django.utils import timezone
+
+import datetime as dt
+import random
+
+from carshare.models import Booking, WaitlistEntry
+from carshare.waitlist import find_offers
+from ._benchmark import BenchmarkCommand, create_user, create_vehicles
+
+
+class Command(BenchmarkCommand):
+    help = 'Benchmarks finding the waitlist entries to offer a slot freed by a cancellation'
+
+    def add_arguments(self, parser):
+        super(Command, self).add_arguments(parser)
+        parser.add_argument('--entries', type=int, default=20000, help='Number of waitlist entries')
+        parser.add_argument('--vehicles', type=int, default=50, help='Number of vehicles waited for')
+
+    def run_benchmark(self, *args, **options):
+        random.seed(0)
+        user = create_user()
+        vehicles = create_vehicles(options['vehicles'])
+        vehicle_type = vehicles[0].type
+        # Entries for 2 to 8 hour windows over the next 60 days, a fifth of them for any vehicle of the type
+        day = timezone.now().replace(minute=0, second=0, microsecond=0) + dt.timedelta(days=1)
+        entries = []
+        for i in range(options['entries']):
+            start = day + dt.timedelta(hours=random.randint(0, 60 * 24))
+            end = start + dt.timedelta(hours=random.randint(2, 8))
+            if i % 5:
+                entries.append(WaitlistEntry(user=user, vehicle=random.choice(vehicles), schedule_start=start,
+                                             schedule_end=end))
+            else:
+                entries.append(WaitlistEntry(user=user, vehicle_type=vehicle_type, schedule_start=start,
+                                             schedule_end=end))
+        WaitlistEntry.objects.bulk_create(entries, batch_size=500)
+        self.stdout.write('{0} waitlist entries, {1} vehicles'.format(len(entries), len(vehicles)))
+
+        # A 4 hour booking in the middle of the period is cancelled
+        vehicle = vehicles[0]
+        start = day + dt.timedelta(days=30, hours=10)
+        end = start + dt.timedelta(hours=4)
+        cancelled = Booking.objects.create(user=user, vehicle=vehicle, schedule_start=start, schedule_end=end,
+                                           cancelled=timezone.now())
+
+        def scan():
+            # Check every waiting entry, then whether the vehicle is free for each match
+            matches = [
+                entry for entry in WaitlistEntry.objects.waiting()
+                if (entry.vehicle_id == vehicle.id or entry.vehicle_type_id == vehicle.type_id) and
+                entry.schedule_start < cancelled.schedule_end and entry.schedule_end > cancelled.schedule_start
+            ]
+            return [entry for entry in matches
+                    if vehicle.is_available_between(entry.schedule_start, entry.schedule_end)]
+
+        offers = find_offers(vehicle, start, end)
+        assert sorted(entry.id for entry in scan()) == sorted(entry.id for entry in offers)
+        self.stdout.write('{0} entries offered'.format(len(offers)))
+        self.compare('match cancellation', scan, lambda: find_offers(vehicle, start, end))
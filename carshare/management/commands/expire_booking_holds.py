@@ -0,0 +1,18 @@
+#
+#   Author(s): Huon Imberger
+#   Description: Deletes expired booking holds. Expired holds are already ignored by availability checks, so this
+#                only keeps the holds table small - run it every few minutes, e.g. from cron.
+#
+
+from django.core.management.base import BaseCommand
+
+from carshare.models import BookingHold
+
+
+class Command(BaseCommand):
+    help = 'Deletes booking holds that have expired'
+
+    def handle(self, *args, **options):
+        # BookingHold has no signals or related objects, so this is a single DELETE using the index on expires
+        deleted, _ = BookingHold.objects.expired().delete()
+        self.stdout.write('Deleted {0} expired holds'.format(deleted))
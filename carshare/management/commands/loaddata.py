@@ -0,0 +1,17 @@
+#
+#   Author(s): Huon Imberger
+#   Description: Django's loaddata, also discarding the About Us page totals so they are recounted on next use.
+#                Fixtures are saved raw, so their objects aren't counted as they are loaded.
+#
+
+from django.core.management.commands import loaddata
+
+from carshare.models import SiteStats
+
+
+class Command(loaddata.Command):
+
+    def handle(self, *fixture_labels, **options):
+        super(Command, self).handle(*fixture_labels, **options)
+        if self.loaded_object_count:
+            SiteStats.objects.using(self.using).all().delete()
@@ -0,0 +1,18 @@
+#
+#   Author(s): Huon Imberger
+#   Description: Recounts the About Us page totals from scratch, e.g. after bulk changes that bypass signals
+#
+
+from django.core.management.base import BaseCommand
+
+from carshare.stats import rebuild_site_stats
+
+
+class Command(BaseCommand):
+    help = 'Recounts the site stats shown on the About Us page'
+
+    def handle(self, *args, **options):
+        stats = rebuild_site_stats()
+        self.stdout.write('{0} vehicles, {1} pods, {2} bookings, ${3} of completed bookings'.format(
+            stats.num_vehicles, stats.num_pods, stats.num_bookings, stats.completed_cost
+        ))
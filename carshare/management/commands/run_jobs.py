@@ -0,0 +1,32 @@
+#
+#   Author(s): Huon Imberger
+#   Description: Background worker running queued jobs (see carshare.jobs), e.g. rendering and emailing invoices.
+#                Run one or more alongside the web server, or with --once from cron.
+#
+
+from django.core.management.base import BaseCommand
+
+import time
+
+from carshare.jobs import run_pending
+from carshare.models import Job
+
+
+class Command(BaseCommand):
+    help = 'Runs queued background jobs, polling for new jobs until stopped'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Exit once no jobs are due')
+        parser.add_argument('--sleep', type=float, default=1, help='Seconds to wait between polls when idle')
+
+    def handle(self, *args, **options):
+        while True:
+            for job in run_pending():
+                if job.status == Job.DONE:
+                    self.stdout.write('Ran {0}'.format(job))
+                else:
+                    self.stderr.write('Failed {0} (attempt {1} of {2}): {3}'.format(
+                        job, job.attempts, Job.MAX_ATTEMPTS, job.error.strip().splitlines()[-1]))
+            if options['once']:
+                break
+            time.sleep(options['sleep'])
@@ -0,0 +1,295 @@
+#
+#   Author(s): Huon Imberger
+#   Description: Custom carshare managers and querysets for managing sets of objects
+#
+
+from django.apps import apps
+from django.db import models, transaction, OperationalError
+from django.db.models import Case, Exists, OuterRef, Q, Subquery, Value, When
+from django.utils import timezone
+
+import datetime as dt
+import random
+import time
+
+from accounts.models import User
+from .spatial import bounds_filter
+
+
+class BookingClash(Exception):
+    """
+    Raised when a booking would overlap an existing booking
+    """
+    message = 'The selected times clash with an existing booking'
+
+    def __str__(self):
+        return self.message
+
+
+class VehicleBookingClash(BookingClash):
+    message = 'The selected vehicle is unavailable within the chosen times'
+
+
+class UserBookingClash(BookingClash):
+    message = 'You already have a booking within the selected time frame'
+
+
+class BookingQuerySet(models.QuerySet):
+    """
+    Booking queryset providing interval lookups that run as a single range query in the database.
+    Bookings are treated as half-open intervals [schedule_start, schedule_end).
+    """
+    # Number of times to retry creating a booking when the database reports a lock conflict
+    CREATE_ATTEMPTS = 20
+
+    def not_cancelled(self):
+        """
+        Bookings that have not been cancelled
+        """
+        return self.filter(cancelled__isnull=True)
+
+    def at(self, datetime):
+        """
+        Non-cancelled bookings in progress at the specified time
+        :param datetime: when to check
+        """
+        return self.not_cancelled().filter(schedule_start__lte=datetime, schedule_end__gt=datetime)
+
+    def active(self):
+        """
+        Non-cancelled bookings in progress right now (matches Booking.is_active)
+        """
+        now = timezone.now()
+        return self.not_cancelled().filter(schedule_start__lt=now, schedule_end__gt=now)
+
+    def overlapping(self, start, end):
+        """
+        Non-cancelled bookings that overlap the interval [start, end)
+        :param start: start of the interval (inclusive)
+        :param end: end of the interval (exclusive)
+        """
+        return self.not_cancelled().filter(schedule_start__lt=end, schedule_end__gt=start)
+
+    def upcoming(self, now):
+        """
+        Non-cancelled bookings that start after now, soonest first
+        """
+        return self.not_cancelled().filter(schedule_start__gt=now).order_by('schedule_start', 'id')
+
+    def past(self, now):
+        """
+        Bookings that have ended or been cancelled, most recent first
+        """
+        return self.filter(Q(schedule_end__lte=now) | Q(cancelled__isnull=False)).order_by('-schedule_start', '-id')
+
+    def clashes(self, user, vehicle, start, end):
+        """
+        Finds every reason a booking for the user and vehicle over [start, end) can't be made: it overlaps an existing
+        booking or a slot held by another user, or the user already has a booking during the same time period
+        :return: list of BookingClash, empty if the booking can be made
+        """
+        clashes = []
+        hold_model = apps.get_model('carshare', 'BookingHold')
+        if (self.overlapping(start, end).filter(vehicle=vehicle).exists() or
+                hold_model.objects.live().overlapping(start, end).filter(vehicle=vehicle).exclude(user=user).exists()):
+            clashes.append(VehicleBookingClash())
+        if self.overlapping(start, end).filter(user=user).exists():
+            clashes.append(UserBookingClash())
+        return clashes
+
+    def check_available(self, user, vehicle, start, end):
+        """
+        Raises VehicleBookingClash or UserBookingClash if a booking for the user and vehicle over [start, end) would
+        overlap an existing booking, or a slot held by another user
+        """
+        clashes = self.clashes(user, vehicle, start, end)
+        if clashes:
+            raise clashes[0]
+
+    def create_if_available(self, user, vehicle, start, end):
+        """
+        Creates a booking, checking for clashes in the same transaction. The slot the user was holding for it is
+        released (see BookingHoldQuerySet.hold), and any other holds are kept.
+        :return: the new booking
+        """
+        def create():
+            self.check_available(user, vehicle, start, end)
+            booking = self.create(user=user, vehicle=vehicle, schedule_start=start, schedule_end=end)
+            apps.get_model('carshare', 'BookingHold').objects.release(user, vehicle, start, end)
+            return booking
+        return run_locked(self.db, user, vehicle, create)
+
+    def with_next_start(self):
+        """
+        Annotates each booking with the start of the next booking of the same vehicle (next_vehicle_start), the next
+        booking of the same user (next_user_start), and the next slot of the vehicle held by another user
+        (next_hold_start). Each is None if there isn't one, and is found with a single lookup on an index.
+        """
+        def first_start(queryset):
+            return Subquery(queryset.order_by('schedule_start').values('schedule_start')[:1],
+                            output_field=models.DateTimeField())
+
+        hold_model = apps.get_model('carshare', 'BookingHold')
+        later = {'schedule_start__gte': OuterRef('schedule_end')}
+        return self.annotate(
+            next_vehicle_start=first_start(self.model.objects.not_cancelled().filter(vehicle=OuterRef('vehicle'),
+                                                                                     **later)),
+            next_user_start=first_start(self.model.objects.not_cancelled().filter(user=OuterRef('user'), **later)),
+            next_hold_start=first_start(hold_model.objects.live().filter(vehicle=OuterRef('vehicle'), **later).exclude(
+                user=OuterRef('user')
+            )),
+        )
+
+    def extend_if_available(self, booking, end):
+        """
+        Moves the end of a booking later, checking it is no later than the latest possible end in the same
+        transaction (see Booking.get_latest_end)
+        :return: the booking
+        """
+        def extend():
+            if end > booking.get_latest_end():
+                raise BookingClash()
+            booking.schedule_end = end
+            booking.save()
+            return booking
+        return run_locked(self.db, booking.user, booking.vehicle, extend)
+
+
+def run_locked(using, user, vehicle, func):
+    """
+    Runs func in a transaction, after locking the user and vehicle rows. Concurrent requests for either are
+    serialized, so at most one of a set of clashing bookings or holds is created.
+    Backends without row locks (SQLite) serialize writes instead, and report a lock conflict to all but one
+    transaction - these are retried, at which point the clash is detected.
+    :return: result of func
+    """
+    for attempt in range(BookingQuerySet.CREATE_ATTEMPTS):
+        try:
+            with transaction.atomic(using=using):
+                # Always lock in the same order (user, then vehicle) to avoid deadlocks
+                User.objects.select_for_update().get(pk=user.pk)
+                type(vehicle).objects.select_for_update().get(pk=vehicle.pk)
+                return func()
+        except OperationalError:
+            if attempt == BookingQuerySet.CREATE_ATTEMPTS - 1:
+                raise
+            # Back off for a short random time so retries don't collide again
+            time.sleep(random.uniform(0, 0.01 * (attempt + 1)))
+
+
+class BookingHoldQuerySet(models.QuerySet):
+    """
+    Booking hold queryset. Holds use the same half-open intervals as bookings.
+    """
+    def live(self):
+        """
+        Holds that have not expired
+        """
+        return self.filter(expires__gt=timezone.now())
+
+    def expired(self):
+        return self.filter(expires__lte=timezone.now())
+
+    def at(self, datetime):
+        return self.filter(schedule_start__lte=datetime, schedule_end__gt=datetime)
+
+    def overlapping(self, start, end):
+        return self.filter(schedule_start__lt=end, schedule_end__gt=start)
+
+    def hold(self, user, vehicle, start, end):
+        """
+        Holds a slot for the user while they review a booking. Slots of the vehicle the user was already holding
+        that overlap it are replaced, e.g. when the times are changed, but holds for other reviews are kept so bookings
+        can be reviewed in several tabs. Beyond BookingHold.MAX_HOLDS the user's oldest holds are released.
+        Raises VehicleBookingClash or UserBookingClash if the slot is unavailable.
+        :return: the new hold
+        """
+        def create():
+            self.filter(user=user, vehicle=vehicle).overlapping(start, end).delete()
+            apps.get_model('carshare', 'Booking').objects.check_available(user, vehicle, start, end)
+            expires = timezone.now() + dt.timedelta(minutes=self.model.HOLD_MINUTES)
+            hold = self.create(user=user, vehicle=vehicle, schedule_start=start, schedule_end=end, expires=expires)
+            oldest = self.filter(user=user).order_by('-expires', '-id').values_list('id', flat=True)[
+                self.model.MAX_HOLDS:]
+            if oldest:
+                self.filter(id__in=list(oldest)).delete()
+            return hold
+        return run_locked(self.db, user, vehicle, create)
+
+    def release(self, user, vehicle, start, end):
+        """
+        Releases the user's holds on the vehicle overlapping [start, end), e.g. once it has been booked
+        """
+        return self.filter(user=user, vehicle=vehicle).overlapping(start, end).delete()
+
+
+class WaitlistEntryQuerySet(models.QuerySet):
+    """
+    Waitlist entry queryset. Windows are half-open intervals like bookings, and are never longer than
+    WaitlistEntry.MAX_LENGTH, so the entries overlapping an interval are a bounded range of the index on
+    (vehicle, schedule_start) or (vehicle_type, schedule_start) rather than every entry that started earlier.
+    """
+    def waiting(self):
+        """
+        Entries that haven't been offered a slot yet, for windows that haven't started
+        """
+        return self.filter(offered__isnull=True, schedule_start__gt=timezone.now())
+
+    def overlapping(self, start, end):
+        return self.filter(schedule_start__gt=start - self.model.MAX_LENGTH, schedule_start__lt=end,
+                           schedule_end__gt=start)
+
+    def for_vehicle(self, vehicle):
+        """
+        Entries waiting for the vehicle, or for any vehicle of its type
+        """
+        return self.filter(Q(vehicle=vehicle) | Q(vehicle_type_id=vehicle.type_id))
+
+
+class JobQuerySet(models.QuerySet):
+    """
+    Background job queryset (see carshare.jobs)
+    """
+    def due(self):
+        """
+        Jobs that are ready to run: pending jobs whose time has come, and running jobs whose worker appears to have
+        died. Oldest first.
+        """
+        now = timezone.now()
+        stalled = now - dt.timedelta(seconds=self.model.TIMEOUT_SECONDS)
+        return self.filter(
+            Q(status=self.model.PENDING, run_after__lte=now) | Q(status=self.model.RUNNING, started__lt=stalled)
+        ).order_by('run_after', 'id')
+
+    def status_of(self, key):
+        """
+        Status of the latest job for key (e.g. 'invoice:12'), or None if there isn't one
+        """
+        return self.filter(key=key).order_by('-id').values_list('status', flat=True).first()
+
+
+class VehicleQuerySet(models.QuerySet):
+    """
+    Vehicle queryset providing availability annotations, so lists of vehicles can be displayed in a constant number
+    of queries
+    """
+    def with_available_now(self):
+        """
+        Annotates each vehicle with available_now, which is True if the vehicle has no active booking and is not held
+        (matches Vehicle.is_available)
+        """
+        booking_model = apps.get_model('carshare', 'Booking')
+        hold_model = apps.get_model('carshare', 'BookingHold')
+        active_bookings = booking_model.objects.active().filter(vehicle=OuterRef('pk'))
+        holds = hold_model.objects.live().at(timezone.now()).filter(vehicle=OuterRef('pk'))
+        # Django can't combine Exists expressions with & yet, so annotate each and combine them with a Case
+        return self.annotate(booked_now=Exists(active_bookings), held_now=Exists(holds)).annotate(
+            available_now=Case(When(booked_now=False, held_now=False, then=Value(True)), default=Value(False),
+                               output_field=models.BooleanField())
+        )
+
+    def within_bounds(self, south, west, north, east):
+        """
+        Vehicles whose pod lies inside the bounding box, looked up through the pod grid index
+        """
+        return self.filter(bounds_filter(south, west, north, east, prefix='pod__'))
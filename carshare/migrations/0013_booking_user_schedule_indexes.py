@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.1 on 2026-10-18 12:25
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+# Partial indexes covering only bookings that have not been cancelled. Django 1.11 can't express these in
+# Meta.indexes, so they are created with raw SQL on backends that support them (PostgreSQL and SQLite).
+PARTIAL_INDEXES = [
+    ('booking_vehicle_active_idx', 'vehicle_id, schedule_start, schedule_end'),
+    ('booking_user_active_idx', 'user_id, schedule_start, schedule_end'),
+]
+PARTIAL_INDEX_VENDORS = ('postgresql', 'sqlite')
+
+
+def create_partial_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor not in PARTIAL_INDEX_VENDORS:
+        return
+    for name, columns in PARTIAL_INDEXES:
+        schema_editor.execute(
+            'CREATE INDEX {0} ON carshare_booking ({1}) WHERE cancelled IS NULL'.format(name, columns)
+        )
+
+
+def drop_partial_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor not in PARTIAL_INDEX_VENDORS:
+        return
+    for name, columns in PARTIAL_INDEXES:
+        schema_editor.execute('DROP INDEX IF EXISTS {0}'.format(name))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('carshare', '0012_booking_vehicle_schedule_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['user', 'schedule_start'], name='booking_user_sched_idx'),
+        ),
+        migrations.RunPython(create_partial_indexes, drop_partial_indexes),
+    ]
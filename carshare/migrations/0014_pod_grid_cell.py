@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.1 on 2026-10-18 12:27
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+from math import floor
+
+
+# Copied from carshare.spatial as it was when this migration was written, so later changes there don't affect it
+GRID_CELL_DEGREES = 0.01
+GRID_COLUMNS = int(round(360 / GRID_CELL_DEGREES))
+GRID_ROWS = int(round(180 / GRID_CELL_DEGREES))
+
+
+def grid_cell(latitude, longitude):
+    row = min(max(int(floor((float(latitude) + 90) / GRID_CELL_DEGREES)), 0), GRID_ROWS - 1)
+    column = min(max(int(floor((float(longitude) + 180) / GRID_CELL_DEGREES)), 0), GRID_COLUMNS - 1)
+    return row * GRID_COLUMNS + column
+
+
+def add_grid_cell_column(apps, schema_editor):
+    """
+    Adds the nullable column directly rather than with AddField, which rebuilds the whole table on SQLite and breaks
+    foreign keys from carshare_vehicle on recent SQLite versions. Unapplying leaves the column in place, as SQLite
+    before 3.35 can't drop columns, so it is only added if missing.
+    """
+    with schema_editor.connection.cursor() as cursor:
+        columns = [c.name for c in schema_editor.connection.introspection.get_table_description(cursor, 'carshare_pod')]
+    if 'grid_cell' not in columns:
+        schema_editor.execute('ALTER TABLE carshare_pod ADD COLUMN grid_cell integer NULL CHECK (grid_cell >= 0)')
+    schema_editor.execute('CREATE INDEX IF NOT EXISTS carshare_pod_grid_cell_idx ON carshare_pod (grid_cell)')
+
+
+def set_grid_cells(apps, schema_editor):
+    Pod = apps.get_model('carshare', 'Pod')
+    for pod in Pod.objects.all():
+        pod.grid_cell = grid_cell(pod.latitude, pod.longitude)
+        pod.save(update_fields=['grid_cell'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('carshare', '0013_booking_user_schedule_indexes'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunPython(add_grid_cell_column, migrations.RunPython.noop),
+            ],
+            state_operations=[
+                migrations.AddField(
+                    model_name='pod',
+                    name='grid_cell',
+                    field=models.PositiveIntegerField(blank=True, db_index=True, editable=False, null=True),
+                ),
+            ],
+        ),
+        migrations.RunPython(set_grid_cells, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.1 on 2026-10-18 15:02
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('carshare', '0014_pod_grid_cell'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SiteStats',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('num_vehicles', models.PositiveIntegerField(default=0)),
+                ('num_pods', models.PositiveIntegerField(default=0)),
+                ('num_bookings', models.PositiveIntegerField(default=0)),
+                ('completed_cost', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('completed_through', models.DateTimeField()),
+            ],
+            options={
+                'verbose_name_plural': 'site stats',
+            },
+        ),
+    ]
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.1 on 2026-10-18 15:48
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+def cost_fields():
+    return [
+        ('cost', models.DecimalField(blank=True, decimal_places=2, editable=False, max_digits=8, null=True)),
+        ('billable_days', models.PositiveIntegerField(blank=True, editable=False, null=True)),
+        ('billable_hours', models.PositiveIntegerField(blank=True, editable=False, null=True)),
+        ('duration', models.DurationField(blank=True, editable=False, null=True)),
+    ]
+
+
+def add_cost_columns(apps, schema_editor):
+    """
+    Adds the nullable columns directly rather than with AddField, which rebuilds the whole table on SQLite and
+    breaks foreign keys from carshare_invoice on recent SQLite versions (see 0014). Existing rows are priced by the
+    backfill_booking_costs command. Unapplying leaves the columns in place, as SQLite before 3.35 can't drop columns,
+    so only missing columns are added.
+    """
+    Booking = apps.get_model('carshare', 'Booking')
+    with schema_editor.connection.cursor() as cursor:
+        columns = [c.name for c in schema_editor.connection.introspection.get_table_description(
+            cursor, Booking._meta.db_table
+        )]
+    for name, field in cost_fields():
+        if name in columns:
+            continue
+        field.set_attributes_from_name(name)
+        definition, params = schema_editor.column_sql(Booking, field)
+        schema_editor.execute('ALTER TABLE {0} ADD COLUMN {1} {2}'.format(
+            schema_editor.quote_name(Booking._meta.db_table), schema_editor.quote_name(field.column), definition
+        ), params)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('carshare', '0015_sitestats'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunPython(add_cost_columns, migrations.RunPython.noop),
+            ],
+            state_operations=[
+                migrations.AddField(model_name='booking', name=name, field=field) for name, field in cost_fields()
+            ],
+        ),
+        # Databases migrated while 0015 still created booking_end_idx have it dropped here, as booking_end_cost_idx
+        # replaces it
+        migrations.RunSQL(['DROP INDEX IF EXISTS booking_end_idx'], migrations.RunSQL.noop),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['schedule_end', 'cost'], name='booking_end_cost_idx'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.1 on 2026-10-18 12:44
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('carshare', '0016_booking_cost'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookingHold',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('schedule_start', models.DateTimeField()),
+                ('schedule_end', models.DateTimeField()),
+                ('expires', models.DateTimeField()),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+                ('vehicle', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='carshare.Vehicle')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='bookinghold',
+            index=models.Index(fields=['vehicle', 'schedule_start', 'schedule_end'], name='hold_vehicle_sched_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bookinghold',
+            index=models.Index(fields=['expires'], name='hold_expires_idx'),
+        ),
+    ]
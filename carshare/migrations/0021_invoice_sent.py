@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.1 on 2026-10-18 13:13
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('carshare', '0020_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='invoice',
+            name='sent',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.1 on 2026-10-18 17:20
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+def discard_site_stats(apps, schema_editor):
+    """
+    Pending costs are now kept as BookingStatsChange rows, so the stats are recounted on next use to create them
+    """
+    SiteStats = apps.get_model('carshare', 'SiteStats')
+    SiteStats.objects.using(schema_editor.connection.alias).all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('carshare', '0021_invoice_sent'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookingStatsChange',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('schedule_end', models.DateTimeField(db_index=True)),
+                ('num_bookings', models.IntegerField(default=0)),
+                ('cost', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+            ],
+        ),
+        migrations.RunPython(discard_site_stats, migrations.RunPython.noop),
+    ]
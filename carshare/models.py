@@ -3,13 +3,15 @@
 #   Description: Defines database models for core functionality
 #
 
-from django.db import models
+from django.db import models, transaction
 from django.utils import timezone
 
+import datetime as dt
 from decimal import Decimal
-from math import ceil
 
 from accounts.models import User
+from .managers import BookingQuerySet, BookingHoldQuerySet, JobQuerySet, VehicleQuerySet, WaitlistEntryQuerySet
+from .pricing import billable_counts, price
 
 
 class VehicleType(models.Model):
@@ -35,6 +37,8 @@ class Pod(models.Model):
     latitude = models.DecimalField(max_digits=10, decimal_places=8)
     longitude = models.DecimalField(max_digits=11, decimal_places=8)
     description = models.CharField(max_length=200)
+    # Spatial index bucket, kept up to date from latitude and longitude (see carshare.spatial and carshare.signals)
+    grid_cell = models.PositiveIntegerField(null=True, blank=True, editable=False, db_index=True)
 
     def coordinates(self):
         return "{0},{1}".format(self.latitude, self.longitude)
@@ -59,6 +63,8 @@ class Vehicle(models.Model):
     active = models.BooleanField(default=True)
     registration = models.CharField(max_length=6, unique=True)
 
+    objects = VehicleQuerySet.as_manager()
+
     def is_active(self):
         return self.active
 
@@ -66,32 +72,33 @@ class Vehicle(models.Model):
         """
         Is the vehicle available for booking right now?
         """
-        current_bookings = self.booking_set.all()
-        active_bookings = [b for b in current_bookings if b.is_active()]
-        if not active_bookings:
-            return True
-        else:
-            return False
+        return not self.booking_set.active().exists() and not self.bookinghold_set.live().at(timezone.now()).exists()
 
     def is_available_at(self, datetime):
         """
-        Checks if the vehicle is available at the time specified
+        Checks if the vehicle is available at the time specified, i.e. it is neither booked nor held then
         :param datetime: when to check
         :return: Boolean
         """
-        for booking in self.booking_set.all():
-            if booking.schedule_start <= datetime < booking.schedule_end and not booking.is_cancelled():
-                return False
-        return True
+        return not self.booking_set.at(datetime).exists() and not self.bookinghold_set.live().at(datetime).exists()
 
     def get_booking_at(self, datetime):
         """
-        Returns the booking for this vehicle at the specified time, or None if it is not booked
+        Returns the booking for this vehicle at the specified time, or None if it is not booked. Held slots aren't
+        bookings, so the vehicle may still be unavailable when this returns None (see is_available_at).
+        """
+        return self.booking_set.at(datetime).first()
+
+    def is_available_between(self, start, end):
+        """
+        Checks if the vehicle is available for the whole of the interval [start, end), i.e. it is neither booked nor
+        held for any of it
+        :return: Boolean
         """
-        for booking in self.booking_set.all():
-            if booking.schedule_start <= datetime < booking.schedule_end and not booking.is_cancelled():
-                return booking
-        return None
+        return (
+            not self.booking_set.overlapping(start, end).exists() and
+            not self.bookinghold_set.live().overlapping(start, end).exists()
+        )
 
     def __str__(self):
         # E.g. 'Jackie - 2014 Toyota Corolla'
@@ -112,22 +119,96 @@ class Booking(models.Model):
     schedule_start = models.DateTimeField(verbose_name='Start time')
     schedule_end = models.DateTimeField(verbose_name='End time')
     cancelled = models.DateTimeField(null=True, blank=True)
+    # Pricing, stored whenever the booking is saved (see carshare.signals)
+    cost = models.DecimalField(max_digits=8, decimal_places=2, null=True, blank=True, editable=False)
+    billable_days = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    billable_hours = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    duration = models.DurationField(null=True, blank=True, editable=False)
+
+    objects = BookingQuerySet.as_manager()
 
     MAX_LENGTH_DAYS = 90
 
+    class Meta:
+        indexes = [
+            # Supports interval lookups for a single vehicle (see BookingQuerySet)
+            models.Index(fields=['vehicle', 'schedule_start', 'schedule_end'], name='booking_vehicle_sched_idx'),
+            # Supports a user's booking lists and overlap checks
+            models.Index(fields=['user', 'schedule_start'], name='booking_user_sched_idx'),
+            # Finds a user's current booking by reading only bookings that haven't ended yet
+            models.Index(fields=['user', 'schedule_end'], name='booking_user_end_idx'),
+            # Finds bookings that have recently ended and totals their cost without reading the table
+            # (see carshare.stats)
+            models.Index(fields=['schedule_end', 'cost'], name='booking_end_cost_idx'),
+        ]
+        # Partial "not cancelled" indexes are created with raw SQL where supported, see migration 0013
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        booking = super(Booking, cls).from_db(db, field_names, values)
+        booking.remember_stats_values()
+        return booking
+
+    def remember_stats_values(self):
+        """
+        Remembers the end and cost the booking was loaded or saved with, so a change to it can be replaced in the
+        site stats without fetching it again (see carshare.signals). Forgotten if either was deferred or the booking
+        hasn't been priced.
+        """
+        self._stats_values = None
+        if 'schedule_end' in self.__dict__ and self.__dict__.get('cost') is not None:
+            self._stats_values = (self.schedule_end, self.cost)
+
+    def save(self, *args, **kwargs):
+        """
+        Saves the booking and records its change to the site stats (see carshare.signals) in one transaction
+        """
+        with transaction.atomic(using=kwargs.get('using'), savepoint=False):
+            super(Booking, self).save(*args, **kwargs)
+
     def calculate_cost(self):
         """
         Calculates total cost of booking, taking into account hourly rate and daily rate of the vehicle.
         As soon as hourly cost reaches the daily rate, the daily rate is used instead.
         E.g. if hourly rate is $10 and daily rate $100, a booking lasting from 10 hours up to 24 hours will cost $100.
+        Use carshare.pricing.price_bookings to price many bookings at once.
+        :return: float
+        """
+        vehicle_type = self.vehicle.type
+        return price(self.schedule_end - self.schedule_start, vehicle_type.hourly_rate, vehicle_type.daily_rate).cost
+
+    def get_cost(self):
+        """
+        Returns the cost stored when the booking was saved, or calculates it if the booking hasn't been priced yet
         :return: float
         """
-        booking_days, booking_hours = self.calculate_daily_hourly_billable_counts()
-        day_cost = booking_days * Decimal(self.vehicle.type.daily_rate)
-        hour_cost = booking_hours * Decimal(self.vehicle.type.hourly_rate)
-        if hour_cost > self.vehicle.type.daily_rate:
-            hour_cost = self.vehicle.type.daily_rate
-        return float(day_cost + hour_cost)
+        if self.cost is None:
+            return self.calculate_cost()
+        return float(self.cost)
+
+    def set_price(self):
+        """
+        Stores the cost, billable days and hours, and duration of the booking. Called before saving.
+        """
+        self.duration = self.schedule_end - self.schedule_start
+        vehicle_type = self.vehicle.type
+        booking_price = price(self.duration, vehicle_type.hourly_rate, vehicle_type.daily_rate)
+        self.cost = Decimal(str(booking_price.cost))
+        self.billable_days = booking_price.days
+        self.billable_hours = booking_price.hours
+
+    def get_latest_end(self):
+        """
+        Latest time the booking can be extended to, which is the start of the next booking of the vehicle or of the
+        user, or of the next slot held by another user, and no more than MAX_LENGTH_DAYS after the booking starts.
+        Found in one query.
+        :return: datetime
+        """
+        next_starts = Booking.objects.filter(pk=self.pk).with_next_start().values_list(
+            'next_vehicle_start', 'next_user_start', 'next_hold_start'
+        ).get()
+        return min([start for start in next_starts if start is not None] +
+                   [self.schedule_start + dt.timedelta(days=self.MAX_LENGTH_DAYS)])
 
     def calculate_daily_hourly_billable_counts(self):
         """
@@ -138,14 +219,9 @@ class Booking(models.Model):
         E.g. if hourly rate is $10 and daily rate $100, a booking lasting 40 hours would be days = 2 hours = 0
         :return: tuple
         """
-        booking_length = self.schedule_end - self.schedule_start
-        booking_length_hours_total = booking_length.days * 24 + booking_length.seconds / 60 / 60
-        booking_days = int(booking_length_hours_total / 24)
-        booking_hours = ceil(booking_length_hours_total % 24)
-        if booking_hours * Decimal(self.vehicle.type.hourly_rate) >= self.vehicle.type.daily_rate:
-            booking_days += 1
-            booking_hours = 0
-        return booking_days, booking_hours
+        vehicle_type = self.vehicle.type
+        return billable_counts(self.schedule_end - self.schedule_start, vehicle_type.hourly_rate,
+                               vehicle_type.daily_rate)
 
     def is_active(self):
         return (
@@ -167,35 +243,86 @@ class Booking(models.Model):
 
     def get_status(self):
         """
-        Returns a string indicating the status
+        Returns a string indicating the status. The time is only read once, and whether the booking has been paid only
+        checked once, so this is cheap when invoices have been fetched with select_related.
         """
         if self.cancelled:
             return "Cancelled"
-        elif self.is_active():
+        now = timezone.now()
+        if self.schedule_start < now < self.schedule_end:
             s = "Active"
-            if self.is_paid():
-                return "{0} - Paid".format(s)
-            else:
-                return "{0} - Unpaid".format(s)
-        elif self.is_complete():
+        elif self.schedule_end < now:
             s = "Complete"
-            if self.is_paid():
-                return "{0} - Paid".format(s)
-            else:
-                return "{0} - Unpaid".format(s)
-        elif self.is_confirmed():
+        elif self.schedule_start > now:
             s = "Confirmed"
-            if self.is_paid():
-                return "{0} - Paid".format(s)
-            else:
-                return "{0} - Unpaid".format(s)
         else:
             return "Unknown - contact staff"
+        if self.is_paid():
+            return "{0} - Paid".format(s)
+        else:
+            return "{0} - Unpaid".format(s)
 
     def __str__(self):
         return "{0} - {1}".format(self.id, self.get_status())
 
 
+class BookingHold(models.Model):
+    """
+    Short-lived reservation of a slot while a user reviews a booking, so nobody else can book it in the meantime.
+    Converted to a Booking when confirmed. Expired holds are ignored, and deleted by the expire_booking_holds command.
+    """
+    user = models.ForeignKey(User)
+    vehicle = models.ForeignKey(Vehicle)
+    schedule_start = models.DateTimeField()
+    schedule_end = models.DateTimeField()
+    expires = models.DateTimeField()
+
+    objects = BookingHoldQuerySet.as_manager()
+
+    HOLD_MINUTES = 10
+    # Most slots a user can hold at once, one for each booking they are reviewing
+    MAX_HOLDS = 5
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['vehicle', 'schedule_start', 'schedule_end'], name='hold_vehicle_sched_idx'),
+            models.Index(fields=['expires'], name='hold_expires_idx'),
+        ]
+
+    def __str__(self):
+        return '{0} - {1} until {2}'.format(self.id, self.vehicle, self.expires)
+
+
+class WaitlistEntry(models.Model):
+    """
+    User waiting for a vehicle, or any vehicle of a type, to become free for a window of time. When a cancellation
+    frees the window the user is offered it by email (see carshare.waitlist).
+    """
+    user = models.ForeignKey(User)
+    vehicle = models.ForeignKey(Vehicle, null=True, blank=True)
+    vehicle_type = models.ForeignKey(VehicleType, null=True, blank=True)
+    schedule_start = models.DateTimeField()
+    schedule_end = models.DateTimeField()
+    created = models.DateTimeField(default=timezone.now)
+    offered = models.DateTimeField(null=True, blank=True)
+
+    objects = WaitlistEntryQuerySet.as_manager()
+
+    # Longest window, which bounds the range of the index searched for overlapping entries. Windows are limited to
+    # the longest booking, which BookingForm lets run up to a day over MAX_LENGTH_DAYS.
+    MAX_LENGTH = dt.timedelta(days=Booking.MAX_LENGTH_DAYS + 1)
+
+    class Meta:
+        verbose_name_plural = 'waitlist entries'
+        indexes = [
+            models.Index(fields=['vehicle', 'schedule_start'], name='waitlist_vehicle_start_idx'),
+            models.Index(fields=['vehicle_type', 'schedule_start'], name='waitlist_type_start_idx'),
+        ]
+
+    def __str__(self):
+        return '{0} - {1} from {2}'.format(self.id, self.vehicle or self.vehicle_type, self.schedule_start)
+
+
 class Invoice(models.Model):
     """
     Invoice for a single booking
@@ -203,6 +330,87 @@ class Invoice(models.Model):
     booking = models.OneToOneField(Booking, related_name='invoice')
     date = models.DateField(default=timezone.now)
     amount = models.DecimalField(max_digits=7, decimal_places=2)
+    # When the invoice was emailed, so it is only emailed once however many times its job runs
+    sent = models.DateTimeField(null=True, blank=True)
 
     def __str__(self):
         return '{0} - Booking {1}'.format(self.id, self.booking.id)
+
+
+class SiteStats(models.Model):
+    """
+    Running totals shown on the About Us page, kept in a single row. Pod and vehicle counts are updated by signal
+    handlers as they are created and deleted; bookings are added from BookingStatsChange once they end
+    (see carshare.stats).
+    """
+    num_vehicles = models.PositiveIntegerField(default=0)
+    num_pods = models.PositiveIntegerField(default=0)
+    num_bookings = models.PositiveIntegerField(default=0)
+    # Total cost of bookings that ended before completed_through
+    completed_cost = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    completed_through = models.DateTimeField()
+
+    SINGLETON_ID = 1
+
+    class Meta:
+        verbose_name_plural = 'site stats'
+
+    def __str__(self):
+        return 'Site stats as of {0}'.format(self.completed_through)
+
+
+class BookingStatsChange(models.Model):
+    """
+    Change to the site stats from a booking being created, changed or deleted. Appended in the booking's transaction
+    instead of updating SiteStats, so bookings never wait on each other for the stats row. Added to SiteStats and
+    deleted once the booking has ended (see carshare.stats).
+    """
+    schedule_end = models.DateTimeField(db_index=True)
+    num_bookings = models.IntegerField(default=0)
+    cost = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+
+    def __str__(self):
+        return '{0} - {1:+d} bookings, {2:+} ending {3}'.format(self.id, self.num_bookings, self.cost,
+                                                                self.schedule_end)
+
+
+class Job(models.Model):
+    """
+    Task run in the background by the run_jobs command, so slow work such as rendering invoices doesn't hold up
+    requests. The task is the dotted path of a function, called with the JSON encoded kwargs (see carshare.jobs).
+    """
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUSES = (
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    )
+
+    task = models.CharField(max_length=100)
+    kwargs = models.TextField(default='{}')
+    # What the job is for, e.g. 'invoice:12', so its status can be looked up
+    key = models.CharField(max_length=100, db_index=True)
+    status = models.CharField(max_length=10, choices=STATUSES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    run_after = models.DateTimeField(default=timezone.now)
+    started = models.DateTimeField(null=True, blank=True)
+    finished = models.DateTimeField(null=True, blank=True)
+    error = models.TextField(blank=True)
+
+    objects = JobQuerySet.as_manager()
+
+    MAX_ATTEMPTS = 3
+    # Running jobs that haven't finished after this long are assumed to have lost their worker, and are run again
+    TIMEOUT_SECONDS = 10 * 60
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='job_status_run_after_idx'),
+        ]
+
+    def __str__(self):
+        return '{0} - {1} ({2})'.format(self.id, self.task, self.status)
@@ -0,0 +1,79 @@
+#
+#   Author(s): Huon Imberger
+#   Description: Keyset (cursor) pagination of bookings, so each page costs the same however far into a user's
+#                history it is
+#
+
+from django.db.models import Q
+from django.utils import timezone
+
+from collections import namedtuple
+import datetime as dt
+
+
+BookingPage = namedtuple('BookingPage', ['bookings', 'next_cursor'])
+
+PAGE_SIZE = 20
+
+EPOCH = dt.datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+class InvalidCursor(Exception):
+    """
+    Raised when a cursor can't be decoded
+    """
+    pass
+
+
+def encode_cursor(booking):
+    """
+    Cursor pointing just past a booking, made from its position in (schedule_start, id) order
+    :return: string
+    """
+    return '{0}.{1}'.format((booking.schedule_start - EPOCH) // dt.timedelta(microseconds=1), booking.id)
+
+
+def decode_cursor(cursor):
+    """
+    :raises InvalidCursor: if the cursor is malformed
+    :return: (schedule_start, id)
+    """
+    try:
+        microseconds, booking_id = cursor.split('.')
+        return EPOCH + dt.timedelta(microseconds=int(microseconds)), int(booking_id)
+    except (AttributeError, ValueError, OverflowError):
+        raise InvalidCursor()
+
+
+def after_cursor(bookings, cursor):
+    """
+    Filters bookings to those following the cursor. Rather than skipping over earlier pages with an OFFSET, the
+    cursor is turned into a range condition on (schedule_start, id), so the database reads only the rows it returns.
+    :param bookings: queryset ordered by schedule_start and id, both ascending or both descending (see
+                     BookingQuerySet.upcoming and BookingQuerySet.past)
+    :raises InvalidCursor: if the cursor is malformed
+    """
+    schedule_start, booking_id = decode_cursor(cursor)
+    if bookings.query.order_by[0].startswith('-'):
+        # The redundant bound on schedule_start lets the database range scan the index
+        return bookings.filter(Q(schedule_start__lt=schedule_start) | Q(id__lt=booking_id),
+                               schedule_start__lte=schedule_start)
+    return bookings.filter(Q(schedule_start__gt=schedule_start) | Q(id__gt=booking_id),
+                           schedule_start__gte=schedule_start)
+
+
+def get_page(bookings, cursor=None, size=PAGE_SIZE):
+    """
+    Gets the page of bookings following the cursor, in one query
+    :param bookings: queryset ordered by schedule_start and id (see after_cursor)
+    :param cursor: next_cursor from the previous page, or None for the first page
+    :raises InvalidCursor: if the cursor is malformed
+    :return: BookingPage, with next_cursor None on the last page
+    """
+    if cursor is not None:
+        bookings = after_cursor(bookings, cursor)
+    # Fetch one extra booking to find out if there is another page
+    page = list(bookings[:size + 1])
+    if len(page) > size:
+        return BookingPage(page[:size], encode_cursor(page[size - 1]))
+    return BookingPage(page, None)
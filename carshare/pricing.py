@@ -0,0 +1,154 @@
+#
+#   Author(s): Huon Imberger
+#   Description: Booking pricing rules, shared by Booking.calculate_cost and the batch pricing of querysets
+#
+
+from django.db.models import Count, DurationField, ExpressionWrapper, F, Sum
+
+from collections import namedtuple
+from functools import lru_cache
+from decimal import Decimal
+from math import ceil
+
+
+BookingPrice = namedtuple('BookingPrice', ['days', 'hours', 'cost'])
+
+
+def length_in_hours(length):
+    """
+    Splits a booking length into whole days, and the remaining hours rounded up (0 to 24)
+    :param length: timedelta
+    :return: tuple
+    """
+    booking_length_hours_total = length.days * 24 + length.seconds / 60 / 60
+    return int(booking_length_hours_total / 24), ceil(booking_length_hours_total % 24)
+
+
+def calculate_price(booking_days, booking_hours, hourly_rate, daily_rate):
+    """
+    Applies the billing rule to a number of days and hours. As soon as hourly cost reaches the daily rate, the daily
+    rate is used instead.
+    E.g. if hourly rate is $10 and daily rate $100, a booking lasting 5 hours would be days = 0 hours = 5
+    E.g. if hourly rate is $10 and daily rate $100, a booking lasting 13 hours would be days = 1 hours = 0
+    E.g. if hourly rate is $10 and daily rate $100, a booking lasting 26 hours would be days = 1 hours = 2
+    E.g. if hourly rate is $10 and daily rate $100, a booking lasting 40 hours would be days = 2 hours = 0
+    :return: BookingPrice, with cost as a float
+    """
+    if booking_hours * Decimal(hourly_rate) >= daily_rate:
+        booking_days += 1
+        booking_hours = 0
+    day_cost = booking_days * Decimal(daily_rate)
+    hour_cost = booking_hours * Decimal(hourly_rate)
+    if hour_cost > daily_rate:
+        hour_cost = daily_rate
+    return BookingPrice(booking_days, booking_hours, float(day_cost + hour_cost))
+
+
+@lru_cache(maxsize=64)
+def get_tariff(hourly_rate, daily_rate):
+    """
+    Precomputes the price of every whole number of hours up to the longest possible booking, for one pair of rates.
+    Tables are cached by rates, so changing a vehicle type's rates builds a new table on next use.
+    :return: tuple of BookingPrice, indexed by hours
+    """
+    from .models import Booking
+    return tuple(
+        calculate_price(hours // 24, hours % 24, hourly_rate, daily_rate)
+        for hours in range(Booking.MAX_LENGTH_DAYS * 24 + 1)
+    )
+
+
+def price(length, hourly_rate, daily_rate):
+    """
+    Calculates total cost of a booking, taking into account hourly rate and daily rate of the vehicle.
+    E.g. if hourly rate is $10 and daily rate $100, a booking lasting from 10 hours up to 24 hours will cost $100.
+    Prices are looked up in the tariff for the rates.
+    :param length: timedelta
+    :return: BookingPrice, with cost as a float
+    """
+    # Rates may not have been converted from strings yet on a model instance that hasn't been reloaded
+    hourly_rate, daily_rate = Decimal(hourly_rate), Decimal(daily_rate)
+    booking_days, booking_hours = length_in_hours(length)
+    tariff = get_tariff(hourly_rate, daily_rate)
+    index = booking_days * 24 + booking_hours
+    # A part hour at the end of a day rounds up to 24 hours, which isn't always priced the same as a whole day
+    if booking_hours < 24 and index < len(tariff):
+        return tariff[index]
+    return calculate_price(booking_days, booking_hours, hourly_rate, daily_rate)
+
+
+def billable_counts(length, hourly_rate, daily_rate):
+    """
+    Calculates the number of days and hours as they are billable
+    :param length: timedelta
+    :return: tuple
+    """
+    booking_price = price(length, hourly_rate, daily_rate)
+    return booking_price.days, booking_price.hours
+
+
+def with_length(bookings):
+    """
+    Annotates bookings with their length, calculated by the database
+    """
+    return bookings.annotate(
+        length=ExpressionWrapper(F('schedule_end') - F('schedule_start'), output_field=DurationField())
+    )
+
+
+def get_rates(vehicle_type_ids=None):
+    """
+    :return: dict of vehicle type id to (hourly rate, daily rate)
+    """
+    from .models import VehicleType
+    vehicle_types = VehicleType.objects.all()
+    if vehicle_type_ids is not None:
+        vehicle_types = vehicle_types.filter(id__in=vehicle_type_ids)
+    return {
+        vehicle_type_id: (hourly_rate, daily_rate)
+        for vehicle_type_id, hourly_rate, daily_rate in vehicle_types.values_list('id', 'hourly_rate', 'daily_rate')
+    }
+
+
+def price_bookings(bookings):
+    """
+    Prices every booking in a queryset. Only booking lengths (calculated by the database) and vehicle types are
+    fetched, and as most bookings share a length and vehicle type, each distinct combination is only priced once.
+    Results are identical to Booking.calculate_cost and Booking.calculate_daily_hourly_billable_counts.
+    :param bookings: queryset of bookings
+    :return: dict of booking id to BookingPrice
+    """
+    rates = get_rates()
+    rows = with_length(bookings).values_list('id', 'length', 'vehicle__type_id').order_by()
+    prices = {}
+    result = {}
+    for booking_id, length, vehicle_type_id in rows.iterator():
+        key = (length, vehicle_type_id)
+        booking_price = prices.get(key)
+        if booking_price is None:
+            booking_price = prices[key] = price(length, *rates[vehicle_type_id])
+        result[booking_id] = booking_price
+    return result
+
+
+def total_cost(bookings):
+    """
+    Totals the cost of every booking in a queryset, for reports. Stored costs are summed by the database. Bookings
+    that haven't been priced yet are grouped by length and vehicle type, so only one row per distinct combination
+    is fetched.
+    :param bookings: queryset of bookings
+    :return: Decimal
+    """
+    total = bookings.aggregate(total=Sum('cost'))['total'] or Decimal(0)
+    groups = list(
+        with_length(bookings.filter(cost__isnull=True)).values('length', 'vehicle__type_id').annotate(
+            count=Count('id')
+        ).order_by()
+    )
+    if groups:
+        rates = get_rates({group['vehicle__type_id'] for group in groups})
+        for group in groups:
+            cost = price(group['length'], *rates[group['vehicle__type_id']]).cost
+            # Costs are whole cents, so convert through str to avoid binary float error
+            total += Decimal(str(cost)) * group['count']
+    return total
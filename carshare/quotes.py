@@ -0,0 +1,100 @@
+#
+#   Author(s): Huon Imberger
+#   Description: Cache of booking quotes, so repeated cost calculations for the same vehicle and booking length don't
+#                touch the database. Kept in the 'quotes' cache (see CACHES in settings), which all workers share when
+#                it is a shared backend such as memcached.
+#
+
+from django.core.cache import caches
+
+import time
+
+from .pricing import length_in_hours, price
+
+
+RATES_VERSION_KEY = 'carshare:quotes:rates_version'
+
+
+class QuoteCache(object):
+    """
+    Quotes keyed by the rates and billable duration they were priced at, so a quote can never be used once its rates
+    have changed, along with the vehicle type and rates of each vehicle quoted.
+    Vehicle entries are stored under a version that is bumped when any vehicle type is saved, and dropped when their
+    vehicle is saved. Both are done in the cache itself, so other workers see the change on their next lookup.
+    The cache backend evicts entries when full, and expires them after its TIMEOUT.
+    """
+    def __init__(self, alias='quotes'):
+        self.alias = alias
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def get_rates_version(self):
+        # Starting from the time means a version evicted from the cache is never reused
+        return self.cache.get_or_set(RATES_VERSION_KEY, lambda: int(time.time() * 1000), timeout=None)
+
+    def vehicle_key(self, vehicle_id):
+        return 'carshare:quotes:vehicle:{0}'.format(vehicle_id)
+
+    def quote_key(self, hourly_rate, daily_rate, length):
+        return 'carshare:quotes:quote:{0}:{1}:{2}:{3}'.format(hourly_rate, daily_rate, *length_in_hours(length))
+
+    def get_vehicle_rates(self, vehicle_id):
+        """
+        :return: (vehicle type id, hourly rate, daily rate), or None if not cached
+        """
+        return self.cache.get(self.vehicle_key(vehicle_id), version=self.get_rates_version())
+
+    def set_vehicle_rates(self, vehicle_id, vehicle_type_id, hourly_rate, daily_rate):
+        self.cache.set(self.vehicle_key(vehicle_id), (vehicle_type_id, hourly_rate, daily_rate),
+                       version=self.get_rates_version())
+
+    def get_quote(self, hourly_rate, daily_rate, length):
+        """
+        :return: BookingPrice, or None if not cached
+        """
+        return self.cache.get(self.quote_key(hourly_rate, daily_rate, length))
+
+    def set_quote(self, hourly_rate, daily_rate, length, booking_price):
+        self.cache.set(self.quote_key(hourly_rate, daily_rate, length), booking_price)
+
+    def invalidate_vehicle(self, vehicle_id):
+        self.cache.delete(self.vehicle_key(vehicle_id), version=self.get_rates_version())
+
+    def invalidate_rates(self):
+        """
+        Drops the rates of every vehicle, e.g. when a vehicle type's rates change. Quotes at the old rates are left to
+        expire, as they are no longer looked up.
+        """
+        try:
+            self.cache.incr(RATES_VERSION_KEY)
+        except ValueError:
+            # Already evicted, so the next lookup starts a new version
+            pass
+
+    def clear(self):
+        self.cache.clear()
+
+
+quote_cache = QuoteCache()
+
+
+def get_quote(vehicle_id, start, end):
+    """
+    Prices a booking of a vehicle over [start, end), from the cache where possible
+    :raises Vehicle.DoesNotExist: if there is no such vehicle
+    :return: BookingPrice
+    """
+    length = end - start
+    rates = quote_cache.get_vehicle_rates(vehicle_id)
+    if rates is None:
+        from .models import Vehicle
+        rates = Vehicle.objects.values_list('type_id', 'type__hourly_rate', 'type__daily_rate').get(pk=vehicle_id)
+        quote_cache.set_vehicle_rates(vehicle_id, *rates)
+    vehicle_type_id, hourly_rate, daily_rate = rates
+    booking_price = quote_cache.get_quote(hourly_rate, daily_rate, length)
+    if booking_price is None:
+        booking_price = price(length, hourly_rate, daily_rate)
+        quote_cache.set_quote(hourly_rate, daily_rate, length, booking_price)
+    return booking_price
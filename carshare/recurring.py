@@ -0,0 +1,118 @@
+#
+#   Author(s): Huon Imberger
+#   Description: Recurring bookings, e.g. every Monday from 08:00 to 17:00 for 12 weeks. Every occurrence is checked
+#                for clashes in one sweep over the bookings of the vehicle and user, and the free ones are created
+#                together in one transaction.
+#
+
+from django.db.models import Q
+from django.utils import timezone
+
+import datetime as dt
+
+from .managers import run_locked, UserBookingClash, VehicleBookingClash
+from .models import Booking, BookingHold
+from . import stats
+
+
+# Most weeks a single recurring booking can be repeated for
+MAX_WEEKS = 52
+
+
+def weekly_intervals(start, end, weeks):
+    """
+    Repeats [start, end) every week. Occurrences keep the same local wall clock times across daylight saving changes.
+    :param weeks: number of occurrences, including the first
+    :return: list of (start, end), sorted by start
+    """
+    tz = timezone.get_current_timezone()
+    local_start = timezone.make_naive(start, tz)
+    local_end = timezone.make_naive(end, tz)
+    intervals = []
+    for week in range(weeks):
+        offset = dt.timedelta(weeks=week)
+        intervals.append((
+            timezone.make_aware(local_start + offset, tz, is_dst=False),
+            timezone.make_aware(local_end + offset, tz, is_dst=False),
+        ))
+    return intervals
+
+
+def sweep_overlaps(intervals, conflicts):
+    """
+    Finds the conflicts overlapping each of a set of intervals, in a single pass over the intervals and conflicts
+    sorted by start. Intervals may overlap, or sit inside, each other.
+    :param intervals: list of (start, end), sorted by start
+    :param conflicts: objects with schedule_start and schedule_end (e.g. bookings and holds), in any order
+    :return: list of lists of conflicts, one for each interval
+    """
+    conflicts = sorted(conflicts, key=lambda c: c.schedule_start)
+    overlaps = []
+    active = []
+    i = 0
+    for start, end in intervals:
+        # Conflicts starting before the interval ends might overlap it...
+        while i < len(conflicts) and conflicts[i].schedule_start < end:
+            active.append(conflicts[i])
+            i += 1
+        # ...unless they end before it starts, in which case they end before every later interval starts too
+        active = [c for c in active if c.schedule_end > start]
+        # Conflicts added for an earlier, longer interval may start after this one ends
+        overlaps.append([c for c in active if c.schedule_start < end])
+    return overlaps
+
+
+def sweep_clashes(user, vehicle, intervals, conflicts):
+    """
+    Finds the clash, if any, for each of a set of intervals (see sweep_overlaps)
+    :param intervals: list of (start, end), sorted by start and not overlapping each other
+    :param conflicts: bookings of the vehicle or user, and slots of the vehicle held by other users, in any order
+    :return: list of VehicleBookingClash, UserBookingClash or None, one for each interval
+    """
+    clashes = []
+    for active in sweep_overlaps(intervals, conflicts):
+        if any(c.vehicle_id == vehicle.id for c in active):
+            clashes.append(VehicleBookingClash())
+        elif any(c.user_id == user.id for c in active):
+            clashes.append(UserBookingClash())
+        else:
+            clashes.append(None)
+    return clashes
+
+
+def find_clashes(user, vehicle, intervals):
+    """
+    Checks every interval for clashes, with one query for bookings and one for holds however many intervals there are
+    :param intervals: list of (start, end), sorted by start and not overlapping each other
+    :return: list of VehicleBookingClash, UserBookingClash or None, one for each interval
+    """
+    if not intervals:
+        return []
+    first, last = intervals[0][0], intervals[-1][1]
+    fields = ('user_id', 'vehicle_id', 'schedule_start', 'schedule_end')
+    bookings = Booking.objects.overlapping(first, last).filter(Q(vehicle=vehicle) | Q(user=user)).only(*fields)
+    holds = BookingHold.objects.live().overlapping(first, last).filter(vehicle=vehicle).exclude(user=user).only(*fields)
+    return sweep_clashes(user, vehicle, intervals, list(bookings) + list(holds))
+
+
+def create_recurring_bookings(user, vehicle, intervals):
+    """
+    Creates a booking for every interval that is free, all in one transaction. Intervals that clash are skipped.
+    :param intervals: list of (start, end), sorted by start and not overlapping each other
+    :return: (list of new bookings, list of (start, end, clash) skipped)
+    """
+    def create():
+        bookings = []
+        skipped = []
+        for (start, end), clash in zip(intervals, find_clashes(user, vehicle, intervals)):
+            if clash is None:
+                booking = Booking(user=user, vehicle=vehicle, schedule_start=start, schedule_end=end)
+                # bulk_create doesn't send pre_save or post_save, so do what their receivers would have done
+                booking.set_price()
+                bookings.append(booking)
+            else:
+                skipped.append((start, end, clash))
+        Booking.objects.bulk_create(bookings)
+        stats.record_booking_changes([stats.booking_change(booking) for booking in bookings])
+        return bookings, skipped
+    return run_locked(Booking.objects.db, user, vehicle, create)
@@ -0,0 +1,121 @@
+#
+#   Author(s): Huon Imberger
+#   Description: Signal handlers keeping derived carshare data up to date
+#
+
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from .models import Booking, Pod, Vehicle, VehicleType
+from .quotes import quote_cache
+from .spatial import grid_cell, invalidate_pod_index
+from . import stats
+
+
+@receiver(pre_save, sender=Pod)
+def update_pod_grid_cell(sender, instance, **kwargs):
+    """
+    Keeps the pod's spatial index bucket in step with its coordinates. Also runs when loading fixtures.
+    """
+    instance.grid_cell = grid_cell(instance.latitude, instance.longitude)
+
+
+@receiver(pre_save, sender=Booking)
+def update_booking_price(sender, instance, raw, **kwargs):
+    """
+    Stores the booking's cost, so it only needs calculating when the booking changes (e.g. when extended)
+    """
+    if not raw:
+        instance.set_price()
+
+
+@receiver(post_save, sender=Pod)
+@receiver(post_delete, sender=Pod)
+@receiver(post_save, sender=Vehicle)
+@receiver(post_delete, sender=Vehicle)
+def pod_or_vehicle_changed(sender, **kwargs):
+    """
+    Discards the nearest vehicle index when a pod or vehicle changes
+    """
+    invalidate_pod_index()
+
+
+@receiver(post_save, sender=Pod)
+@receiver(post_save, sender=Vehicle)
+def count_created(sender, instance, created, raw, **kwargs):
+    """
+    Counts new pods and vehicles in the site stats. Loading fixtures discards the stats instead (see the loaddata
+    command).
+    """
+    if created and not raw:
+        stats.update_site_stats(**{'num_pods' if sender is Pod else 'num_vehicles': 1})
+
+
+@receiver(post_delete, sender=Pod)
+@receiver(post_delete, sender=Vehicle)
+def count_deleted(sender, instance, **kwargs):
+    """
+    Removes deleted pods and vehicles from the site stats
+    """
+    stats.update_site_stats(**{'num_pods' if sender is Pod else 'num_vehicles': -1})
+
+
+@receiver(pre_save, sender=Booking)
+def remember_previous_booking(sender, instance, raw, **kwargs):
+    """
+    Remembers the end and cost of the booking before it is changed (e.g. extended or cancelled), to replace it in the
+    site stats. Bookings loaded with both fields remember them already, so this usually needs no query.
+    """
+    if raw:
+        # Related objects may not be loaded yet when loading fixtures, so the loaddata command discards the stats to
+        # be recounted on next use instead
+        return
+    if instance.pk is not None and getattr(instance, '_stats_values', None) is None:
+        previous = Booking.objects.filter(pk=instance.pk).select_related('vehicle__type').first()
+        if previous is not None:
+            instance._stats_values = (previous.schedule_end, stats.booking_cost(previous))
+
+
+@receiver(post_save, sender=Booking)
+def update_booking_stats(sender, instance, created, raw, **kwargs):
+    """
+    Records new bookings, and changes to the end or cost of existing ones, for the site stats
+    """
+    if raw:
+        return
+    previous = None if created else getattr(instance, '_stats_values', None)
+    instance.remember_stats_values()
+    if created:
+        stats.record_booking_changes([stats.booking_change(instance)])
+    elif previous != instance._stats_values:
+        changes = [stats.booking_change(instance, counted=False)]
+        if previous is not None:
+            schedule_end, cost = previous
+            changes.append((schedule_end, 0, -cost))
+        stats.record_booking_changes(changes)
+
+
+@receiver(post_delete, sender=Booking)
+def count_deleted_booking(sender, instance, **kwargs):
+    """
+    Removes deleted bookings from the site stats
+    """
+    stats.record_booking_changes([stats.booking_change(instance, sign=-1)])
+
+
+@receiver(post_save, sender=Vehicle)
+@receiver(post_delete, sender=Vehicle)
+def forget_vehicle_rates(sender, instance, **kwargs):
+    """
+    Drops the vehicle's cached rates, as its type may have changed
+    """
+    quote_cache.invalidate_vehicle(instance.pk)
+
+
+@receiver(post_save, sender=VehicleType)
+@receiver(post_delete, sender=VehicleType)
+def forget_vehicle_type_rates(sender, instance, **kwargs):
+    """
+    Drops every vehicle's cached rates when a vehicle type's rates change
+    """
+    quote_cache.invalidate_rates()
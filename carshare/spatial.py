@@ -0,0 +1,214 @@
+#
+#   Author(s): Huon Imberger
+#   Description: Spatial indexing of pods. Pods are bucketed into a fixed grid of latitude/longitude cells, so that
+#                bounding box lookups become a handful of indexed integer range queries. Nearest neighbour searches
+#                use an in-memory k-d tree over the pods of active vehicles.
+#
+
+from django.db.models import Q
+
+from heapq import heappush, heappop
+from itertools import count
+from math import floor, radians, sin, cos, asin, sqrt
+import threading
+import time
+
+
+# Size of a grid cell in degrees (roughly 1km at Melbourne's latitude)
+GRID_CELL_DEGREES = 0.01
+GRID_COLUMNS = int(round(360 / GRID_CELL_DEGREES))
+GRID_ROWS = int(round(180 / GRID_CELL_DEGREES))
+
+# Above this many rows of cells, a bounding box is looked up as a single range of cells instead of one per row
+MAX_ROW_RANGES = 20
+
+
+def grid_row(latitude):
+    return min(max(int(floor((float(latitude) + 90) / GRID_CELL_DEGREES)), 0), GRID_ROWS - 1)
+
+
+def grid_column(longitude):
+    return min(max(int(floor((float(longitude) + 180) / GRID_CELL_DEGREES)), 0), GRID_COLUMNS - 1)
+
+
+def grid_cell(latitude, longitude):
+    """
+    Returns the grid cell number containing the given coordinates
+    """
+    return grid_row(latitude) * GRID_COLUMNS + grid_column(longitude)
+
+
+def grid_cell_ranges(south, west, north, east):
+    """
+    Returns the ranges of grid cells (inclusive) that cover a bounding box. Cells are numbered row by row, so each
+    row of the box is one contiguous range.
+    :return: list of (first, last) tuples
+    """
+    first_row, last_row = grid_row(south), grid_row(north)
+    first_column, last_column = grid_column(west), grid_column(east)
+    if last_row - first_row + 1 > MAX_ROW_RANGES:
+        # Large boxes would need too many ranges, so cover the whole band of rows instead
+        return [(first_row * GRID_COLUMNS + first_column, last_row * GRID_COLUMNS + last_column)]
+    return [
+        (row * GRID_COLUMNS + first_column, row * GRID_COLUMNS + last_column)
+        for row in range(first_row, last_row + 1)
+    ]
+
+
+def bounds_filter(south, west, north, east, prefix=''):
+    """
+    Builds a filter matching pods inside a bounding box, using the grid to narrow the search.
+    Boxes crossing the antimeridian (west > east) are supported.
+    :param prefix: lookup prefix when filtering a related model, e.g. 'pod__'
+    :return: Q object
+    """
+    if west > east:
+        return bounds_filter(south, west, north, 180, prefix) | bounds_filter(south, -180, north, east, prefix)
+    cells = Q()
+    for first, last in grid_cell_ranges(south, west, north, east):
+        cells |= Q(**{prefix + 'grid_cell__range': (first, last)})
+    return cells & Q(**{
+        prefix + 'latitude__range': (south, north),
+        prefix + 'longitude__range': (west, east),
+    })
+
+
+# Mean radius of the Earth in kilometres
+EARTH_RADIUS_KM = 6371.0088
+
+
+def to_unit_vector(latitude, longitude):
+    """
+    Converts coordinates to a point on the unit sphere. Straight line (chord) distance between these points increases
+    with great circle distance, so nearest neighbours can be found with plain euclidean geometry.
+    """
+    latitude, longitude = radians(float(latitude)), radians(float(longitude))
+    return cos(latitude) * cos(longitude), cos(latitude) * sin(longitude), sin(latitude)
+
+
+def chord_to_km(squared_chord):
+    """
+    Converts a squared chord length between two unit vectors to great circle distance in kilometres
+    """
+    return 2 * EARTH_RADIUS_KM * asin(min(1.0, sqrt(squared_chord) / 2))
+
+
+def haversine_km(latitude1, longitude1, latitude2, longitude2):
+    """
+    Great circle distance between two points in kilometres
+    """
+    phi1, phi2 = radians(float(latitude1)), radians(float(latitude2))
+    delta_phi = phi2 - phi1
+    delta_lambda = radians(float(longitude2) - float(longitude1))
+    a = sin(delta_phi / 2) ** 2 + cos(phi1) * cos(phi2) * sin(delta_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * asin(min(1.0, sqrt(a)))
+
+
+class KDTree(object):
+    """
+    Static k-d tree over points on the unit sphere, supporting incremental nearest neighbour search
+    """
+    # Maximum number of points stored in a leaf
+    LEAF_SIZE = 8
+
+    def __init__(self, points, values):
+        """
+        :param points: list of (x, y, z) tuples
+        :param values: value associated with each point, returned by searches
+        """
+        self.points = points
+        self.values = values
+        self.root = self._build(list(range(len(points))), 0) if points else None
+
+    def _build(self, indexes, depth):
+        if len(indexes) <= self.LEAF_SIZE:
+            return indexes
+        axis = depth % 3
+        indexes.sort(key=lambda i: self.points[i][axis])
+        middle = len(indexes) // 2
+        split = self.points[indexes[middle]][axis]
+        return axis, split, self._build(indexes[:middle], depth + 1), self._build(indexes[middle:], depth + 1)
+
+    def nearest(self, point):
+        """
+        Yields (squared distance, value) for every point in the tree, nearest first. Nodes are expanded lazily, so
+        taking the first few results only visits a small part of the tree.
+        """
+        if self.root is None:
+            return
+        tiebreak = count()
+        # Heap of (lower bound on squared distance, tiebreak, is_point, node or point index)
+        heap = [(0.0, next(tiebreak), False, self.root)]
+        while heap:
+            bound, _, is_point, item = heappop(heap)
+            if is_point:
+                yield bound, self.values[item]
+            elif isinstance(item, list):
+                for i in item:
+                    other = self.points[i]
+                    distance = (point[0] - other[0]) ** 2 + (point[1] - other[1]) ** 2 + (point[2] - other[2]) ** 2
+                    heappush(heap, (distance, next(tiebreak), True, i))
+            else:
+                axis, split, left, right = item
+                offset = point[axis] - split
+                near, far = (left, right) if offset < 0 else (right, left)
+                heappush(heap, (bound, next(tiebreak), False, near))
+                heappush(heap, (max(bound, offset * offset), next(tiebreak), False, far))
+
+
+class PodIndex(object):
+    """
+    Nearest neighbour index over the pods of active vehicles
+    """
+    def __init__(self, vehicle_pods):
+        """
+        :param vehicle_pods: iterable of (vehicle id, latitude, longitude)
+        """
+        vehicle_pods = list(vehicle_pods)
+        self.tree = KDTree(
+            [to_unit_vector(latitude, longitude) for vehicle_id, latitude, longitude in vehicle_pods],
+            [vehicle_id for vehicle_id, latitude, longitude in vehicle_pods],
+        )
+        self.built = time.time()
+
+    def __len__(self):
+        return len(self.tree.points)
+
+    def nearest(self, latitude, longitude):
+        """
+        Yields (vehicle id, distance in km) for every indexed vehicle, nearest first
+        """
+        for squared_chord, vehicle_id in self.tree.nearest(to_unit_vector(latitude, longitude)):
+            yield vehicle_id, chord_to_km(squared_chord)
+
+
+# Each process keeps its own index. Signals discard it when pods or vehicles change in this process, and it is also
+# rebuilt after POD_INDEX_MAX_AGE seconds so that changes made by other processes are picked up.
+POD_INDEX_MAX_AGE = 300
+_pod_index = None
+_pod_index_lock = threading.Lock()
+
+
+def get_pod_index():
+    """
+    Returns the nearest neighbour index of active vehicles with pods, building it if needed
+    """
+    global _pod_index
+    with _pod_index_lock:
+        if _pod_index is None or time.time() - _pod_index.built > POD_INDEX_MAX_AGE:
+            from .models import Vehicle
+            _pod_index = PodIndex(
+                Vehicle.objects.filter(active=True).exclude(pod__isnull=True).values_list(
+                    'id', 'pod__latitude', 'pod__longitude'
+                )
+            )
+        return _pod_index
+
+
+def invalidate_pod_index():
+    """
+    Discards the nearest neighbour index, so it is rebuilt on next use
+    """
+    global _pod_index
+    with _pod_index_lock:
+        _pod_index = None
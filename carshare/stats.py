@@ -0,0 +1,151 @@
+#
+#   Author(s): Huon Imberger
+#   Description: Maintains the running totals shown on the About Us page, so reading them takes a constant number
+#                of queries however many bookings have been made. Booking writes only append to BookingStatsChange,
+#                so they never wait on the single SiteStats row; changes are added into SiteStats once the
+#                bookings they are for have ended.
+#
+
+from django.db import transaction
+from django.db.models import DateTimeField, IntegerField, Min, Subquery, Sum, Value, F
+from django.utils import timezone
+
+from decimal import Decimal
+
+from .models import Booking, BookingStatsChange, Pod, SiteStats, Vehicle
+from .pricing import price_bookings, total_cost
+
+
+# Most changes deleted by one query, keeping the list of ids well under SQLite's limit of 999 query parameters
+DELETE_CHUNK_SIZE = 500
+
+
+def booking_cost(booking):
+    """
+    Cost of a booking as a Decimal, suitable for adding to the running total
+    """
+    if booking.cost is not None:
+        return booking.cost
+    return Decimal(str(booking.calculate_cost()))
+
+
+def booking_change(booking, sign=1, counted=True):
+    """
+    Change to the totals from adding a booking, or removing it if sign is -1. A booking that is changed removes its
+    previous version and adds the new one, both uncounted as the number of bookings stays the same.
+    :return: (schedule_end, num_bookings, cost)
+    """
+    return booking.schedule_end, sign if counted else 0, sign * booking_cost(booking)
+
+
+def record_booking_changes(changes):
+    """
+    Appends changes to the totals. Call in the same transaction as the bookings are written (see Booking.save), so
+    a change is only seen with its booking. Only the new rows are written, so concurrent bookings don't wait on
+    each other.
+    :param changes: list of (schedule_end, num_bookings, cost), e.g. from booking_change
+    """
+    if changes:
+        BookingStatsChange.objects.bulk_create([
+            BookingStatsChange(schedule_end=schedule_end, num_bookings=num_bookings, cost=cost)
+            for schedule_end, num_bookings, cost in changes
+        ])
+
+
+def update_site_stats(**deltas):
+    """
+    Adds to the pod and vehicle counts, e.g. update_site_stats(num_pods=1). Does nothing if the stats have not been
+    built yet, as they will be counted from scratch on first use. Bookings use record_booking_changes instead.
+    """
+    deltas = {field: F(field) + delta for field, delta in deltas.items() if delta}
+    if deltas:
+        SiteStats.objects.filter(pk=SiteStats.SINGLETON_ID).update(**deltas)
+
+
+def rebuild_site_stats():
+    """
+    Recounts every total from scratch. Bookings that haven't ended yet are added back as pending changes, to be
+    added to the total cost when they end.
+    :return: SiteStats
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        BookingStatsChange.objects.all().delete()
+        stats, created = SiteStats.objects.update_or_create(pk=SiteStats.SINGLETON_ID, defaults={
+            'num_vehicles': Vehicle.objects.count(),
+            'num_pods': Pod.objects.count(),
+            'num_bookings': Booking.objects.count(),
+            'completed_cost': total_cost(Booking.objects.filter(schedule_end__lt=now)),
+            'completed_through': now,
+        })
+        upcoming = Booking.objects.filter(schedule_end__gte=now)
+        prices = price_bookings(upcoming.filter(cost__isnull=True))
+        BookingStatsChange.objects.bulk_create([
+            BookingStatsChange(schedule_end=end, num_bookings=0,
+                               cost=Decimal(str(prices[booking_id].cost)) if cost is None else cost)
+            for booking_id, end, cost in upcoming.values_list('id', 'schedule_end', 'cost').iterator()
+        ])
+    return stats
+
+
+def pending(aggregate, output_field):
+    """
+    Subquery aggregating every change not yet added to the stats, to read in the same query as the stats row
+    """
+    # Annotating a constant and grouping by it aggregates over every row with no GROUP BY
+    changes = BookingStatsChange.objects.annotate(all=Value(1, output_field=IntegerField())).values('all')
+    return Subquery(changes.annotate(result=aggregate).values('result'), output_field=output_field)
+
+
+def read_site_stats():
+    """
+    Reads the stats row along with the bookings counted by changes not yet added to it, in one query so it is
+    consistent with changes being added
+    :return: SiteStats, or None if the stats have not been built
+    """
+    stats = SiteStats.objects.annotate(
+        pending_bookings=pending(Sum('num_bookings'), IntegerField()),
+        first_pending_end=pending(Min('schedule_end'), DateTimeField()),
+    ).filter(pk=SiteStats.SINGLETON_ID).first()
+    if stats is not None:
+        stats.num_bookings += stats.pending_bookings or 0
+    return stats
+
+
+def get_site_stats():
+    """
+    Returns up to date totals. Changes for bookings that have ended since the totals were last read are added to the
+    stats row first.
+    :return: SiteStats
+    """
+    stats = read_site_stats()
+    if stats is None:
+        return rebuild_site_stats()
+    now = timezone.now()
+    if stats.first_pending_end is not None and stats.first_pending_end < now:
+        stats = add_completed_bookings(now)
+    return stats
+
+
+def add_completed_bookings(now):
+    """
+    Adds the changes for bookings that ended before now to the stats row. Only the changes read are deleted, so
+    changes committed meanwhile are added next time, and each change is added exactly once.
+    :return: SiteStats
+    """
+    with transaction.atomic():
+        # Concurrent readers wait here rather than adding the same changes
+        SiteStats.objects.select_for_update().filter(pk=SiteStats.SINGLETON_ID).values_list('pk').first()
+        changes = list(BookingStatsChange.objects.filter(schedule_end__lt=now).values_list('id', 'num_bookings',
+                                                                                             'cost'))
+        if changes:
+            ids = [change_id for change_id, num_bookings, cost in changes]
+            for i in range(0, len(ids), DELETE_CHUNK_SIZE):
+                BookingStatsChange.objects.filter(id__in=ids[i:i + DELETE_CHUNK_SIZE]).delete()
+            SiteStats.objects.filter(pk=SiteStats.SINGLETON_ID).update(
+                num_bookings=F('num_bookings') + sum(num_bookings for change_id, num_bookings, cost in changes),
+                completed_cost=F('completed_cost') + sum((cost for change_id, num_bookings, cost in changes),
+                                                         Decimal(0)),
+                completed_through=now,
+            )
+        return read_site_stats()
@@ -0,0 +1,205 @@
+from django.test import TestCase
+from django.utils import timezone
+
+import datetime as dt
+
+from ..availability import (get_hourly_availability, get_availability_bitmaps, get_occupancy, get_free_vehicles,
+                            get_vehicle_type_quotes, AVAILABLE, BOOKED_BY_USER, UNAVAILABLE)
+from ..models import Booking, User, Vehicle, Pod, VehicleType
+
+
+def aware(*args):
+    return timezone.make_aware(dt.datetime(*args))
+
+
+class CarshareHourlyAvailabilityTests(TestCase):
+    def setUp(self):
+        vt = VehicleType.objects.create(description='Premium', hourly_rate=12.50, daily_rate=80.00)
+        p1 = Pod.objects.create(latitude='-39.34523453', longitude='139.53524344', description='Pod 1')
+        self.v1 = Vehicle.objects.create(pod=p1, type=vt, name='Vehicle1', make='Toyota', model='Yaris', year=2012,
+                                         registration='AAA222')
+        self.u1 = User.objects.create(email='test1@test.com', first_name='John', last_name='Doe',
+                                      date_of_birth='1980-01-01')
+        self.u2 = User.objects.create(email='test2@test.com', first_name='Jane', last_name='Doly',
+                                      date_of_birth='1988-01-01')
+        # Previous day 10 PM - 2 AM, by another user
+        Booking.objects.create(user=self.u2, vehicle=self.v1, schedule_start=aware(2998, 12, 31, 22),
+                               schedule_end=aware(2999, 1, 1, 2))
+        # 3 AM - 6 AM, by the user
+        Booking.objects.create(user=self.u1, vehicle=self.v1, schedule_start=aware(2999, 1, 1, 3),
+                               schedule_end=aware(2999, 1, 1, 6))
+        # 8 AM - 10 AM, cancelled
+        Booking.objects.create(user=self.u2, vehicle=self.v1, schedule_start=aware(2999, 1, 1, 8),
+                               schedule_end=aware(2999, 1, 1, 10), cancelled=timezone.now())
+        # 11 PM - next day
+        Booking.objects.create(user=self.u2, vehicle=self.v1, schedule_start=aware(2999, 1, 1, 23),
+                               schedule_end=aware(2999, 1, 2, 5))
+
+    def test_hour_labels(self):
+        """
+        Each hour is labelled according to the booking in progress at the start of the hour
+        """
+        hours = get_hourly_availability(self.v1, dt.date(2999, 1, 1), self.u1)
+        self.assertEqual(list(hours.keys()), list(range(24)))
+        self.assertEqual(hours[0], UNAVAILABLE)
+        self.assertEqual(hours[1], UNAVAILABLE)
+        self.assertEqual(hours[2], AVAILABLE)
+        self.assertEqual(hours[3], BOOKED_BY_USER)
+        self.assertEqual(hours[5], BOOKED_BY_USER)
+        self.assertEqual(hours[6], AVAILABLE)
+        self.assertEqual(hours[8], AVAILABLE)
+        self.assertEqual(hours[22], AVAILABLE)
+        self.assertEqual(hours[23], UNAVAILABLE)
+
+    def test_matches_vehicle_lookups(self):
+        """
+        Hour labels match the per-hour Vehicle lookups they replace
+        """
+        date = dt.date(2999, 1, 1)
+        hours = get_hourly_availability(self.v1, date, self.u2)
+        for i in range(24):
+            datetime = aware(2999, 1, 1, i)
+            booking = self.v1.get_booking_at(datetime)
+            if self.v1.is_available_at(datetime):
+                expected = AVAILABLE
+            elif booking is not None and booking.user == self.u2:
+                expected = BOOKED_BY_USER
+            else:
+                expected = UNAVAILABLE
+            self.assertEqual(hours[i], expected)
+
+    def test_past_hours_unavailable(self):
+        """
+        Hours more than an hour in the past cannot be booked
+        """
+        hours = get_hourly_availability(self.v1, timezone.localdate() - dt.timedelta(days=1), self.u1)
+        self.assertEqual(set(hours.values()), {UNAVAILABLE})
+
+    def test_single_query(self):
+        """
+        Availability for a day is built from one bookings query and one holds query
+        """
+        with self.assertNumQueries(2):
+            get_hourly_availability(self.v1, dt.date(2999, 1, 1), self.u1)
+
+
+class CarshareAvailabilityBitmapTests(CarshareHourlyAvailabilityTests):
+    def test_bitmaps_match_hourly_availability(self):
+        """
+        Each day's bitmaps agree with the hourly availability for that day
+        """
+        start = dt.date(2998, 12, 31)
+        bitmaps = get_availability_bitmaps(self.v1, start, 3, self.u1)
+        self.assertEqual(len(bitmaps[AVAILABLE]), 3)
+        for i in range(3):
+            hours = get_hourly_availability(self.v1, start + dt.timedelta(days=i), self.u1)
+            self.assertEqual(bitmaps[AVAILABLE][i], ''.join('1' if hours[h] == AVAILABLE else '0' for h in range(24)))
+            self.assertEqual(bitmaps[BOOKED_BY_USER][i],
+                             ''.join('1' if hours[h] == BOOKED_BY_USER else '0' for h in range(24)))
+
+    def test_bitmaps_single_query(self):
+        """
+        Bitmaps for many days are built from one bookings query and one holds query
+        """
+        with self.assertNumQueries(2):
+            get_availability_bitmaps(self.v1, dt.date(2999, 1, 1), Booking.MAX_LENGTH_DAYS, self.u1)
+
+
+class CarshareFleetSearchTests(TestCase):
+    def setUp(self):
+        vt = VehicleType.objects.create(description='Premium', hourly_rate=12.50, daily_rate=80.00)
+        self.u1 = User.objects.create(email='test1@test.com', first_name='John', last_name='Doe',
+                                      date_of_birth='1980-01-01')
+        self.vehicles = []
+        for i in range(4):
+            pod = Pod.objects.create(latitude='-37.8', longitude='144.9', description='Pod {0}'.format(i))
+            self.vehicles.append(Vehicle.objects.create(pod=pod, type=vt, name='Vehicle{0}'.format(i), make='Toyota',
+                                                        model='Yaris', year=2012, registration='AAA22{0}'.format(i)))
+        # Vehicle without a pod and an inactive vehicle are never returned
+        Vehicle.objects.create(type=vt, name='NoPod', make='Toyota', model='Yaris', year=2012, registration='BBB111')
+        inactive_pod = Pod.objects.create(latitude='-37.8', longitude='144.9', description='Inactive pod')
+        Vehicle.objects.create(pod=inactive_pod, type=vt, name='Inactive', make='Toyota', model='Yaris', year=2012,
+                               registration='BBB112', active=False)
+        # Vehicle0 booked 9 AM - 11 AM, Vehicle1 booked 4 PM - 6 PM, Vehicle2 cancelled over the whole day
+        Booking.objects.create(user=self.u1, vehicle=self.vehicles[0], schedule_start=aware(2999, 1, 1, 9),
+                               schedule_end=aware(2999, 1, 1, 11))
+        Booking.objects.create(user=self.u1, vehicle=self.vehicles[1], schedule_start=aware(2999, 1, 1, 16),
+                               schedule_end=aware(2999, 1, 1, 18))
+        Booking.objects.create(user=self.u1, vehicle=self.vehicles[2], schedule_start=aware(2999, 1, 1, 0),
+                               schedule_end=aware(2999, 1, 2, 0), cancelled=timezone.now())
+
+    def test_occupancy(self):
+        """
+        Occupancy rows have a bit set for each hour of the window a vehicle is booked
+        """
+        occupancy = get_occupancy(Vehicle.objects.all(), aware(2999, 1, 1, 8), aware(2999, 1, 1, 17))
+        self.assertEqual(occupancy[self.vehicles[0].id], 0b110)
+        self.assertEqual(occupancy[self.vehicles[1].id], 0b100000000)
+        self.assertEqual(occupancy[self.vehicles[2].id], 0)
+        self.assertEqual(occupancy[self.vehicles[3].id], 0)
+
+    def test_free_vehicles(self):
+        """
+        Only active vehicles with pods that are free for the whole window are returned
+        """
+        free = get_free_vehicles(aware(2999, 1, 1, 10), aware(2999, 1, 1, 16))
+        self.assertEqual(free, self.vehicles[1:])
+        free = get_free_vehicles(aware(2999, 1, 1, 11), aware(2999, 1, 1, 16))
+        self.assertEqual(free, self.vehicles)
+
+    def test_free_vehicles_matches_vehicle_lookup(self):
+        """
+        Fleet search agrees with checking each vehicle individually
+        """
+        start = aware(2999, 1, 1, 8)
+        for hours in range(1, 12):
+            end = start + dt.timedelta(hours=hours)
+            expected = [v for v in self.vehicles if v.is_available_between(start, end)]
+            self.assertEqual(get_free_vehicles(start, end), expected)
+
+    def test_free_vehicles_constant_queries(self):
+        """
+        Fleet search runs a constant number of queries regardless of fleet size
+        """
+        with self.assertNumQueries(4):
+            get_free_vehicles(aware(2999, 1, 1, 10), aware(2999, 1, 1, 16))
+
+
+class CarshareVehicleTypeQuoteTests(TestCase):
+    def setUp(self):
+        premium = VehicleType.objects.create(description='Premium', hourly_rate=12.50, daily_rate=80.00)
+        economy = VehicleType.objects.create(description='Economy', hourly_rate=8.00, daily_rate=50.00)
+        VehicleType.objects.create(description='Utility', hourly_rate=20.00, daily_rate=120.00)
+        u1 = User.objects.create(email='test1@test.com', first_name='John', last_name='Doe',
+                                 date_of_birth='1980-01-01')
+        self.vehicles = []
+        for i, vt in enumerate([premium, premium, premium, premium, economy]):
+            pod = Pod.objects.create(latitude='-37.8', longitude='144.9', description='Pod {0}'.format(i))
+            self.vehicles.append(Vehicle.objects.create(pod=pod, type=vt, name='Vehicle{0}'.format(i), make='Toyota',
+                                                        model='Yaris', year=2012, registration='AAA22{0}'.format(i)))
+        # Inactive vehicles are not counted
+        self.vehicles[3].active = False
+        self.vehicles[3].save()
+        # Vehicle0 and the economy vehicle are booked during the window, Vehicle1 afterwards
+        Booking.objects.create(user=u1, vehicle=self.vehicles[0], schedule_start=aware(2999, 1, 1, 9),
+                               schedule_end=aware(2999, 1, 1, 11))
+        Booking.objects.create(user=u1, vehicle=self.vehicles[1], schedule_start=aware(2999, 1, 1, 13),
+                               schedule_end=aware(2999, 1, 1, 18))
+        Booking.objects.create(user=u1, vehicle=self.vehicles[4], schedule_start=aware(2999, 1, 1, 12),
+                               schedule_end=aware(2999, 1, 1, 13))
+
+    def test_vehicle_type_quotes(self):
+        """
+        Every vehicle type is priced like a booking, cheapest first, with the number of free vehicles
+        """
+        start, end = aware(2999, 1, 1, 10), aware(2999, 1, 1, 13)
+        quotes = get_vehicle_type_quotes(start, end)
+        self.assertEqual([q['vehicle_type'].description for q in quotes], ['Economy', 'Premium', 'Utility'])
+        self.assertEqual([q['price'].cost for q in quotes], [24.0, 37.5, 60.0])
+        self.assertEqual([q['free'] for q in quotes], [0, 2, 0])
+        booking = Booking(vehicle=self.vehicles[0], schedule_start=start, schedule_end=end)
+        self.assertEqual(quotes[1]['price'].cost, booking.calculate_cost())
+
+    def test_vehicle_type_quotes_constant_queries(self):
+        with self.assertNumQueries(4):
+            get_vehicle_type_quotes(aware(2999, 1, 1, 10), aware(2999, 1, 1, 16))
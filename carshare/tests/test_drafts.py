@@ -0,0 +1,45 @@
+from django.test import TestCase
+from django.utils import timezone
+
+from unittest import mock
+import datetime as dt
+
+from ..drafts import dump_draft, load_draft, InvalidDraft
+from ..models import User, Vehicle, Pod, VehicleType
+
+
+class CarshareBookingDraftTests(TestCase):
+    def setUp(self):
+        vt = VehicleType.objects.create(description='Premium', hourly_rate=12.50, daily_rate=80.00)
+        p1 = Pod.objects.create(latitude='-39.34523453', longitude='139.53524344', description='Pod 1')
+        self.v1 = Vehicle.objects.create(pod=p1, type=vt, name='Vehicle1', make='Toyota', model='Yaris', year=2012,
+                                         registration='AAA222')
+        self.u1 = User.objects.create(email='test1@test.com', first_name='John', last_name='Doe',
+                                      date_of_birth='1980-01-01')
+        self.u2 = User.objects.create(email='test2@test.com', first_name='Jane', last_name='Doly',
+                                      date_of_birth='1988-01-01')
+        self.start = timezone.make_aware(dt.datetime(2999, 1, 1, 10))
+        self.end = self.start + dt.timedelta(hours=3)
+
+    def test_round_trip(self):
+        draft = dump_draft(self.u1, self.v1, self.start, self.end)
+        with self.assertNumQueries(0):
+            self.assertEqual(load_draft(draft, self.u1), (self.v1.id, self.start, self.end))
+
+    def test_tampered_draft(self):
+        draft = dump_draft(self.u1, self.v1, self.start, self.end)
+        with self.assertRaises(InvalidDraft):
+            load_draft(draft[:-1] + ('A' if draft[-1] != 'A' else 'B'), self.u1)
+        with self.assertRaises(InvalidDraft):
+            load_draft('', self.u1)
+
+    def test_other_users_draft(self):
+        draft = dump_draft(self.u1, self.v1, self.start, self.end)
+        with self.assertRaises(InvalidDraft):
+            load_draft(draft, self.u2)
+
+    def test_expired_draft(self):
+        draft = dump_draft(self.u1, self.v1, self.start, self.end)
+        with mock.patch('carshare.drafts.DRAFT_MAX_AGE', -1):
+            with self.assertRaises(InvalidDraft):
+                load_draft(draft, self.u1)
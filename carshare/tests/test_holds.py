@@ -0,0 +1,127 @@
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+
+from io import StringIO
+import datetime as dt
+
+from ..availability import get_free_vehicles, get_hourly_availability, AVAILABLE, BOOKED_BY_USER, UNAVAILABLE
+from ..managers import UserBookingClash, VehicleBookingClash
+from ..models import Booking, BookingHold, User, Vehicle, Pod, VehicleType
+
+
+def aware(*args):
+    return timezone.make_aware(dt.datetime(*args))
+
+
+class CarshareBookingHoldTests(TestCase):
+    def setUp(self):
+        vt = VehicleType.objects.create(description='Premium', hourly_rate=12.50, daily_rate=80.00)
+        p1 = Pod.objects.create(latitude='-39.34523453', longitude='139.53524344', description='Pod 1')
+        self.v1 = Vehicle.objects.create(pod=p1, type=vt, name='Vehicle1', make='Toyota', model='Yaris', year=2012,
+                                         registration='AAA222')
+        self.u1 = User.objects.create(email='test1@test.com', first_name='John', last_name='Doe',
+                                      date_of_birth='1980-01-01')
+        self.u2 = User.objects.create(email='test2@test.com', first_name='Jane', last_name='Doly',
+                                      date_of_birth='1988-01-01')
+        self.start, self.end = aware(2999, 1, 1, 10), aware(2999, 1, 1, 12)
+
+    def test_hold_blocks_other_users(self):
+        """
+        A held slot can't be held or booked by another user, but can be by the holder
+        """
+        hold = BookingHold.objects.hold(self.u1, self.v1, self.start, self.end)
+        self.assertGreater(hold.expires, timezone.now())
+        with self.assertRaises(VehicleBookingClash):
+            BookingHold.objects.hold(self.u2, self.v1, self.start + dt.timedelta(hours=1), self.end)
+        with self.assertRaises(VehicleBookingClash):
+            Booking.objects.create_if_available(self.u2, self.v1, self.start, self.end)
+        booking = Booking.objects.create_if_available(self.u1, self.v1, self.start, self.end)
+        self.assertEqual(booking.user, self.u1)
+        # Confirming releases the hold
+        self.assertFalse(BookingHold.objects.exists())
+
+    def test_hold_replaces_overlapping_hold(self):
+        """
+        Holding a new time for the same vehicle replaces the hold it overlaps
+        """
+        BookingHold.objects.hold(self.u1, self.v1, self.start, self.end)
+        BookingHold.objects.hold(self.u1, self.v1, self.start + dt.timedelta(hours=1), self.end)
+        self.assertEqual(BookingHold.objects.filter(user=self.u1).count(), 1)
+        BookingHold.objects.hold(self.u2, self.v1, self.start, self.start + dt.timedelta(hours=1))
+
+    def test_several_holds(self):
+        """
+        Each booking under review keeps its hold, so other users can't take the first while the second is reviewed,
+        or once the second is booked
+        """
+        later = self.end + dt.timedelta(hours=2)
+        BookingHold.objects.hold(self.u1, self.v1, self.start, self.end)
+        BookingHold.objects.hold(self.u1, self.v1, self.end, later)
+        with self.assertRaises(VehicleBookingClash):
+            BookingHold.objects.hold(self.u2, self.v1, self.start, self.start + dt.timedelta(hours=1))
+        Booking.objects.create_if_available(self.u1, self.v1, self.end, later)
+        self.assertEqual(list(BookingHold.objects.values_list('schedule_start', flat=True)), [self.start])
+        with self.assertRaises(VehicleBookingClash):
+            Booking.objects.create_if_available(self.u2, self.v1, self.start, self.end)
+
+    def test_max_holds(self):
+        """
+        Users can only hold a few slots at once, and the oldest are released first
+        """
+        for hour in range(BookingHold.MAX_HOLDS + 1):
+            start = self.start + dt.timedelta(hours=hour)
+            BookingHold.objects.hold(self.u1, self.v1, start, start + dt.timedelta(hours=1))
+        holds = BookingHold.objects.filter(user=self.u1)
+        self.assertEqual(holds.count(), BookingHold.MAX_HOLDS)
+        self.assertFalse(holds.filter(schedule_start=self.start).exists())
+
+    def test_hold_checks_bookings(self):
+        Booking.objects.create(user=self.u2, vehicle=self.v1, schedule_start=self.start, schedule_end=self.end)
+        with self.assertRaises(VehicleBookingClash):
+            BookingHold.objects.hold(self.u1, self.v1, self.start, self.end)
+        p2 = Pod.objects.create(latitude='-38.34523453', longitude='138.53524344', description='Pod 2')
+        v2 = Vehicle.objects.create(pod=p2, type=self.v1.type, name='Vehicle2', make='Toyota', model='Yaris',
+                                    year=2012, registration='AAA223')
+        with self.assertRaises(UserBookingClash):
+            BookingHold.objects.hold(self.u2, v2, self.start, self.end)
+        self.assertFalse(BookingHold.objects.exists())
+
+    def test_expired_holds_ignored(self):
+        """
+        Once a hold expires the slot is free again, and the hold is deleted by expire_booking_holds
+        """
+        BookingHold.objects.hold(self.u1, self.v1, self.start, self.end)
+        BookingHold.objects.update(expires=timezone.now())
+        self.assertTrue(self.v1.is_available_between(self.start, self.end))
+        BookingHold.objects.hold(self.u2, self.v1, self.start, self.end)
+        out = StringIO()
+        call_command('expire_booking_holds', stdout=out)
+        self.assertIn('Deleted 1 expired holds', out.getvalue())
+        self.assertEqual(list(BookingHold.objects.values_list('user_id', flat=True)), [self.u2.id])
+
+    def test_availability_includes_holds(self):
+        """
+        Holds make the slot unavailable to everyone but the holder, in each way availability is shown
+        """
+        BookingHold.objects.hold(self.u1, self.v1, self.start, self.end)
+        self.assertFalse(self.v1.is_available_between(self.start, self.end))
+        self.assertFalse(self.v1.is_available_at(self.start))
+        self.assertIsNone(self.v1.get_booking_at(self.start))
+        self.assertEqual(get_free_vehicles(self.start, self.end), [])
+        hours = get_hourly_availability(self.v1, dt.date(2999, 1, 1), self.u2)
+        self.assertEqual([hours[10], hours[11], hours[12]], [UNAVAILABLE, UNAVAILABLE, AVAILABLE])
+        # The holder's own hold doesn't show as a booking
+        hours = get_hourly_availability(self.v1, dt.date(2999, 1, 1), self.u1)
+        self.assertNotIn(BOOKED_BY_USER, hours.values())
+        self.assertEqual(hours[10], AVAILABLE)
+
+    def test_available_now_includes_holds(self):
+        now = timezone.now()
+        BookingHold.objects.hold(self.u1, self.v1, now - dt.timedelta(minutes=5), now + dt.timedelta(hours=1))
+        vehicle = Vehicle.objects.with_available_now().get(pk=self.v1.pk)
+        self.assertFalse(vehicle.available_now)
+        self.assertFalse(self.v1.is_available())
+        BookingHold.objects.update(expires=now)
+        self.assertTrue(Vehicle.objects.with_available_now().get(pk=self.v1.pk).available_now)
+        self.assertTrue(self.v1.is_available())
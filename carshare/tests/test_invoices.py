@@ -0,0 +1,143 @@
+from django.core import mail
+from django.core.files.storage import default_storage
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from unittest import mock
+import datetime as dt
+import shutil
+import tempfile
+
+from ..invoices import get_invoice_pdf, get_invoice_pdf_name, get_template_version, send_invoice
+from ..models import Booking, Invoice, User, Vehicle, Pod, VehicleType
+
+
+PDF = b'%PDF-1.4 invoice'
+
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class CarshareInvoicePdfTests(TestCase):
+    fixtures = ['email_templates']
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings = override_settings(MEDIA_ROOT=media_root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        patcher = mock.patch('carshare.invoices.render_invoice_pdf', return_value=PDF)
+        self.render_invoice_pdf = patcher.start()
+        self.addCleanup(patcher.stop)
+
+        vt = VehicleType.objects.create(description='Premium', hourly_rate=12.50, daily_rate=80.00)
+        p1 = Pod.objects.create(latitude='-39.34523453', longitude='139.53524344', description='Pod 1')
+        v1 = Vehicle.objects.create(pod=p1, type=vt, name='Vehicle1', make='Toyota', model='Yaris', year=2012,
+                                    registration='AAA222')
+        self.user = User.objects.create_user(email='user@test.com', password='bigbadtestuser', first_name='Test',
+                                             last_name='User', date_of_birth=dt.date(1980, 1, 1))
+        start = timezone.now() - dt.timedelta(days=1)
+        self.booking = Booking.objects.create(user=self.user, vehicle=v1, schedule_start=start,
+                                              schedule_end=start + dt.timedelta(hours=2))
+        self.invoice = Invoice.objects.create(booking=self.booking, amount=self.booking.get_cost())
+        self.url = reverse('carshare:booking_invoice', kwargs={'booking_id': self.booking.id})
+
+    def test_template_version(self):
+        version = get_template_version()
+        self.assertRegex(version, r'^[0-9a-f]{16}$')
+        self.assertIn(version, get_invoice_pdf_name(self.invoice))
+
+    def test_rendered_once(self):
+        name = get_invoice_pdf(self.invoice)
+        self.assertEqual(get_invoice_pdf(self.invoice), name)
+        self.assertEqual(self.render_invoice_pdf.call_count, 1)
+        with default_storage.open(name) as f:
+            self.assertEqual(f.read(), PDF)
+
+    def test_rendered_again_for_new_template(self):
+        """
+        A new template version renders the PDF again, and the old version is deleted
+        """
+        old = get_invoice_pdf(self.invoice)
+        with mock.patch('carshare.invoices.get_template_version', return_value='0123456789abcdef'):
+            new = get_invoice_pdf(self.invoice)
+        self.assertNotEqual(old, new)
+        self.assertEqual(self.render_invoice_pdf.call_count, 2)
+        self.assertFalse(default_storage.exists(old))
+        self.assertTrue(default_storage.exists(new))
+
+    def test_send_invoice_stores_pdf(self):
+        send_invoice(self.invoice.id)
+        self.assertEqual(mail.outbox[0].attachments[0][1], PDF)
+        self.assertTrue(default_storage.exists(get_invoice_pdf_name(self.invoice)))
+        self.client.login(email='user@test.com', password='bigbadtestuser')
+        self.client.get(self.url)
+        self.assertEqual(self.render_invoice_pdf.call_count, 1)
+
+    def test_send_invoice_once(self):
+        """
+        Invoices are only emailed once, even if their job is run again
+        """
+        send_invoice(self.invoice.id)
+        send_invoice(self.invoice.id)
+        self.assertEqual(len(mail.outbox), 1)
+        self.invoice.refresh_from_db()
+        self.assertIsNotNone(self.invoice.sent)
+
+    def test_send_invoice_failed(self):
+        """
+        Invoices that couldn't be emailed are sent when the job is retried
+        """
+        with mock.patch('carshare.models.User.send_email', side_effect=OSError):
+            with self.assertRaises(OSError):
+                send_invoice(self.invoice.id)
+        self.invoice.refresh_from_db()
+        self.assertIsNone(self.invoice.sent)
+        send_invoice(self.invoice.id)
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_view_invoice(self):
+        self.client.login(email='user@test.com', password='bigbadtestuser')
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, PDF)
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertIn('ETag', response)
+        self.assertIn('Last-Modified', response)
+        self.assertIn('private', response['Cache-Control'])
+        # Cached copies are revalidated without rendering again
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        response = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(self.render_invoice_pdf.call_count, 1)
+
+    def test_view_invoice_ranges(self):
+        self.client.login(email='user@test.com', password='bigbadtestuser')
+        etag = self.client.get(self.url)['ETag']
+        size = len(PDF)
+        for header, content in [('bytes=0-3', PDF[:4]), ('bytes=4-', PDF[4:]), ('bytes=-7', PDF[-7:]),
+                                ('bytes=10-1000', PDF[10:])]:
+            response = self.client.get(self.url, HTTP_RANGE=header)
+            self.assertEqual(response.status_code, 206, header)
+            self.assertEqual(response.content, content, header)
+        self.assertEqual(response['Content-Range'], 'bytes 10-{0}/{1}'.format(size - 1, size))
+        response = self.client.get(self.url, HTTP_RANGE='bytes={0}-'.format(size))
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */{0}'.format(size))
+        # Several ranges, invalid ranges, and ranges of an older version get the whole file
+        for headers in [{'HTTP_RANGE': 'bytes=0-1,4-5'}, {'HTTP_RANGE': 'bytes=5-2'},
+                        {'HTTP_RANGE': 'bytes=0-3', 'HTTP_IF_RANGE': '"1-old"'}]:
+            response = self.client.get(self.url, **headers)
+            self.assertEqual(response.status_code, 200, headers)
+            self.assertEqual(response.content, PDF)
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-3', HTTP_IF_RANGE=etag)
+        self.assertEqual(response.status_code, 206)
+
+    def test_other_users_invoice(self):
+        User.objects.create_user(email='other@test.com', password='bigbadtestuser', first_name='Other',
+                                 last_name='User', date_of_birth=dt.date(1980, 1, 1))
+        self.client.login(email='other@test.com', password='bigbadtestuser')
+        self.assertRedirects(self.client.get(self.url), reverse('carshare:index'), fetch_redirect_response=False)
+        self.assertFalse(self.render_invoice_pdf.called)
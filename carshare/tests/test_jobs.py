@@ -0,0 +1,102 @@
+from django.test import TestCase
+from django.utils import timezone
+
+import datetime as dt
+
+from ..jobs import claim_next, enqueue, run_job, run_pending
+from ..models import Job
+
+
+calls = []
+
+
+def record(**kwargs):
+    calls.append(kwargs)
+
+
+def fail(**kwargs):
+    raise ValueError('Job failed')
+
+
+class CarshareJobTests(TestCase):
+    def setUp(self):
+        del calls[:]
+
+    def test_run_job(self):
+        job = enqueue('carshare.tests.test_jobs.record', 'test:1', number=1, text='a')
+        self.assertEqual(Job.objects.status_of('test:1'), Job.PENDING)
+        self.assertEqual(run_pending(), [job])
+        self.assertEqual(calls, [{'number': 1, 'text': 'a'}])
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.DONE, 1))
+        self.assertIsNotNone(job.finished)
+        self.assertEqual(Job.objects.status_of('test:1'), Job.DONE)
+        self.assertIsNone(Job.objects.status_of('test:2'))
+
+    def test_claimed_once(self):
+        """
+        A job can only be claimed by one worker, and jobs run oldest first
+        """
+        first = enqueue('carshare.tests.test_jobs.record', 'test:1')
+        second = enqueue('carshare.tests.test_jobs.record', 'test:2')
+        self.assertEqual(claim_next(), first)
+        self.assertEqual(claim_next(), second)
+        self.assertIsNone(claim_next())
+        # A worker that read the job before it was claimed can't claim it too
+        self.assertEqual(Job.objects.filter(pk=first.pk, status=Job.PENDING, attempts=0).update(status=Job.RUNNING), 0)
+
+    def test_failed_job_retried(self):
+        """
+        Failed jobs are retried later, until they have been tried MAX_ATTEMPTS times
+        """
+        job = enqueue('carshare.tests.test_jobs.fail', 'test:1')
+        for attempt in range(1, Job.MAX_ATTEMPTS + 1):
+            job = claim_next()
+            self.assertEqual(job.attempts, attempt)
+            self.assertFalse(run_job(job))
+            self.assertIn('Job failed', job.error)
+            # Not due again until later
+            self.assertIsNone(claim_next())
+            Job.objects.update(run_after=timezone.now())
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertIsNone(claim_next())
+
+    def test_stalled_job_rerun(self):
+        """
+        Running jobs whose worker has died are run again
+        """
+        enqueue('carshare.tests.test_jobs.record', 'test:1')
+        claim_next()
+        self.assertEqual(run_pending(), [])
+        Job.objects.update(started=timezone.now() - dt.timedelta(seconds=Job.TIMEOUT_SECONDS + 1))
+        self.assertEqual(len(run_pending()), 1)
+        self.assertEqual(len(calls), 1)
+
+    def test_stalled_job_fails(self):
+        """
+        Reclaiming a stalled job counts as an attempt, so jobs whose worker always dies still fail
+        """
+        job = enqueue('carshare.tests.test_jobs.record', 'test:1')
+        for attempt in range(1, Job.MAX_ATTEMPTS + 1):
+            self.assertEqual(claim_next().attempts, attempt)
+            Job.objects.update(started=timezone.now() - dt.timedelta(seconds=Job.TIMEOUT_SECONDS + 1))
+        self.assertIsNone(claim_next())
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.FAILED, Job.MAX_ATTEMPTS))
+        self.assertIn('Timed out', job.error)
+        self.assertEqual(calls, [])
+
+    def test_slow_job_reclaimed(self):
+        """
+        A worker that finishes after its job was reclaimed doesn't overwrite the new worker's result
+        """
+        enqueue('carshare.tests.test_jobs.fail', 'test:1')
+        slow = claim_next()
+        Job.objects.update(started=timezone.now() - dt.timedelta(seconds=Job.TIMEOUT_SECONDS + 1))
+        reclaimed = claim_next()
+        self.assertEqual(reclaimed.attempts, 2)
+        reclaimed.task = 'carshare.tests.test_jobs.record'
+        self.assertTrue(run_job(reclaimed))
+        self.assertFalse(run_job(slow))
+        self.assertEqual(Job.objects.status_of('test:1'), Job.DONE)
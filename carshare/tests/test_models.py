@@ -1,5 +1,6 @@
 from django.test import TestCase
 
+from ..managers import BookingClash
 from ..models import *
 from datetime import datetime, timedelta
 from django.utils import timezone
@@ -147,6 +148,51 @@ class CarshareBookingModelTests(TestCase):
         b = Booking.objects.create(user=u, vehicle=v, schedule_start=fixed_start, schedule_end=fixed_end)
         self.assertEqual(b.calculate_cost(), 62.5)
 
+    def test_latest_end(self):
+        """
+        Latest end is the start of the next booking of the vehicle or user, or slot held by another user
+        """
+        p2 = Pod.objects.create(latitude='-38.34523453', longitude='138.53524344', description='Pod 2')
+        v2 = Vehicle.objects.create(pod=p2, type=self.v1.type, name='Vehicle2', make='Mazda', model='2', year=2014,
+                                    registration='AAA223')
+        u2 = User.objects.create(email='test2@test.com', first_name='Jane', last_name='Doly',
+                                 date_of_birth='1988-01-01')
+        start = timezone.make_aware(datetime(2999, 1, 1, 10))
+        b = Booking.objects.create(user=self.u, vehicle=self.v1, schedule_start=start,
+                                   schedule_end=start + timedelta(hours=2))
+        # No later bookings, so limited by the maximum booking length
+        self.assertEqual(b.get_latest_end(), start + timedelta(days=Booking.MAX_LENGTH_DAYS))
+        # Cancelled bookings and other users' bookings of other vehicles don't count
+        Booking.objects.create(user=self.u, vehicle=self.v1, schedule_start=start + timedelta(hours=3),
+                               schedule_end=start + timedelta(hours=4), cancelled=timezone.now())
+        Booking.objects.create(user=u2, vehicle=v2, schedule_start=start + timedelta(hours=3),
+                               schedule_end=start + timedelta(hours=4))
+        self.assertEqual(b.get_latest_end(), start + timedelta(days=Booking.MAX_LENGTH_DAYS))
+        Booking.objects.create(user=u2, vehicle=self.v1, schedule_start=start + timedelta(days=2),
+                               schedule_end=start + timedelta(days=3))
+        self.assertEqual(b.get_latest_end(), start + timedelta(days=2))
+        Booking.objects.create(user=self.u, vehicle=v2, schedule_start=start + timedelta(hours=30),
+                               schedule_end=start + timedelta(hours=31))
+        self.assertEqual(b.get_latest_end(), start + timedelta(hours=30))
+        BookingHold.objects.create(user=u2, vehicle=self.v1, schedule_start=start + timedelta(hours=20),
+                                   schedule_end=start + timedelta(hours=21),
+                                   expires=timezone.now() + timedelta(minutes=5))
+        with self.assertNumQueries(1):
+            self.assertEqual(b.get_latest_end(), start + timedelta(hours=20))
+
+    def test_extend_if_available(self):
+        start = timezone.make_aware(datetime(2999, 1, 1, 10))
+        b = Booking.objects.create(user=self.u, vehicle=self.v1, schedule_start=start,
+                                   schedule_end=start + timedelta(hours=2))
+        Booking.objects.create(user=self.u, vehicle=self.v1, schedule_start=start + timedelta(hours=5),
+                               schedule_end=start + timedelta(hours=6))
+        with self.assertRaises(BookingClash):
+            Booking.objects.extend_if_available(b, start + timedelta(hours=6))
+        Booking.objects.extend_if_available(b, start + timedelta(hours=5))
+        b.refresh_from_db()
+        self.assertEqual(b.schedule_end, start + timedelta(hours=5))
+        self.assertEqual(float(b.cost), 62.5)
+
 
 class CarshareVehicleModelTests(TestCase):
     def setUp(self):
@@ -178,3 +224,41 @@ class CarshareVehicleModelTests(TestCase):
         """
         v = Vehicle.objects.get(name='Vehicle1')
         self.assertFalse(v.is_available())
+
+    def test_is_available_at(self):
+        """
+        Vehicle availability at a point in time ignores cancelled and finished bookings
+        """
+        v1 = Vehicle.objects.get(name='Vehicle1')
+        v2 = Vehicle.objects.get(name='Vehicle2')
+        now = timezone.now()
+        self.assertFalse(v1.is_available_at(now))
+        self.assertTrue(v1.is_available_at(two_days_from_now))
+        self.assertTrue(v2.is_available_at(now))
+        self.assertFalse(v2.is_available_at(tomorrow))
+        # Booking end is exclusive
+        self.assertTrue(v2.is_available_at(two_days_from_now))
+
+    def test_get_booking_at(self):
+        """
+        Booking at a point in time is returned, or None when the vehicle is free
+        """
+        v2 = Vehicle.objects.get(name='Vehicle2')
+        self.assertIsNone(v2.get_booking_at(timezone.now()))
+        self.assertEqual(v2.get_booking_at(tomorrow), Booking.objects.get(vehicle=v2, schedule_start=tomorrow))
+
+    def test_is_available_between(self):
+        """
+        Vehicle is only available for an interval that overlaps no non-cancelled bookings
+        """
+        v2 = Vehicle.objects.get(name='Vehicle2')
+        self.assertTrue(v2.is_available_between(yesterday, tomorrow))
+        self.assertFalse(v2.is_available_between(yesterday, two_days_from_now))
+        self.assertFalse(v2.is_available_between(two_days_ago - timedelta(hours=1), two_days_ago + timedelta(hours=1)))
+
+    def test_available_now_annotation(self):
+        """
+        available_now annotation agrees with Vehicle.is_available
+        """
+        for v in Vehicle.objects.with_available_now():
+            self.assertEqual(v.available_now, v.is_available())
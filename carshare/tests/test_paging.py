@@ -0,0 +1,53 @@
+from django.test import TestCase
+from django.utils import timezone
+
+import datetime as dt
+
+from ..models import Booking, User, Vehicle, Pod, VehicleType
+from ..paging import decode_cursor, encode_cursor, get_page, InvalidCursor
+
+
+class CarshareBookingPagingTests(TestCase):
+    def setUp(self):
+        vt = VehicleType.objects.create(description='Premium', hourly_rate=12.50, daily_rate=80.00)
+        p1 = Pod.objects.create(latitude='-39.34523453', longitude='139.53524344', description='Pod 1')
+        v1 = Vehicle.objects.create(pod=p1, type=vt, name='Vehicle1', make='Toyota', model='Yaris', year=2012,
+                                    registration='AAA222')
+        self.u1 = User.objects.create(email='test1@test.com', first_name='John', last_name='Doe',
+                                      date_of_birth='1980-01-01')
+        self.now = timezone.now()
+        # Several bookings share each start time, so pages have to be split between them by id
+        for i in range(12):
+            start = self.now + dt.timedelta(days=1 + i // 3, microseconds=7)
+            Booking.objects.create(user=self.u1, vehicle=v1, schedule_start=start,
+                                   schedule_end=start + dt.timedelta(hours=1))
+            Booking.objects.create(user=self.u1, vehicle=v1, schedule_start=start - dt.timedelta(days=30),
+                                   schedule_end=start - dt.timedelta(days=30, hours=-1))
+
+    def read_all(self, bookings, size):
+        page = get_page(bookings, size=size)
+        result = page.bookings
+        while page.next_cursor is not None:
+            with self.assertNumQueries(1):
+                page = get_page(bookings, page.next_cursor, size=size)
+            result += page.bookings
+        return result
+
+    def test_pages_match_full_list(self):
+        for size in (1, 2, 3, 5, 12, 13):
+            upcoming = self.u1.booking_set.upcoming(self.now)
+            self.assertEqual(self.read_all(upcoming, size), list(upcoming))
+            past = self.u1.booking_set.past(self.now)
+            self.assertEqual(self.read_all(past, size), list(past))
+
+    def test_last_page(self):
+        page = get_page(self.u1.booking_set.upcoming(self.now), size=12)
+        self.assertEqual(len(page.bookings), 12)
+        self.assertIsNone(page.next_cursor)
+
+    def test_cursor_round_trip(self):
+        booking = self.u1.booking_set.first()
+        self.assertEqual(decode_cursor(encode_cursor(booking)), (booking.schedule_start, booking.id))
+        for cursor in ('', '1', 'a.b', None):
+            with self.assertRaises(InvalidCursor):
+                decode_cursor(cursor)
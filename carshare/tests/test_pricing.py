@@ -0,0 +1,181 @@
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+
+from unittest import mock
+import datetime as dt
+from decimal import Decimal
+from io import StringIO
+
+from ..models import Booking, User, Vehicle, Pod, VehicleType
+from ..pricing import calculate_price, get_tariff, length_in_hours, price, price_bookings, total_cost
+from ..stats import get_site_stats
+
+
+class CarshareBatchPricingTests(TestCase):
+    def setUp(self):
+        u = User.objects.create(email='test@test.com', first_name='John', last_name='Doe', date_of_birth='1980-01-01')
+        rates = [('12.50', '80.00'), ('10.00', '100.00'), ('7.35', '59.99'), ('15.00', '15.00')]
+        start = timezone.now()
+        lengths = [
+            dt.timedelta(minutes=1), dt.timedelta(minutes=59), dt.timedelta(hours=1), dt.timedelta(hours=1, seconds=1),
+            dt.timedelta(hours=5), dt.timedelta(hours=6, minutes=24), dt.timedelta(hours=10), dt.timedelta(hours=13),
+            dt.timedelta(hours=23, minutes=59, seconds=59), dt.timedelta(days=1), dt.timedelta(hours=26),
+            dt.timedelta(hours=40), dt.timedelta(days=7, hours=3, minutes=30), dt.timedelta(days=90),
+        ]
+        for i, (hourly_rate, daily_rate) in enumerate(rates):
+            vt = VehicleType.objects.create(description='Type {0}'.format(i), hourly_rate=hourly_rate,
+                                            daily_rate=daily_rate)
+            pod = Pod.objects.create(latitude='-37.8', longitude='144.9', description='Pod {0}'.format(i))
+            v = Vehicle.objects.create(pod=pod, type=vt, name='Vehicle{0}'.format(i), make='Toyota', model='Yaris',
+                                       year=2012, registration='AAA11{0}'.format(i))
+            for length in lengths:
+                Booking.objects.create(user=u, vehicle=v, schedule_start=start, schedule_end=start + length)
+
+    def test_matches_per_booking_methods(self):
+        """
+        Batch prices are identical to pricing each booking on its own
+        """
+        prices = price_bookings(Booking.objects.all())
+        self.assertEqual(len(prices), Booking.objects.count())
+        for booking in Booking.objects.all():
+            booking_price = prices[booking.id]
+            self.assertEqual(booking_price.cost, booking.calculate_cost())
+            self.assertEqual((booking_price.days, booking_price.hours), booking.calculate_daily_hourly_billable_counts())
+
+    def test_examples(self):
+        """
+        Hourly cost is capped at the daily rate
+        """
+        prices = price_bookings(Booking.objects.filter(vehicle__type__hourly_rate='10.00'))
+        costs = sorted(booking_price.cost for booking_price in prices.values())
+        self.assertEqual(costs[:4], [10.0, 10.0, 10.0, 20.0])
+        self.assertIn(100.0, costs)
+
+    def test_total_cost(self):
+        """
+        Totals match adding up the cost of each booking
+        """
+        bookings = Booking.objects.exclude(vehicle__type__description='Type 3')
+        self.assertAlmostEqual(float(total_cost(bookings)), sum(b.calculate_cost() for b in bookings), places=6)
+        self.assertEqual(total_cost(Booking.objects.none()), 0)
+
+    def test_constant_queries(self):
+        with self.assertNumQueries(2):
+            price_bookings(Booking.objects.filter(vehicle__type__description='Type 2'))
+        Booking.objects.filter(vehicle__type__description='Type 2').update(cost=None)
+        with self.assertNumQueries(3):
+            total_cost(Booking.objects.all())
+
+
+class CarshareTariffTests(TestCase):
+    RATES = [
+        (Decimal('12.50'), Decimal('80.00')),
+        (Decimal('10.00'), Decimal('100.00')),
+        (Decimal('7.35'), Decimal('59.99')),
+        # Daily rate above 24 hours of hourly rate
+        (Decimal('2.00'), Decimal('60.00')),
+    ]
+
+    def test_tariff_matches_billing_rule(self):
+        """
+        Looking up the tariff gives the same result as applying the billing rule to every length
+        """
+        lengths = [dt.timedelta(hours=h) for h in range(Booking.MAX_LENGTH_DAYS * 24 + 30)]
+        lengths += [dt.timedelta(hours=h, minutes=m) for h in range(0, 72) for m in (1, 30, 59)]
+        for hourly_rate, daily_rate in self.RATES:
+            for length in lengths:
+                self.assertEqual(price(length, hourly_rate, daily_rate),
+                                 calculate_price(*length_in_hours(length), hourly_rate, daily_rate))
+
+    def test_tariff_cached_by_rates(self):
+        tariff = get_tariff(Decimal('12.50'), Decimal('80.00'))
+        self.assertEqual(len(tariff), Booking.MAX_LENGTH_DAYS * 24 + 1)
+        self.assertIs(get_tariff(Decimal('12.50'), Decimal('80.00')), tariff)
+        self.assertEqual(tariff[7], (1, 0, 80.0))
+        self.assertEqual(tariff[26], (1, 2, 105.0))
+
+    def test_rate_change(self):
+        """
+        Changing a vehicle type's rates prices bookings from a new table
+        """
+        vt = VehicleType.objects.create(description='Premium', hourly_rate='12.50', daily_rate='80.00')
+        pod = Pod.objects.create(latitude='-37.8', longitude='144.9', description='Pod')
+        v = Vehicle.objects.create(pod=pod, type=vt, name='Vehicle', make='Toyota', model='Yaris', year=2012,
+                                   registration='AAA111')
+        u = User.objects.create(email='test@test.com', first_name='John', last_name='Doe', date_of_birth='1980-01-01')
+        start = timezone.now()
+        Booking.objects.create(user=u, vehicle=v, schedule_start=start, schedule_end=start + dt.timedelta(hours=3))
+        self.assertEqual(Booking.objects.get().calculate_cost(), 37.5)
+        vt.hourly_rate = '15.00'
+        vt.save()
+        self.assertEqual(Booking.objects.get().calculate_cost(), 45.0)
+
+
+class CarshareStoredPriceTests(TestCase):
+    def setUp(self):
+        vt = VehicleType.objects.create(description='Premium', hourly_rate='12.50', daily_rate='80.00')
+        pod = Pod.objects.create(latitude='-37.8', longitude='144.9', description='Pod')
+        self.v = Vehicle.objects.create(pod=pod, type=vt, name='Vehicle', make='Toyota', model='Yaris', year=2012,
+                                        registration='AAA111')
+        self.u = User.objects.create(email='test@test.com', first_name='John', last_name='Doe',
+                                     date_of_birth='1980-01-01')
+        self.start = timezone.now()
+
+    def test_price_stored_on_save(self):
+        """
+        Cost, billable days and hours, and duration are stored when a booking is saved, and again when it changes
+        """
+        b = Booking.objects.create(user=self.u, vehicle=self.v, schedule_start=self.start,
+                                   schedule_end=self.start + dt.timedelta(hours=3))
+        b = Booking.objects.get(pk=b.pk)
+        self.assertEqual((b.cost, b.billable_days, b.billable_hours, b.duration),
+                         (Decimal('37.50'), 0, 3, dt.timedelta(hours=3)))
+        self.assertEqual(b.get_cost(), b.calculate_cost())
+        # Extending the booking
+        b.schedule_end = self.start + dt.timedelta(hours=26)
+        b.save()
+        b = Booking.objects.get(pk=b.pk)
+        self.assertEqual((b.cost, b.billable_days, b.billable_hours, b.duration),
+                         (Decimal('105.00'), 1, 2, dt.timedelta(hours=26)))
+
+    def test_unsaved_booking_cost(self):
+        b = Booking(user=self.u, vehicle=self.v, schedule_start=self.start,
+                    schedule_end=self.start + dt.timedelta(hours=2))
+        self.assertEqual(b.get_cost(), 25.0)
+
+    def test_backfill(self):
+        """
+        Bookings without a stored price are priced by the backfill command, in chunks
+        """
+        for hours in range(1, 8):
+            Booking.objects.create(user=self.u, vehicle=self.v, schedule_start=self.start,
+                                   schedule_end=self.start + dt.timedelta(hours=hours))
+        expected = {b.id: (b.cost, b.billable_days, b.billable_hours, b.duration) for b in Booking.objects.all()}
+        Booking.objects.update(cost=None, billable_days=None, billable_hours=None, duration=None)
+        self.assertEqual(total_cost(Booking.objects.all()), sum(cost for cost, _, _, _ in expected.values()))
+        out = StringIO()
+        call_command('backfill_booking_costs', chunk_size=3, stdout=out)
+        self.assertIn('Priced 7 bookings', out.getvalue())
+        self.assertEqual(
+            {b.id: (b.cost, b.billable_days, b.billable_hours, b.duration) for b in Booking.objects.all()}, expected
+        )
+        with self.assertNumQueries(2):
+            self.assertEqual(total_cost(Booking.objects.all()), sum(cost for cost, _, _, _ in expected.values()))
+
+    def test_backfill_all(self):
+        """
+        Repricing every booking after the rates change also updates the site stats
+        """
+        for days in range(1, 4):
+            Booking.objects.create(user=self.u, vehicle=self.v, schedule_start=self.start - dt.timedelta(days=days),
+                                   schedule_end=self.start - dt.timedelta(days=days) + dt.timedelta(hours=2))
+        Booking.objects.create(user=self.u, vehicle=self.v, schedule_start=self.start + dt.timedelta(days=1),
+                               schedule_end=self.start + dt.timedelta(days=1, hours=2))
+        self.assertEqual(get_site_stats().completed_cost, Decimal('75.00'))
+        VehicleType.objects.update(hourly_rate='15.00')
+        call_command('backfill_booking_costs', '--all', stdout=StringIO())
+        self.assertEqual(get_site_stats().completed_cost, Decimal('90.00'))
+        # Bookings that haven't ended yet are added at their new cost when they end
+        with mock.patch('django.utils.timezone.now', return_value=self.start + dt.timedelta(days=2)):
+            self.assertEqual(get_site_stats().completed_cost, Decimal('120.00'))
@@ -0,0 +1,94 @@
+from django.db import connection
+from django.test import TestCase
+from django.utils import timezone
+
+import datetime as dt
+import re
+
+from ..models import Booking, User, Vehicle, Pod, VehicleType
+from ..paging import after_cursor, encode_cursor, PAGE_SIZE
+
+
+class CarshareBookingQueryPlanTests(TestCase):
+    """
+    Captures the query plan of the key booking queries and fails if the database falls back to scanning the whole
+    bookings table instead of using an index
+    """
+    # Patterns identifying a full scan of the bookings table in EXPLAIN output for each backend
+    FULL_SCAN_PATTERNS = {
+        'sqlite': re.compile(r'\bSCAN (TABLE )?carshare_booking\b'),
+        'postgresql': re.compile(r'Seq Scan on carshare_booking\b'),
+    }
+
+    def setUp(self):
+        if connection.vendor not in self.FULL_SCAN_PATTERNS:
+            self.skipTest('Query plan checks are not supported on {0}'.format(connection.vendor))
+        vt = VehicleType.objects.create(description='Premium', hourly_rate=12.50, daily_rate=80.00)
+        p1 = Pod.objects.create(latitude='-39.34523453', longitude='139.53524344', description='Pod 1')
+        self.v1 = Vehicle.objects.create(pod=p1, type=vt, name='Vehicle1', make='Toyota', model='Yaris', year=2012,
+                                         registration='AAA222')
+        self.u1 = User.objects.create(email='test1@test.com', first_name='John', last_name='Doe',
+                                      date_of_birth='1980-01-01')
+        self.now = timezone.now()
+        Booking.objects.create(user=self.u1, vehicle=self.v1, schedule_start=self.now,
+                               schedule_end=self.now + dt.timedelta(hours=1))
+        if connection.vendor == 'postgresql':
+            # Tiny test tables are always cheapest to scan sequentially, so make the planner prefer an index
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+
+    def explain(self, queryset):
+        sql, params = queryset.query.sql_with_params()
+        prefix = 'EXPLAIN QUERY PLAN ' if connection.vendor == 'sqlite' else 'EXPLAIN '
+        with connection.cursor() as cursor:
+            cursor.execute(prefix + sql, params)
+            return '\n'.join(' '.join(str(column) for column in row) for row in cursor.fetchall())
+
+    def assertUsesIndex(self, queryset):
+        plan = self.explain(queryset)
+        self.assertIsNone(
+            self.FULL_SCAN_PATTERNS[connection.vendor].search(plan),
+            'Query scans the whole bookings table:\n{0}\n{1}'.format(queryset.query, plan)
+        )
+
+    def test_vehicle_booking_at(self):
+        self.assertUsesIndex(self.v1.booking_set.at(self.now))
+
+    def test_vehicle_overlapping(self):
+        self.assertUsesIndex(self.v1.booking_set.overlapping(self.now, self.now + dt.timedelta(days=1)))
+
+    def test_user_overlapping(self):
+        self.assertUsesIndex(self.u1.booking_set.overlapping(self.now, self.now + dt.timedelta(days=1)))
+
+    def test_user_current_booking(self):
+        self.assertUsesIndex(self.u1.booking_set.at(self.now))
+
+    def test_user_get_current_booking(self):
+        self.assertUsesIndex(self.u1.booking_set.active().order_by('schedule_end', 'id')[:1])
+
+    def test_user_upcoming_bookings(self):
+        self.assertUsesIndex(
+            self.u1.booking_set.filter(schedule_start__gt=self.now, cancelled__isnull=True).order_by('schedule_start')
+        )
+
+    def test_user_past_bookings(self):
+        self.assertUsesIndex(self.u1.booking_set.filter(schedule_end__lte=self.now).order_by('-schedule_start'))
+
+    def test_recently_ended_costs(self):
+        # Site stats total the stored cost of bookings that ended in a time range
+        self.assertUsesIndex(
+            Booking.objects.filter(schedule_end__gte=self.now - dt.timedelta(hours=1), schedule_end__lt=self.now)
+            .values_list('cost')
+        )
+
+    def test_next_start(self):
+        # Latest possible end of a booking, looked up for booking_extend
+        self.assertUsesIndex(
+            Booking.objects.filter(pk=self.v1.booking_set.get().pk).with_next_start()
+            .values_list('next_vehicle_start', 'next_user_start', 'next_hold_start')
+        )
+
+    def test_booking_history_page(self):
+        # Later pages of My Bookings history, see carshare.paging
+        cursor = encode_cursor(self.u1.booking_set.get())
+        self.assertUsesIndex(after_cursor(self.u1.booking_set.past(self.now), cursor)[:PAGE_SIZE + 1])
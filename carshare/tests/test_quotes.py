@@ -0,0 +1,49 @@
+from django.test import TestCase
+
+import datetime as dt
+
+from ..models import Vehicle, Pod, VehicleType
+from ..pricing import BookingPrice
+from ..quotes import QuoteCache, get_quote, quote_cache
+
+
+class CarshareQuoteCacheTests(TestCase):
+    def setUp(self):
+        quote_cache.clear()
+
+    def test_keyed_by_rates_and_billable_duration(self):
+        cache = QuoteCache()
+        cache.set_quote('12.50', '80.00', dt.timedelta(hours=2), BookingPrice(0, 2, 25.0))
+        self.assertEqual(cache.get_quote('12.50', '80.00', dt.timedelta(hours=1, minutes=30)), (0, 2, 25.0))
+        self.assertIsNone(cache.get_quote('15.00', '80.00', dt.timedelta(hours=2)))
+        self.assertIsNone(cache.get_quote('12.50', '80.00', dt.timedelta(hours=3)))
+
+    def test_invalidate_rates(self):
+        cache = QuoteCache()
+        cache.set_vehicle_rates(10, 1, '12.50', '80.00')
+        cache.set_vehicle_rates(11, 2, '10.00', '100.00')
+        cache.invalidate_vehicle(11)
+        self.assertIsNone(cache.get_vehicle_rates(11))
+        self.assertEqual(cache.get_vehicle_rates(10), (1, '12.50', '80.00'))
+        cache.invalidate_rates()
+        self.assertIsNone(cache.get_vehicle_rates(10))
+
+    def test_invalidated_for_other_workers(self):
+        """
+        Workers sharing the cache backend see rate changes made by any of them
+        """
+        vt = VehicleType.objects.create(description='Premium', hourly_rate='12.50', daily_rate='80.00')
+        pod = Pod.objects.create(latitude='-37.8', longitude='144.9', description='Pod')
+        v = Vehicle.objects.create(pod=pod, type=vt, name='Vehicle', make='Toyota', model='Yaris', year=2012,
+                                   registration='AAA111')
+        start = dt.datetime(2030, 1, 1, 10)
+        other_worker = QuoteCache()
+        other_worker.set_vehicle_rates(v.id, vt.id, vt.hourly_rate, vt.daily_rate)
+        self.assertEqual(get_quote(v.id, start, start + dt.timedelta(hours=2)).cost, 25.0)
+        vt.hourly_rate = '15.00'
+        vt.save()
+        self.assertIsNone(other_worker.get_vehicle_rates(v.id))
+        with self.assertNumQueries(1):
+            self.assertEqual(get_quote(v.id, start, start + dt.timedelta(hours=2)).cost, 30.0)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_quote(v.id, start, start + dt.timedelta(hours=2)).cost, 30.0)
@@ -0,0 +1,132 @@
+from django.test import TestCase
+from django.utils import timezone
+
+import datetime as dt
+
+from ..managers import UserBookingClash, VehicleBookingClash
+from ..models import Booking, BookingHold, User, Vehicle, Pod, VehicleType
+from ..recurring import create_recurring_bookings, find_clashes, sweep_clashes, sweep_overlaps, weekly_intervals
+from ..stats import get_site_stats
+
+
+def aware(*args):
+    return timezone.make_aware(dt.datetime(*args))
+
+
+class CarshareRecurringBookingTests(TestCase):
+    def setUp(self):
+        vt = VehicleType.objects.create(description='Premium', hourly_rate=12.50, daily_rate=80.00)
+        p1 = Pod.objects.create(latitude='-39.34523453', longitude='139.53524344', description='Pod 1')
+        p2 = Pod.objects.create(latitude='-38.34523453', longitude='138.53524344', description='Pod 2')
+        self.v1 = Vehicle.objects.create(pod=p1, type=vt, name='Vehicle1', make='Toyota', model='Yaris', year=2012,
+                                         registration='AAA222')
+        self.v2 = Vehicle.objects.create(pod=p2, type=vt, name='Vehicle2', make='Toyota', model='Yaris', year=2011,
+                                         registration='AAA223')
+        self.u1 = User.objects.create(email='test1@test.com', first_name='John', last_name='Doe',
+                                      date_of_birth='1980-01-01')
+        self.u2 = User.objects.create(email='test2@test.com', first_name='Jane', last_name='Doly',
+                                      date_of_birth='1988-01-01')
+        # Every Monday from 08:00 to 17:00, for 12 weeks
+        self.intervals = weekly_intervals(aware(2999, 1, 6, 8), aware(2999, 1, 6, 17), 12)
+
+    def test_weekly_intervals(self):
+        self.assertEqual(len(self.intervals), 12)
+        self.assertEqual(self.intervals[1], (aware(2999, 1, 13, 8), aware(2999, 1, 13, 17)))
+        self.assertEqual(self.intervals[-1], (aware(2999, 3, 24, 8), aware(2999, 3, 24, 17)))
+
+    def test_weekly_intervals_daylight_saving(self):
+        """
+        Occurrences keep the same local time when daylight saving ends between them
+        """
+        intervals = weekly_intervals(aware(2030, 4, 1, 8), aware(2030, 4, 1, 17), 2)
+        self.assertEqual([timezone.localtime(start).hour for start, end in intervals], [8, 8])
+        self.assertEqual(intervals[1][0] - intervals[0][0], dt.timedelta(weeks=1, hours=1))
+
+    def test_sweep_clashes(self):
+        """
+        Each interval gets the clash a single booking would (vehicle clashes first), and a conflict spanning several
+        intervals clashes with each of them
+        """
+        def booking(user, vehicle, start, end):
+            return Booking(user=user, vehicle=vehicle, schedule_start=start, schedule_end=end)
+
+        conflicts = [
+            # Given out of order
+            booking(self.u1, self.v2, aware(2999, 1, 20, 16), aware(2999, 1, 20, 18)),
+            booking(self.u2, self.v1, aware(2999, 1, 13, 6), aware(2999, 1, 13, 8)),
+            booking(self.u2, self.v1, aware(2999, 1, 6, 16), aware(2999, 1, 6, 17)),
+            booking(self.u1, self.v1, aware(2999, 2, 3, 0), aware(2999, 2, 18, 0)),
+        ]
+        clashes = sweep_clashes(self.u1, self.v1, self.intervals, conflicts)
+        self.assertEqual([type(c) if c else None for c in clashes], [
+            VehicleBookingClash, None, UserBookingClash, None, VehicleBookingClash, VehicleBookingClash,
+            VehicleBookingClash, None, None, None, None, None,
+        ])
+
+    def test_sweep_overlaps(self):
+        """
+        Intervals may overlap each other, and share conflicts
+        """
+        conflicts = [
+            Booking(schedule_start=aware(2999, 1, 1, 10), schedule_end=aware(2999, 1, 1, 12)),
+            Booking(schedule_start=aware(2999, 1, 1, 14), schedule_end=aware(2999, 1, 1, 15)),
+        ]
+        intervals = [
+            (aware(2999, 1, 1, 9), aware(2999, 1, 1, 11)),
+            (aware(2999, 1, 1, 11), aware(2999, 1, 1, 13)),
+            (aware(2999, 1, 1, 12), aware(2999, 1, 1, 16)),
+            (aware(2999, 1, 1, 15), aware(2999, 1, 1, 16)),
+        ]
+        self.assertEqual(sweep_overlaps(intervals, conflicts), [conflicts[:1], conflicts[:1], conflicts[1:], []])
+        # Intervals inside a longer one only overlap the conflicts inside them
+        intervals = [
+            (aware(2999, 1, 1, 9), aware(2999, 1, 1, 16)),
+            (aware(2999, 1, 1, 12), aware(2999, 1, 1, 13)),
+            (aware(2999, 1, 1, 13), aware(2999, 1, 1, 15)),
+        ]
+        self.assertEqual(sweep_overlaps(intervals, conflicts), [conflicts, [], conflicts[1:]])
+
+    def test_find_clashes(self):
+        """
+        Bookings and other users' holds are all found with two queries
+        """
+        Booking.objects.create(user=self.u2, vehicle=self.v1, schedule_start=aware(2999, 1, 13, 10),
+                               schedule_end=aware(2999, 1, 13, 11))
+        Booking.objects.create(user=self.u1, vehicle=self.v2, schedule_start=aware(2999, 1, 27, 16),
+                               schedule_end=aware(2999, 1, 27, 18))
+        Booking.objects.create(user=self.u2, vehicle=self.v2, schedule_start=aware(2999, 2, 3, 10),
+                               schedule_end=aware(2999, 2, 3, 11))
+        Booking.objects.filter(schedule_start=aware(2999, 2, 3, 10)).update(cancelled=timezone.now())
+        BookingHold.objects.hold(self.u2, self.v1, aware(2999, 3, 10, 8), aware(2999, 3, 10, 9))
+        BookingHold.objects.hold(self.u1, self.v1, aware(2999, 3, 17, 8), aware(2999, 3, 17, 9))
+        with self.assertNumQueries(2):
+            clashes = find_clashes(self.u1, self.v1, self.intervals)
+        self.assertEqual([i for i, c in enumerate(clashes) if c], [1, 3, 9])
+
+    def test_create_recurring_bookings(self):
+        """
+        Free weeks are booked with their prices set, and weeks that clash are skipped
+        """
+        Booking.objects.create(user=self.u2, vehicle=self.v1, schedule_start=aware(2999, 1, 13, 10),
+                               schedule_end=aware(2999, 1, 13, 11))
+        num_bookings = get_site_stats().num_bookings
+        bookings, skipped = create_recurring_bookings(self.u1, self.v1, self.intervals)
+        self.assertEqual(len(bookings), 11)
+        self.assertEqual([(start, end) for start, end, clash in skipped], [self.intervals[1]])
+        self.assertIsInstance(skipped[0][2], VehicleBookingClash)
+        created = Booking.objects.filter(user=self.u1).order_by('schedule_start')
+        self.assertEqual(created.count(), 11)
+        self.assertEqual(created[0].cost, 80)
+        self.assertEqual(created[0].duration, dt.timedelta(hours=9))
+        self.assertEqual(get_site_stats().num_bookings, num_bookings + 11)
+        # Booking again skips every week
+        bookings, skipped = create_recurring_bookings(self.u1, self.v1, self.intervals)
+        self.assertEqual((len(bookings), len(skipped)), (0, 12))
+
+    def test_create_constant_queries(self):
+        """
+        The number of queries doesn't depend on the number of weeks
+        """
+        intervals = weekly_intervals(aware(2999, 1, 6, 8), aware(2999, 1, 6, 17), 52)
+        with self.assertNumQueries(8):
+            create_recurring_bookings(self.u1, self.v1, intervals)
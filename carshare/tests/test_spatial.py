@@ -0,0 +1,136 @@
+from django.test import TestCase
+from django.utils import timezone
+
+import datetime as dt
+import random
+
+from ..availability import get_nearest_available_vehicles
+from ..models import Booking, Pod, User, Vehicle, VehicleType
+from ..spatial import (grid_cell, grid_cell_ranges, haversine_km, get_pod_index, PodIndex, GRID_COLUMNS,
+                       MAX_ROW_RANGES, GRID_CELL_DEGREES)
+
+
+class CarshareSpatialGridTests(TestCase):
+    def test_grid_cell_neighbours(self):
+        """
+        Neighbouring cells differ by one column, or by a whole row of columns
+        """
+        cell = grid_cell(-37.815, 144.961)
+        self.assertEqual(grid_cell(-37.815, 144.961 + GRID_CELL_DEGREES), cell + 1)
+        self.assertEqual(grid_cell(-37.815 + GRID_CELL_DEGREES, 144.961), cell + GRID_COLUMNS)
+
+    def test_grid_cell_ranges(self):
+        """
+        Small boxes get one range per row, large boxes a single range
+        """
+        ranges = grid_cell_ranges(-37.85, 144.9, -37.8, 145.0)
+        self.assertEqual(len(ranges), 6)
+        self.assertEqual(ranges[0], (grid_cell(-37.85, 144.9), grid_cell(-37.85, 145.0)))
+        self.assertEqual(len(grid_cell_ranges(-38, 144, -38 + MAX_ROW_RANGES * GRID_CELL_DEGREES * 2, 145)), 1)
+
+    def test_pod_grid_cell_saved(self):
+        """
+        Pods get their grid cell set when saved, and updated when they move
+        """
+        pod = Pod.objects.create(latitude='-37.81499300', longitude='144.96079100', description='Pod 1')
+        self.assertEqual(Pod.objects.get(pk=pod.pk).grid_cell, grid_cell(-37.814993, 144.960791))
+        pod.latitude = '-33.86'
+        pod.save()
+        self.assertEqual(Pod.objects.get(pk=pod.pk).grid_cell, grid_cell(-33.86, 144.960791))
+
+
+class CarshareSpatialFixtureTests(TestCase):
+    fixtures = ['vehicles_pods']
+
+    def test_fixture_pods_have_grid_cells(self):
+        """
+        Pods loaded from fixtures are indexed too
+        """
+        self.assertFalse(Pod.objects.filter(grid_cell__isnull=True).exists())
+
+
+class CarshareNearestPodTests(TestCase):
+    def test_nearest_order_matches_brute_force(self):
+        """
+        Pod index yields every vehicle in the same order as sorting by great circle distance
+        """
+        random.seed(0)
+        pods = [(i, random.uniform(-38.2, -37.5), random.uniform(144.5, 145.5)) for i in range(500)]
+        index = PodIndex(pods)
+        latitude, longitude = -37.8136, 144.9631
+        expected = sorted(pods, key=lambda p: haversine_km(latitude, longitude, p[1], p[2]))
+        results = list(index.nearest(latitude, longitude))
+        self.assertEqual(len(results), len(pods))
+        self.assertEqual([vehicle_id for vehicle_id, _ in results], [p[0] for p in expected])
+        self.assertAlmostEqual(results[0][1], haversine_km(latitude, longitude, expected[0][1], expected[0][2]),
+                               places=6)
+
+    def test_empty_index(self):
+        self.assertEqual(list(PodIndex([]).nearest(-37.8, 144.9)), [])
+
+
+class CarshareNearestAvailableVehicleTests(TestCase):
+    def setUp(self):
+        vt = VehicleType.objects.create(description='Premium', hourly_rate=12.50, daily_rate=80.00)
+        u = User.objects.create(email='test@test.com', first_name='John', last_name='Doe', date_of_birth='2017-01-01')
+        now = timezone.now()
+        self.vehicles = []
+        # Vehicles in a line heading east, each roughly 1km further away
+        for i in range(6):
+            pod = Pod.objects.create(latitude='-37.8', longitude='{0:.8f}'.format(144.9 + i * 0.0115),
+                                     description='Pod {0}'.format(i))
+            self.vehicles.append(Vehicle.objects.create(pod=pod, type=vt, name='Vehicle{0}'.format(i), make='Toyota',
+                                                        model='Yaris', year=2012, registration='AAA11{0}'.format(i)))
+        # Second closest is booked now, third closest is booked tomorrow
+        Booking.objects.create(user=u, vehicle=self.vehicles[1], schedule_start=now - dt.timedelta(hours=1),
+                               schedule_end=now + dt.timedelta(hours=1))
+        self.tomorrow = now + dt.timedelta(days=1)
+        Booking.objects.create(user=u, vehicle=self.vehicles[2], schedule_start=self.tomorrow,
+                               schedule_end=self.tomorrow + dt.timedelta(hours=2))
+
+    def test_nearest_available_now(self):
+        nearest = get_nearest_available_vehicles(-37.8, 144.9, 3)
+        self.assertEqual(nearest, [self.vehicles[0], self.vehicles[2], self.vehicles[3]])
+        self.assertAlmostEqual(nearest[0].distance, 0, places=3)
+        self.assertLess(nearest[1].distance, nearest[2].distance)
+
+    def test_nearest_available_for_window(self):
+        nearest = get_nearest_available_vehicles(-37.8, 144.9, 3, start=self.tomorrow,
+                                                 end=self.tomorrow + dt.timedelta(hours=1))
+        self.assertEqual(nearest, [self.vehicles[0], self.vehicles[1], self.vehicles[3]])
+
+    def test_index_rebuilt_when_vehicle_changes(self):
+        """
+        Deactivating a vehicle removes it from the index
+        """
+        self.assertEqual(len(get_pod_index()), 6)
+        self.vehicles[0].active = False
+        self.vehicles[0].save()
+        self.assertEqual(len(get_pod_index()), 5)
+        self.assertEqual(get_nearest_available_vehicles(-37.8, 144.9, 1), [self.vehicles[2]])
+
+    def test_mostly_booked(self):
+        """
+        Batches grow each round, so finding a free vehicle far away takes few queries
+        """
+        vt = VehicleType.objects.get()
+        u = User.objects.get()
+        now = timezone.now()
+        for i in range(6, 100):
+            pod = Pod.objects.create(latitude='-37.8', longitude='{0:.8f}'.format(144.9 + i * 0.0115),
+                                     description='Pod {0}'.format(i))
+            self.vehicles.append(Vehicle.objects.create(pod=pod, type=vt, name='Vehicle{0}'.format(i), make='Toyota',
+                                                        model='Yaris', year=2012,
+                                                        registration='BBB{0:03d}'.format(i)))
+        Booking.objects.bulk_create([
+            Booking(user=u, vehicle=vehicle, schedule_start=now - dt.timedelta(hours=1),
+                    schedule_end=now + dt.timedelta(hours=1))
+            for vehicle in self.vehicles[:-1] if vehicle != self.vehicles[1]
+        ])
+        get_pod_index()
+        # Batches of 16, 32 and 64 vehicles
+        with self.assertNumQueries(3):
+            self.assertEqual(get_nearest_available_vehicles(-37.8, 144.9, 1), [self.vehicles[-1]])
+
+    def test_fewer_available_than_requested(self):
+        self.assertEqual(len(get_nearest_available_vehicles(-37.8, 144.9, 10)), 5)
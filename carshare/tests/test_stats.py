@@ -0,0 +1,175 @@
+from django.core.management import call_command
+from django.db import connection
+from django.db.models.signals import pre_save
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from unittest import mock
+import datetime as dt
+
+from ..models import Booking, BookingStatsChange, User, Vehicle, Pod, VehicleType, SiteStats
+from ..stats import get_site_stats, rebuild_site_stats
+
+
+class CarshareSiteStatsTests(TestCase):
+    def setUp(self):
+        self.vt = VehicleType.objects.create(description='Premium', hourly_rate=12.50, daily_rate=80.00)
+        p1 = Pod.objects.create(latitude='-39.34523453', longitude='139.53524344', description='Pod 1')
+        self.v1 = Vehicle.objects.create(pod=p1, type=self.vt, name='Vehicle1', make='Toyota', model='Yaris',
+                                         year=2012, registration='AAA222')
+        self.u1 = User.objects.create(email='test1@test.com', first_name='John', last_name='Doe',
+                                      date_of_birth='1980-01-01')
+        self.now = timezone.now()
+        # Completed, 3 hours
+        self.b1 = Booking.objects.create(user=self.u1, vehicle=self.v1, schedule_start=self.now - dt.timedelta(days=2),
+                                         schedule_end=self.now - dt.timedelta(days=2) + dt.timedelta(hours=3))
+        # In progress
+        self.b2 = Booking.objects.create(user=self.u1, vehicle=self.v1, schedule_start=self.now - dt.timedelta(hours=1),
+                                         schedule_end=self.now + dt.timedelta(hours=1))
+
+    def assertMatchesRecount(self, stats):
+        """
+        Stats match counting everything from scratch, the way the About Us page used to
+        """
+        completed = Booking.objects.filter(schedule_end__lt=timezone.now())
+        self.assertEqual(stats.num_vehicles, Vehicle.objects.count())
+        self.assertEqual(stats.num_pods, Pod.objects.count())
+        self.assertEqual(stats.num_bookings, Booking.objects.count())
+        self.assertAlmostEqual(float(stats.completed_cost), sum(b.calculate_cost() for b in completed))
+
+    def test_built_on_first_use(self):
+        self.assertFalse(SiteStats.objects.exists())
+        stats = get_site_stats()
+        self.assertEqual(stats.num_bookings, 2)
+        self.assertAlmostEqual(float(stats.completed_cost), 37.50)
+        self.assertMatchesRecount(stats)
+
+    def test_counts_follow_changes(self):
+        """
+        Creating and deleting objects updates the counts without recounting
+        """
+        get_site_stats()
+        p2 = Pod.objects.create(latitude='-37.8', longitude='144.9', description='Pod 2')
+        v2 = Vehicle.objects.create(pod=p2, type=self.vt, name='Vehicle2', make='Toyota', model='Yaris', year=2012,
+                                    registration='AAA333')
+        Booking.objects.create(user=self.u1, vehicle=v2, schedule_start=self.now + dt.timedelta(days=1),
+                               schedule_end=self.now + dt.timedelta(days=1, hours=2))
+        self.assertMatchesRecount(get_site_stats())
+        self.b1.delete()
+        self.assertMatchesRecount(get_site_stats())
+        # Deleting the pod also deletes its vehicle and bookings
+        p2.delete()
+        stats = get_site_stats()
+        self.assertEqual(stats.num_bookings, 1)
+        self.assertMatchesRecount(stats)
+
+    def test_completed_booking_changes(self):
+        """
+        Editing a booking that has already been totalled replaces its cost
+        """
+        get_site_stats()
+        self.b1.schedule_end += dt.timedelta(hours=2)
+        self.b1.save()
+        stats = get_site_stats()
+        self.assertAlmostEqual(float(stats.completed_cost), 62.50)
+        self.assertMatchesRecount(stats)
+        # Cancelling doesn't change the totals
+        self.b1.cancelled = timezone.now()
+        self.b1.save()
+        self.assertMatchesRecount(get_site_stats())
+        # Backdated bookings are added straight away
+        Booking.objects.create(user=self.u1, vehicle=self.v1, schedule_start=self.now - dt.timedelta(days=5),
+                               schedule_end=self.now - dt.timedelta(days=5) + dt.timedelta(hours=1))
+        self.assertMatchesRecount(get_site_stats())
+
+    def test_bookings_added_when_they_end(self):
+        """
+        Bookings that end after the stats were last read are added on the next read
+        """
+        self.assertAlmostEqual(float(get_site_stats().completed_cost), 37.50)
+        # The booking in progress ends
+        with mock.patch('django.utils.timezone.now', return_value=self.now + dt.timedelta(hours=2)):
+            stats = get_site_stats()
+            self.assertAlmostEqual(float(stats.completed_cost), 62.50)
+            self.assertMatchesRecount(stats)
+            # Each booking is only added once
+            self.assertMatchesRecount(get_site_stats())
+            self.assertMatchesRecount(SiteStats.objects.get())
+            self.assertFalse(BookingStatsChange.objects.exists())
+
+    def test_totals_moved_while_saving(self):
+        """
+        A booking saved while another request adds it to the totals is neither added twice nor missed
+        """
+        get_site_stats()
+        booking = Booking.objects.get(pk=self.b2.pk)
+
+        def read_stats(sender, instance, **kwargs):
+            # Another request reads the stats after the booking's old version has been remembered
+            get_site_stats()
+        with mock.patch('django.utils.timezone.now', return_value=self.now + dt.timedelta(hours=2)):
+            pre_save.connect(read_stats, sender=Booking)
+            try:
+                booking.schedule_end += dt.timedelta(minutes=30)
+                booking.save()
+            finally:
+                pre_save.disconnect(read_stats, sender=Booking)
+            stats = get_site_stats()
+            self.assertAlmostEqual(float(stats.completed_cost), 75.00)
+            self.assertMatchesRecount(stats)
+
+    def test_save_queries(self):
+        """
+        Saving a booking only inserts a change, without a query for its previous version or touching the stats row
+        """
+        get_site_stats()
+        with CaptureQueriesContext(connection) as queries:
+            Booking.objects.create(user=self.u1, vehicle=self.v1, schedule_start=self.now + dt.timedelta(days=1),
+                                   schedule_end=self.now + dt.timedelta(days=1, hours=2))
+            booking = Booking.objects.select_related('vehicle__type').get(pk=self.b2.pk)
+            booking.schedule_end += dt.timedelta(hours=1)
+            booking.save()
+            # Changes that don't affect the stats aren't recorded
+            booking.cancelled = timezone.now()
+            booking.save()
+        self.assertEqual(len(queries), 6)
+        self.assertFalse(any('sitestats' in query['sql'] for query in queries))
+        self.assertMatchesRecount(get_site_stats())
+
+    def test_rebuild(self):
+        get_site_stats()
+        SiteStats.objects.update(num_bookings=100, completed_cost=0)
+        self.assertMatchesRecount(rebuild_site_stats())
+        self.assertMatchesRecount(get_site_stats())
+
+    def test_loaddata(self):
+        """
+        Loading fixtures discards the stats once, rather than for every object loaded
+        """
+        get_site_stats()
+        with CaptureQueriesContext(connection) as queries:
+            call_command('loaddata', 'vehicles_pods', verbosity=0)
+        self.assertEqual(sum('sitestats' in query['sql'] for query in queries), 1)
+        self.assertFalse(SiteStats.objects.exists())
+        stats = get_site_stats()
+        self.assertEqual(stats.num_vehicles, Vehicle.objects.count())
+        self.assertEqual(stats.num_pods, Pod.objects.count())
+
+    def test_constant_queries(self):
+        """
+        Reading the stats takes the same number of queries however many bookings there are
+        """
+        get_site_stats()
+        with self.assertNumQueries(1):
+            get_site_stats()
+        for i in range(3, 20):
+            Booking.objects.create(user=self.u1, vehicle=self.v1,
+                                   schedule_start=self.now - dt.timedelta(days=i),
+                                   schedule_end=self.now - dt.timedelta(days=i) + dt.timedelta(hours=3))
+        # The new bookings have already ended, so are added to the totals by one read (in a savepoint in tests)
+        with self.assertNumQueries(8):
+            get_site_stats()
+        with self.assertNumQueries(1):
+            stats = get_site_stats()
+        self.assertMatchesRecount(stats)
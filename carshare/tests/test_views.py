@@ -1,11 +1,22 @@
 from django.core import mail
-from django.test import TestCase, override_settings
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.utils import timezone
 
+from io import StringIO
+from unittest import mock
 import datetime as dt
+import json
+import re
+import shutil
+import tempfile
+import threading
 
-from ..models import Booking, User, Vehicle, Pod, VehicleType, Invoice
+from ..models import Booking, BookingHold, User, Vehicle, Pod, VehicleType, Invoice, WaitlistEntry
+from ..paging import PAGE_SIZE
 
 
 # Tests do not work with whitenoise static file storage, so we use the default storage for tests
@@ -30,6 +41,32 @@ class CarshareIndexViewTests(TestCase):
         self.assertContains(response, 'Home')
 
 
+@override_settings(STATICFILES_STORAGE=STATICFILES_STORAGE_FOR_TESTS)
+class CarshareAboutUsViewTests(TestCase):
+
+    def test_about_us_stats(self):
+        """
+        About Us shows totals from the site stats, in a constant number of queries
+        """
+        vt = VehicleType.objects.create(description='Premium', hourly_rate=12.50, daily_rate=80.00)
+        u = User.objects.create(email='test@test.com', first_name='John', last_name='Doe', date_of_birth='1980-01-01')
+        now = timezone.now()
+        for i in range(3):
+            pod = Pod.objects.create(latitude='-37.8', longitude='144.9', description='Pod {0}'.format(i))
+            v = Vehicle.objects.create(pod=pod, type=vt, name='Vehicle{0}'.format(i), make='Toyota', model='Yaris',
+                                       year=2012, registration='AAA11{0}'.format(i))
+            Booking.objects.create(user=u, vehicle=v, schedule_start=now - dt.timedelta(days=1),
+                                   schedule_end=now - dt.timedelta(days=1) + dt.timedelta(hours=2))
+        self.client.get(reverse('carshare:about_us'))
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('carshare:about_us'))
+        self.assertEqual(response.context['num_vehicles'], 3)
+        self.assertEqual(response.context['num_locations'], 3)
+        self.assertEqual(response.context['num_shares'], 3)
+        # 3 x $75 owner cost less 3 x $25
+        self.assertEqual(response.context['estimated_savings'], 150)
+
+
 @override_settings(STATICFILES_STORAGE=STATICFILES_STORAGE_FOR_TESTS)
 class CarshareContactUsViewTests(TestCase):
 
@@ -53,6 +90,117 @@ class CarshareContactUsViewTests(TestCase):
         self.assertEqual(mail.outbox[0].to, ['admin@vroomcs.org'])
 
 
+@override_settings(STATICFILES_STORAGE=STATICFILES_STORAGE_FOR_TESTS)
+class CarshareFindACarViewTests(TestCase):
+    # Bounding box around the Melbourne CBD
+    bounds = {'south': -37.85, 'west': 144.9, 'north': -37.75, 'east': 145.0}
+
+    def setUp(self):
+        self.vt = VehicleType.objects.create(description='Premium', hourly_rate=12.50, daily_rate=80.00)
+        self.u1 = User.objects.create(email='test1@test.com', first_name='John', last_name='Doe',
+                                      date_of_birth='1980-01-01')
+
+    def create_vehicles(self, count, latitude='-37.8', longitude='144.9623'):
+        now = timezone.now()
+        for i in range(Vehicle.objects.count(), Vehicle.objects.count() + count):
+            pod = Pod.objects.create(latitude=latitude, longitude=longitude, description='Pod {0}'.format(i))
+            v = Vehicle.objects.create(pod=pod, type=self.vt, name='Vehicle{0}'.format(i), make='Toyota',
+                                       model='Yaris', year=2012, registration='AA{0:04d}'.format(i))
+            # Every second vehicle is currently booked
+            if i % 2:
+                Booking.objects.create(user=self.u1, vehicle=v, schedule_start=now - dt.timedelta(hours=1),
+                                       schedule_end=now + dt.timedelta(hours=1))
+
+    def get_markers(self, **extra):
+        params = dict(self.bounds, **extra)
+        response = self.client.get(reverse('carshare:ajax_vehicle_markers'), params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()['markers']
+
+    def test_find_a_car(self):
+        """
+        Map page renders without inlining vehicles
+        """
+        self.create_vehicles(2)
+        response = self.client.get(reverse('carshare:find_a_car'))
+        self.assertEqual(response.status_code, 200)
+        self.assertNotContains(response, 'Vehicle0')
+
+    def test_availability_shown(self):
+        """
+        Markers flag booked vehicles as unavailable
+        """
+        self.create_vehicles(2)
+        self.assertEqual([m['available'] for m in self.get_markers()], [True, False])
+
+    def test_markers_within_bounds(self):
+        """
+        Only vehicles whose pod is inside the bounding box are returned
+        """
+        self.create_vehicles(1)
+        self.create_vehicles(1, latitude='-33.86', longitude='151.21')
+        markers = self.get_markers()
+        self.assertEqual([m['carname'] for m in markers], ['Vehicle0'])
+        self.assertEqual(markers[0]['lat'], -37.8)
+        sydney = self.get_markers(south=-34, west=151, north=-33, east=152)
+        self.assertEqual([m['carname'] for m in sydney], ['Vehicle1'])
+
+    def test_nearest_vehicles(self):
+        """
+        Nearest vehicles endpoint returns free vehicles, closest first
+        """
+        self.create_vehicles(4)
+        self.create_vehicles(2, latitude='-37.81', longitude='144.9623')
+        response = self.client.get(reverse('carshare:ajax_nearest_vehicles'), {'lat': -37.811, 'lng': 144.9623, 'k': 2})
+        markers = response.json()['markers']
+        # Vehicle5 is closer but booked
+        self.assertEqual(markers[0]['carname'], 'Vehicle4')
+        self.assertIn(markers[1]['carname'], ['Vehicle0', 'Vehicle2'])
+        self.assertLess(markers[0]['distance'], markers[1]['distance'])
+
+    def test_nearest_vehicles_requires_location(self):
+        response = self.client.get(reverse('carshare:ajax_nearest_vehicles'), {'lat': -37.8})
+        self.assertIn('error', response.json())
+
+    def test_vehicle_type_quotes(self):
+        """
+        Quotes endpoint prices every vehicle type for a time window
+        """
+        self.create_vehicles(3)
+        tomorrow = timezone.localtime() + dt.timedelta(days=1)
+        response = self.client.get(reverse('carshare:ajax_vehicle_type_quotes'), {
+            'booking_start_date': tomorrow.strftime('%d/%m/%Y'),
+            'booking_start_time': '10:00',
+            'booking_end_date': tomorrow.strftime('%d/%m/%Y'),
+            'booking_end_time': '12:00',
+        })
+        quotes = response.json()['quotes']
+        self.assertEqual(len(quotes), 1)
+        self.assertEqual(quotes[0]['description'], self.vt.description)
+        self.assertEqual(quotes[0]['hours'], 2)
+        # Vehicles are only booked around now
+        self.assertEqual(quotes[0]['free'], 3)
+        self.assertIn('error', self.client.get(reverse('carshare:ajax_vehicle_type_quotes')).json())
+
+    def test_markers_require_bounds(self):
+        """
+        Requests without a bounding box get an error
+        """
+        response = self.client.get(reverse('carshare:ajax_vehicle_markers'))
+        self.assertIn('error', response.json())
+
+    def test_constant_queries(self):
+        """
+        Markers are fetched in the same number of queries regardless of fleet size
+        """
+        self.create_vehicles(2)
+        with self.assertNumQueries(1):
+            self.get_markers()
+        self.create_vehicles(20)
+        with self.assertNumQueries(1):
+            self.get_markers()
+
+
 @override_settings(STATICFILES_STORAGE=STATICFILES_STORAGE_FOR_TESTS)
 class CarshareBookingViewTests(TestCase):
     fixtures = ['email_templates']
@@ -80,6 +228,108 @@ class CarshareBookingViewTests(TestCase):
                                schedule_start=timezone.make_aware(dt.datetime(year=2999, month=1, day=1, hour=3)),
                                schedule_end=timezone.make_aware(dt.datetime(year=2999, month=1, day=1, hour=6)))
 
+    def quote(self, method='get', **times):
+        data = {
+            'booking_start_date': '01/01/2999',
+            'booking_start_time': '08:00',
+            'booking_end_date': '02/01/2999',
+            'booking_end_time': '10:00',
+        }
+        data.update(times)
+        url = reverse('carshare:ajax_booking_calculate_cost', kwargs={'vehicle_id': self.v2.id})
+        return getattr(self.client, method)(url, data)
+
+    def test_calculate_cost(self):
+        """
+        Quotes can be requested with GET, which browsers may cache, or POST
+        """
+        self.client.login(email='user@test.com', password='bigbadtestuser')
+        response = self.quote()
+        self.assertEqual(json.loads(response.content.decode()), {'total': '$105.00', 'days': 1, 'hours': 2})
+        self.assertIn('max-age', response['Cache-Control'])
+        response = self.quote(method='post', booking_end_time='09:00')
+        self.assertEqual(json.loads(response.content.decode()), {'total': '$92.50', 'days': 1, 'hours': 1})
+        self.assertFalse(response.has_header('Cache-Control'))
+        self.assertIn('error', json.loads(self.quote(booking_end_date='01/01/2999', booking_end_time='07:00')
+                                          .content.decode()))
+
+    def test_calculate_cost_cached(self):
+        """
+        Repeated quotes don't touch the database, until the vehicle type's rates change
+        """
+        self.client.login(email='user@test.com', password='bigbadtestuser')
+        self.quote()
+        with self.assertNumQueries(0):
+            response = self.quote(booking_start_time='09:00', booking_end_time='11:00')
+        self.assertEqual(json.loads(response.content.decode())['total'], '$105.00')
+        vt = self.v2.type
+        vt.hourly_rate = 15
+        vt.save()
+        response = self.quote()
+        self.assertEqual(json.loads(response.content.decode())['total'], '$110.00')
+
+    def test_booking_timeline(self):
+        """
+        Booking timeline shows the vehicle's existing bookings as unavailable hours
+        """
+        self.client.login(email='user@test.com', password='bigbadtestuser')
+        kwargs = {
+            'vehicle_id': self.v1.id,
+            'year': '2999',
+            'month': '1',
+            'day': '1',
+        }
+        response = self.client.get(reverse('carshare:booking_create_date', kwargs=kwargs))
+        self.assertEqual(response.status_code, 200)
+        hours = response.context['hours']
+        self.assertEqual(len(hours), 24)
+        self.assertEqual(hours[0], 'unavailable')
+        self.assertEqual(hours[1], 'available')
+        self.assertEqual(hours[5], 'unavailable')
+        self.assertEqual(hours[6], 'available')
+        # Other dates are drawn from the availability endpoint without reloading
+        self.assertContains(response, reverse('carshare:ajax_vehicle_availability', kwargs={'vehicle_id': self.v1.id}))
+
+    def test_vehicle_availability(self):
+        """
+        Availability endpoint returns per-hour bitmaps and honours ETags
+        """
+        url = reverse('carshare:ajax_vehicle_availability', kwargs={'vehicle_id': self.v1.id})
+        # Like the timeline, only for logged in users
+        response = self.client.get(url, {'start': '2999-01-01', 'days': 2})
+        self.assertEqual(response.status_code, 302)
+        self.assertIn('login', response['Location'])
+        self.client.login(email='user@test.com', password='bigbadtestuser')
+        response = self.client.get(url, {'start': '2999-01-01', 'days': 2})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['available'], ['011000' + '1' * 18, '1' * 24])
+        self.assertEqual(data['booked_by_user'], ['0' * 24, '0' * 24])
+        not_modified = self.client.get(url, {'start': '2999-01-01', 'days': 2}, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+        too_long = self.client.get(url, {'start': '2999-01-01', 'days': Booking.MAX_LENGTH_DAYS + 1})
+        self.assertIn('error', too_long.json())
+
+    def test_find_a_car_time_window_filter(self):
+        """
+        Map markers only include vehicles that are free for the whole of the requested window
+        """
+        search = {
+            'south': -40,
+            'west': 138,
+            'north': -38,
+            'east': 140,
+            'booking_start_date': '01/01/2999',
+            'booking_start_time': '02:00',
+            'booking_end_date': '01/01/2999',
+            'booking_end_time': '04:00',
+        }
+        response = self.client.get(reverse('carshare:ajax_vehicle_markers'), search)
+        self.assertEqual([m['id'] for m in response.json()['markers']], [self.v2.id])
+        search['booking_end_time'] = '03:00'
+        response = self.client.get(reverse('carshare:ajax_vehicle_markers'), search)
+        self.assertEqual([m['id'] for m in response.json()['markers']], [self.v1.id, self.v2.id])
+
     def test_valid_booking(self):
         """
         Booking for a time period that is not already booked by the user or the vehicle is successfully created
@@ -103,7 +353,8 @@ class CarshareBookingViewTests(TestCase):
         self.assertEqual(get_response.status_code, 200)
         post_response = self.client.post(reverse('carshare:booking_create_final', kwargs=kwargs), data=form)
         self.assertEqual(post_response.status_code, 200)
-        confirm_response = self.client.get(reverse('carshare:booking_confirm'))
+        confirm_response = self.client.post(reverse('carshare:booking_confirm'),
+                                            data={'draft': post_response.context['draft']})
         booking_id = User.objects.get(email='user@test.com').booking_set.first().id
         self.assertRedirects(confirm_response, reverse('carshare:booking_detail', kwargs={'booking_id': booking_id}))
 
@@ -156,7 +407,8 @@ class CarshareBookingViewTests(TestCase):
         self.assertEqual(get_response.status_code, 200)
         post_response = self.client.post(reverse('carshare:booking_create_final', kwargs=kwargs), data=form)
         self.assertEqual(post_response.status_code, 200)
-        confirm_response = self.client.get(reverse('carshare:booking_confirm'))
+        confirm_response = self.client.post(reverse('carshare:booking_confirm'),
+                                            data={'draft': post_response.context['draft']})
         booking_id = User.objects.get(email='user@test.com').booking_set.first().id
         self.assertRedirects(confirm_response, reverse('carshare:booking_detail', kwargs={'booking_id': booking_id}))
         # Then try to create another booking for the same time period but different vehicle
@@ -166,6 +418,222 @@ class CarshareBookingViewTests(TestCase):
         self.assertEqual(post_response.status_code, 200)
         self.assertContains(post_response, 'You already have a booking within the selected time frame')
 
+    def test_slot_held_during_review(self):
+        """
+        Reviewing a booking holds the slot, so another user can't book it until the booking is confirmed
+        """
+        form = {
+            'booking_start_date': '01/01/3000',
+            'booking_start_time': '00:00',
+            'booking_end_date': '01/01/3000',
+            'booking_end_time': '01:00',
+        }
+        kwargs = {
+            'vehicle_id': self.v1.id,
+            'year': '2000',
+            'month': '1',
+            'day': '1',
+            'hour': '0',
+        }
+        User.objects.create_user(email='other@test.com', password='bigbadtestuser', first_name='Other',
+                                 last_name='User', date_of_birth=dt.date(1980, 1, 1))
+        self.client.login(email='user@test.com', password='bigbadtestuser')
+        post_response = self.client.post(reverse('carshare:booking_create_final', kwargs=kwargs), data=form)
+        self.assertTemplateUsed(post_response, 'carshare/bookings/review.html')
+        self.assertContains(post_response, 'This car is held for you until')
+        # Another user can't review or confirm the held slot
+        other = Client()
+        other.login(email='other@test.com', password='bigbadtestuser')
+        other_response = other.post(reverse('carshare:booking_create_final', kwargs=kwargs), data=form)
+        self.assertContains(other_response, 'The selected vehicle is unavailable within the chosen times')
+        # The holder confirms, which releases the hold
+        confirm_response = self.client.post(reverse('carshare:booking_confirm'),
+                                            data={'draft': post_response.context['draft']})
+        booking = User.objects.get(email='user@test.com').booking_set.get()
+        self.assertRedirects(confirm_response, reverse('carshare:booking_detail', kwargs={'booking_id': booking.id}))
+        self.assertFalse(BookingHold.objects.exists())
+
+    def test_drafts_in_separate_tabs(self):
+        """
+        Each review page carries its own draft, so bookings reviewed side by side can each be confirmed
+        """
+        User.objects.create_user(email='other@test.com', password='bigbadtestuser', first_name='Other',
+                                 last_name='User', date_of_birth=dt.date(1980, 1, 1))
+        other = Client()
+        other.login(email='other@test.com', password='bigbadtestuser')
+        self.client.login(email='user@test.com', password='bigbadtestuser')
+        drafts = []
+        forms = []
+        for vehicle, start, end in [(self.v1, '00:00', '01:00'), (self.v2, '02:00', '03:00')]:
+            kwargs = {'vehicle_id': vehicle.id, 'year': '2000', 'month': '1', 'day': '1', 'hour': '0'}
+            form = {
+                'booking_start_date': '01/01/3000',
+                'booking_start_time': start,
+                'booking_end_date': '01/01/3000',
+                'booking_end_time': end,
+            }
+            post_response = self.client.post(reverse('carshare:booking_create_final', kwargs=kwargs), data=form)
+            self.assertTemplateUsed(post_response, 'carshare/bookings/review.html')
+            drafts.append(post_response.context['draft'])
+            forms.append((kwargs, form))
+        # Reviewing the second booking doesn't release the first tab's hold, and neither does confirming it
+        kwargs, form = forms[0]
+        for draft in reversed(drafts):
+            other_response = other.post(reverse('carshare:booking_create_final', kwargs=kwargs), data=form)
+            self.assertContains(other_response, 'The selected vehicle is unavailable within the chosen times')
+            confirm_response = self.client.post(reverse('carshare:booking_confirm'), data={'draft': draft})
+            self.assertEqual(confirm_response.status_code, 302)
+        user = User.objects.get(email='user@test.com')
+        self.assertEqual(set(user.booking_set.values_list('vehicle_id', flat=True)), {self.v1.id, self.v2.id})
+        # Confirming the same draft again finds the booking already made
+        confirm_response = self.client.post(reverse('carshare:booking_confirm'), data={'draft': drafts[0]})
+        self.assertEqual(user.booking_set.count(), 2)
+        self.assertRedirects(confirm_response, reverse('carshare:booking_create', args=[self.v1.id]),
+                             fetch_redirect_response=False)
+
+    def test_confirm_invalid_draft(self):
+        self.client.login(email='user@test.com', password='bigbadtestuser')
+        response = self.client.post(reverse('carshare:booking_confirm'), data={'draft': 'not-a-draft'})
+        self.assertRedirects(response, reverse('carshare:index'), fetch_redirect_response=False)
+        self.assertFalse(User.objects.get(email='user@test.com').booking_set.exists())
+
+    def test_recurring_booking(self):
+        """
+        Weekly bookings skip the weeks the vehicle is booked, and send one email for the rest
+        """
+        self.client.login(email='user@test.com', password='bigbadtestuser')
+        url = reverse('carshare:booking_recurring', kwargs={'vehicle_id': self.v1.id})
+        self.assertEqual(self.client.get(url).status_code, 200)
+        data = {
+            'booking_start_date': '01/01/2999',
+            'booking_start_time': '02:00',
+            'booking_end_date': '01/01/2999',
+            'booking_end_time': '04:00',
+            'weeks': 4,
+        }
+        response = self.client.post(url, data=data, follow=True)
+        self.assertRedirects(response, reverse('carshare:my_bookings'))
+        self.assertContains(response, '3 bookings created successfully')
+        self.assertContains(response, '01/01/2999 02:00 was not booked')
+        user = User.objects.get(email='user@test.com')
+        self.assertEqual(user.booking_set.count(), 3)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].subject, 'Vroom Weekly Bookings')
+        # Every week is now booked
+        response = self.client.post(url, data=data)
+        self.assertContains(response, 'None of the selected times are available')
+        self.assertEqual(user.booking_set.count(), 3)
+        self.assertEqual(len(mail.outbox), 1)
+        # Bookings can't run into the next week's
+        response = self.client.post(url, data=dict(data, booking_end_date='09/01/2999'))
+        self.assertContains(response, 'Recurring bookings cannot be longer than a week')
+
+    def test_waitlist_offered_on_cancel(self):
+        """
+        Users who can't book a slot can join the waitlist for it, and are emailed when it is cancelled
+        """
+        form = {
+            'booking_start_date': '01/01/2999',
+            'booking_start_time': '00:00',
+            'booking_end_date': '01/01/2999',
+            'booking_end_time': '01:00',
+        }
+        self.client.login(email='user@test.com', password='bigbadtestuser')
+        kwargs = {'vehicle_id': self.v1.id, 'year': '2999', 'month': '1', 'day': '1', 'hour': '0'}
+        response = self.client.post(reverse('carshare:booking_create_final', kwargs=kwargs), data=form)
+        self.assertContains(response, 'Join Waitlist')
+        response = self.client.post(reverse('carshare:waitlist_join', kwargs={'vehicle_id': self.v1.id}), data=form,
+                                    follow=True)
+        self.assertRedirects(response, reverse('carshare:my_bookings'))
+        self.assertContains(response, 'You are on the waitlist')
+        self.assertEqual(len(response.context['waitlist']), 1)
+
+        owner = Client()
+        owner.force_login(self.b1.user)
+        owner.get(reverse('carshare:booking_cancel', kwargs={'booking_id': self.b1.id}))
+        self.assertEqual([m.subject for m in mail.outbox], ['Vroom Booking Cancelled', 'Vroom - A Car is Free'])
+        self.assertEqual(mail.outbox[1].to, ['user@test.com'])
+        # Offered entries are no longer shown as waiting
+        response = self.client.get(reverse('carshare:my_bookings'))
+        self.assertEqual(len(response.context['waitlist']), 0)
+
+    def test_waitlist_leave(self):
+        user = User.objects.get(email='user@test.com')
+        entry = WaitlistEntry.objects.create(user=user, vehicle=self.v1, schedule_start=self.b1.schedule_start,
+                                             schedule_end=self.b1.schedule_end)
+        self.client.login(email='user@test.com', password='bigbadtestuser')
+        url = reverse('carshare:waitlist_leave', kwargs={'entry_id': entry.id})
+        self.assertContains(self.client.get(reverse('carshare:my_bookings')), url)
+        self.client.post(url)
+        self.assertFalse(WaitlistEntry.objects.exists())
+
+    def test_pay_booking_queues_invoice(self):
+        """
+        Paying returns without rendering the invoice, which is emailed by a worker. Its status can be polled.
+        """
+        user = User.objects.get(email='user@test.com')
+        booking = Booking.objects.create(user=user, vehicle=self.v2, schedule_start=self.b1.schedule_start,
+                                         schedule_end=self.b1.schedule_end)
+        self.client.login(email='user@test.com', password='bigbadtestuser')
+        status_url = reverse('carshare:ajax_booking_invoice_status', kwargs={'booking_id': booking.id})
+        self.assertEqual(self.client.get(status_url).status_code, 404)
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        with override_settings(MEDIA_ROOT=media_root), \
+                mock.patch('carshare.invoices.render_invoice_pdf', return_value=b'%PDF') as render_invoice_pdf:
+            response = self.client.get(reverse('carshare:booking_pay', kwargs={'booking_id': booking.id}),
+                                       follow=True)
+            self.assertFalse(render_invoice_pdf.called)
+            self.assertContains(response, 'Your invoice is being prepared')
+            self.assertEqual(len(mail.outbox), 0)
+            self.assertEqual(self.client.get(status_url).json(), {'status': 'pending'})
+            call_command('run_jobs', once=True, stdout=StringIO())
+        self.assertEqual(self.client.get(status_url).json(), {'status': 'done'})
+        self.assertEqual(mail.outbox[0].subject, 'Vroom Booking Invoice')
+        self.assertEqual(mail.outbox[0].attachments[0][:2], ('invoice_{0}.pdf'.format(booking.invoice.id), b'%PDF'))
+        response = self.client.get(reverse('carshare:booking_detail', kwargs={'booking_id': booking.id}))
+        self.assertContains(response, 'Your invoice has been emailed to you')
+
+    def test_extend_booking_limited_by_next_booking(self):
+        """
+        Bookings can be extended up to the start of the next booking of the vehicle, but no further
+        """
+        user = User.objects.get(email='user@test.com')
+        booking = Booking.objects.create(user=user, vehicle=self.v1, schedule_start=self.b1.schedule_end,
+                                         schedule_end=self.b1.schedule_end + dt.timedelta(hours=1))
+        self.client.login(email='user@test.com', password='bigbadtestuser')
+        url = reverse('carshare:booking_extend', kwargs={'booking_id': booking.id})
+        response = self.client.get(url)
+        self.assertEqual(response.context['latest_end'], self.b2.schedule_start)
+        response = self.client.post(url, data={'new_end_date': '01/01/2999', 'new_end_time': '04:00'})
+        self.assertContains(response, 'The latest end time you can choose is 01/01/2999 03:00')
+        response = self.client.post(url, data={'new_end_date': '01/01/2999', 'new_end_time': '03:00'})
+        self.assertRedirects(response, reverse('carshare:booking_detail', kwargs={'booking_id': booking.id}))
+        booking.refresh_from_db()
+        self.assertEqual(booking.schedule_end, self.b2.schedule_start)
+
+    def test_extend_booking_quote(self):
+        """
+        Extension quotes give the latest possible end, and the cost of the extended booking and how much more it costs
+        """
+        user = User.objects.get(email='user@test.com')
+        booking = Booking.objects.create(user=user, vehicle=self.v1, schedule_start=self.b1.schedule_end,
+                                         schedule_end=self.b1.schedule_end + dt.timedelta(hours=1))
+        self.client.login(email='user@test.com', password='bigbadtestuser')
+        url = reverse('carshare:ajax_booking_extend_quote', kwargs={'booking_id': booking.id})
+        response = self.client.get(url)
+        self.assertEqual(response.json(), {'latest_end': timezone.localtime(self.b2.schedule_start).isoformat()})
+        response = self.client.get(url, {'new_end_date': '01/01/2999', 'new_end_time': '03:00'})
+        quote = response.json()
+        self.assertEqual(quote['total'], '$25.00')
+        self.assertEqual(quote['difference'], '$12.50')
+        self.assertEqual((quote['days'], quote['hours']), (0, 2))
+        response = self.client.get(url, {'new_end_date': '01/01/2999', 'new_end_time': '04:00'})
+        self.assertIn('error', response.json())
+        # Only the booking's owner can get quotes for it
+        response = self.client.get(reverse('carshare:ajax_booking_extend_quote', kwargs={'booking_id': self.b1.id}))
+        self.assertEqual(response.status_code, 404)
+
     def test_booking_detail_with_existing_id(self):
         """
         Booking detail page shows correct booking details for an existing booking
@@ -191,7 +659,8 @@ class CarshareBookingViewTests(TestCase):
         self.assertEqual(get_response.status_code, 200)
         post_response = self.client.post(reverse('carshare:booking_create_final', kwargs=kwargs), data=form)
         self.assertEqual(post_response.status_code, 200)
-        confirm_response = self.client.get(reverse('carshare:booking_confirm'))
+        confirm_response = self.client.post(reverse('carshare:booking_confirm'),
+                                            data={'draft': post_response.context['draft']})
         booking = User.objects.get(email='user@test.com').booking_set.first()
         self.assertRedirects(confirm_response, reverse('carshare:booking_detail', kwargs={'booking_id': booking.id}))
         # Get detail page for the booking
@@ -202,6 +671,78 @@ class CarshareBookingViewTests(TestCase):
         self.assertContains(response, str(booking.vehicle.pod.description))
 
 
+# Signed cookie sessions keep session writes out of the database, so that concurrent requests only contend on bookings
+@override_settings(STATICFILES_STORAGE=STATICFILES_STORAGE_FOR_TESTS,
+                   SESSION_ENGINE='django.contrib.sessions.backends.signed_cookies')
+class CarshareBookingConfirmConcurrencyTests(TransactionTestCase):
+    fixtures = ['email_templates']
+    num_requests = 10
+
+    def setUp(self):
+        vt = VehicleType.objects.create(description='Premium', hourly_rate=12.50, daily_rate=80.00)
+        p1 = Pod.objects.create(latitude='-39.34523453', longitude='139.53524344', description='Pod 1')
+        self.v1 = Vehicle.objects.create(pod=p1, type=vt, name='Vehicle1', make='Toyota', model='Yaris', year=2012,
+                                         registration='AAA222')
+
+    def review_booking(self, email):
+        """
+        Logs in a new user and submits the booking form, leaving the booking ready to confirm
+        :return: the client, and the signed draft to confirm
+        """
+        User.objects.create_user(email=email, password='bigbadtestuser', first_name='Test', last_name='User',
+                                 date_of_birth=dt.date(1980, 1, 1))
+        client = Client()
+        client.login(email=email, password='bigbadtestuser')
+        kwargs = {
+            'vehicle_id': self.v1.id,
+            'year': '3000',
+            'month': '1',
+            'day': '1',
+            'hour': '0',
+        }
+        form = {
+            'booking_start_date': '01/01/3000',
+            'booking_start_time': '00:00',
+            'booking_end_date': '01/01/3000',
+            'booking_end_time': '02:00',
+        }
+        response = client.post(reverse('carshare:booking_create_final', kwargs=kwargs), data=form)
+        self.assertTemplateUsed(response, 'carshare/bookings/review.html')
+        return client, response.context['draft']
+
+    def test_concurrent_confirms_single_winner(self):
+        """
+        When many users confirm the same slot at once, exactly one booking is created
+        """
+        clients = []
+        for i in range(self.num_requests):
+            clients.append(self.review_booking('user{0}@test.com'.format(i)))
+            # Let the hold lapse, so every user reaches the confirm step for the same slot
+            BookingHold.objects.update(expires=timezone.now())
+        responses = []
+        barrier = threading.Barrier(self.num_requests)
+
+        def confirm(client, draft):
+            barrier.wait()
+            try:
+                responses.append(client.post(reverse('carshare:booking_confirm'), data={'draft': draft}))
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=confirm, args=client_draft) for client_draft in clients]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(Booking.objects.filter(vehicle=self.v1).count(), 1)
+        booking = Booking.objects.get(vehicle=self.v1)
+        winners = [r for r in responses
+                   if r['Location'] == reverse('carshare:booking_detail', kwargs={'booking_id': booking.id})]
+        self.assertEqual(len(responses), self.num_requests)
+        self.assertEqual(len(winners), 1)
+
+
 @override_settings(STATICFILES_STORAGE=STATICFILES_STORAGE_FOR_TESTS)
 class CarshareBookingListViewTests(TestCase):
     def setUp(self):
@@ -239,6 +780,18 @@ class CarshareBookingListViewTests(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response.context['current_booking'], b)
 
+    def test_current_booking_in_navigation_bar(self):
+        """
+        The navigation bar links to the current booking, which is looked up once per page
+        """
+        now = timezone.now()
+        b = self.create_booking(now - dt.timedelta(hours=1), now + dt.timedelta(hours=1))
+        self.client.login(email='user@test.com', password='bigbadtestuser')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('carshare:index'))
+        self.assertContains(response, reverse('carshare:booking_detail', kwargs={'booking_id': b.id}), count=2)
+        self.assertEqual(len([q for q in queries if 'carshare_booking' in q['sql']]), 1)
+
     def test_upcoming_bookings(self):
         """
         User with upcoming bookings are displayed on the My Bookings page
@@ -275,6 +828,71 @@ class CarshareBookingListViewTests(TestCase):
             ['<Booking: {0} - {1}>'.format(b.id, b.get_status())]
         )
 
+    def create_bookings(self, count):
+        """
+        Creates count each of past, cancelled, paid and upcoming bookings
+        """
+        now = timezone.now()
+        for i in range(count):
+            start = now - dt.timedelta(days=10 + i)
+            self.create_booking(start, start + dt.timedelta(hours=2))
+            b = self.create_booking(now + dt.timedelta(days=10 + i), now + dt.timedelta(days=10 + i, hours=2))
+            b.cancelled = now
+            b.save()
+            paid = self.create_booking(start - dt.timedelta(hours=5), start - dt.timedelta(hours=3))
+            Invoice.objects.create(booking=paid, amount=paid.get_cost(), date=now)
+            self.create_booking(now + dt.timedelta(days=20 + i), now + dt.timedelta(days=20 + i, hours=2))
+
+    def test_constant_queries(self):
+        """
+        My Bookings takes the same number of queries however many bookings the user has
+        """
+        now = timezone.now()
+        self.create_booking(now - dt.timedelta(hours=1), now + dt.timedelta(hours=1))
+        self.create_bookings(1)
+        self.client.login(email='user@test.com', password='bigbadtestuser')
+        with CaptureQueriesContext(connection) as few:
+            response = self.client.get(reverse('carshare:my_bookings'))
+        self.assertContains(response, 'Complete - Paid', count=2)
+        self.create_bookings(10)
+        with CaptureQueriesContext(connection) as many:
+            response = self.client.get(reverse('carshare:my_bookings'))
+        self.assertEqual(len(many), len(few))
+        self.assertIsNotNone(response.context['current_booking'])
+        self.assertEqual(len(response.context['upcoming_bookings']), 11)
+        self.assertEqual(len(response.context['past_bookings']), PAGE_SIZE)
+
+    def test_load_more(self):
+        """
+        Further pages of bookings are loaded in order, each taking the same number of queries
+        """
+        self.create_bookings(15)
+        self.client.login(email='user@test.com', password='bigbadtestuser')
+        response = self.client.get(reverse('carshare:my_bookings'))
+        upcoming = list(response.context['upcoming_bookings'])
+        self.assertIsNone(response.context['upcoming_cursor'])
+        self.assertEqual(upcoming, list(Booking.objects.upcoming(timezone.now())))
+        past_ids = [b.id for b in response.context['past_bookings']]
+        cursor = response.context['past_cursor']
+        query_counts = set()
+        while cursor is not None:
+            with CaptureQueriesContext(connection) as queries:
+                page = self.client.get(reverse('carshare:ajax_my_bookings_more'), {'list': 'past', 'cursor': cursor})
+            query_counts.add(len(queries))
+            page = page.json()
+            past_ids += [int(booking_id) for booking_id in re.findall(r'bookings/([0-9]+)/"', page['html'])[::2]]
+            cursor = page['next_cursor']
+        self.assertEqual(len(query_counts), 1)
+        self.assertEqual(past_ids, list(Booking.objects.past(timezone.now()).values_list('id', flat=True)))
+        self.assertEqual(len(past_ids), 45)
+
+    def test_load_more_invalid_cursor(self):
+        self.client.login(email='user@test.com', password='bigbadtestuser')
+        response = self.client.get(reverse('carshare:ajax_my_bookings_more'), {'list': 'past', 'cursor': 'abc'})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(reverse('carshare:ajax_my_bookings_more'), {'list': 'all', 'cursor': '1.1'})
+        self.assertEqual(response.status_code, 400)
+
 
 @override_settings(STATICFILES_STORAGE=STATICFILES_STORAGE_FOR_TESTS)
 class CarshareBookingDetailViewTests(TestCase):
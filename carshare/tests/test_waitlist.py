@@ -0,0 +1,135 @@
+from django.core import mail
+from django.test import TestCase
+from django.utils import timezone
+
+import datetime as dt
+
+from emails.models import EmailTemplate
+from ..models import Booking, BookingHold, User, Vehicle, Pod, VehicleType, WaitlistEntry
+from ..waitlist import find_offers, offer_freed_slot
+
+
+def aware(*args):
+    return timezone.make_aware(dt.datetime(*args))
+
+
+def build_absolute_uri(path):
+    return 'http://testserver' + path
+
+
+class CarshareWaitlistTests(TestCase):
+    fixtures = ['email_templates']
+
+    def setUp(self):
+        self.vt = VehicleType.objects.create(description='Premium', hourly_rate=12.50, daily_rate=80.00)
+        other_type = VehicleType.objects.create(description='Economy', hourly_rate=8.50, daily_rate=60.00)
+        p1 = Pod.objects.create(latitude='-39.34523453', longitude='139.53524344', description='Pod 1')
+        p2 = Pod.objects.create(latitude='-38.34523453', longitude='138.53524344', description='Pod 2')
+        p3 = Pod.objects.create(latitude='-37.34523453', longitude='137.53524344', description='Pod 3')
+        self.v1 = Vehicle.objects.create(pod=p1, type=self.vt, name='Vehicle1', make='Toyota', model='Yaris',
+                                         year=2012, registration='AAA222')
+        self.v2 = Vehicle.objects.create(pod=p2, type=self.vt, name='Vehicle2', make='Toyota', model='Yaris',
+                                         year=2011, registration='AAA223')
+        self.v3 = Vehicle.objects.create(pod=p3, type=other_type, name='Vehicle3', make='Toyota', model='Yaris',
+                                         year=2011, registration='AAA224')
+        self.u1 = User.objects.create(email='test1@test.com', first_name='John', last_name='Doe',
+                                      date_of_birth='1980-01-01')
+        self.u2 = User.objects.create(email='test2@test.com', first_name='Jane', last_name='Doly',
+                                      date_of_birth='1988-01-01')
+        self.u3 = User.objects.create(email='test3@test.com', first_name='Jim', last_name='Dole',
+                                      date_of_birth='1988-01-01')
+        # 10 AM - 2 PM
+        self.booking = Booking.objects.create(user=self.u1, vehicle=self.v1, schedule_start=aware(2999, 1, 1, 10),
+                                              schedule_end=aware(2999, 1, 1, 14))
+
+    def wait(self, user, start, end, vehicle=None, vehicle_type=None):
+        return WaitlistEntry.objects.create(user=user, vehicle=vehicle, vehicle_type=vehicle_type,
+                                            schedule_start=start, schedule_end=end)
+
+    def cancel(self):
+        self.booking.cancelled = timezone.now()
+        self.booking.save()
+        return offer_freed_slot(self.booking, build_absolute_uri)
+
+    def test_overlapping(self):
+        entries = [
+            self.wait(self.u2, aware(2999, 1, 1, 9), aware(2999, 1, 1, 11), vehicle=self.v1),
+            self.wait(self.u2, aware(2999, 1, 1, 13), aware(2999, 1, 1, 15), vehicle=self.v1),
+            # Long windows that started well before
+            self.wait(self.u2, aware(2998, 10, 10, 9), aware(2999, 1, 1, 11), vehicle=self.v1),
+        ]
+        # Touching, not overlapping
+        self.wait(self.u2, aware(2999, 1, 1, 8), aware(2999, 1, 1, 10), vehicle=self.v1)
+        self.wait(self.u2, aware(2999, 1, 1, 14), aware(2999, 1, 1, 15), vehicle=self.v1)
+        overlapping = WaitlistEntry.objects.overlapping(aware(2999, 1, 1, 10), aware(2999, 1, 1, 14))
+        self.assertEqual(set(overlapping), set(entries))
+
+    def test_find_offers(self):
+        """
+        Entries for the vehicle or its type are offered if the vehicle is now free for their whole window
+        """
+        self.booking.cancelled = timezone.now()
+        self.booking.save()
+        first = self.wait(self.u2, aware(2999, 1, 1, 11), aware(2999, 1, 1, 13), vehicle_type=self.vt)
+        second = self.wait(self.u3, aware(2999, 1, 1, 10), aware(2999, 1, 1, 12), vehicle=self.v1)
+        # Still booked by someone else for part of the window
+        Booking.objects.create(user=self.u1, vehicle=self.v1, schedule_start=aware(2999, 1, 1, 15),
+                               schedule_end=aware(2999, 1, 1, 16))
+        self.wait(self.u2, aware(2999, 1, 1, 12), aware(2999, 1, 1, 16), vehicle=self.v1)
+        # Held by someone else for part of the window
+        BookingHold.objects.hold(self.u1, self.v1, aware(2999, 1, 1, 8), aware(2999, 1, 1, 9))
+        self.wait(self.u2, aware(2999, 1, 1, 8), aware(2999, 1, 1, 11), vehicle=self.v1)
+        # Waiting for other vehicles
+        self.wait(self.u2, aware(2999, 1, 1, 10), aware(2999, 1, 1, 12), vehicle=self.v2)
+        self.wait(self.u2, aware(2999, 1, 1, 10), aware(2999, 1, 1, 12), vehicle_type=self.v3.type)
+        # Offered already, or in the past
+        offered = self.wait(self.u2, aware(2999, 1, 1, 10), aware(2999, 1, 1, 12), vehicle=self.v1)
+        WaitlistEntry.objects.filter(pk=offered.pk).update(offered=timezone.now())
+        now = timezone.now()
+        self.wait(self.u2, now - dt.timedelta(hours=1), now + dt.timedelta(hours=1), vehicle=self.v1)
+        with self.assertNumQueries(3):
+            offers = find_offers(self.v1, aware(2999, 1, 1, 10), aware(2999, 1, 1, 14))
+        self.assertEqual(offers, [first, second])
+
+    def test_find_offers_nested(self):
+        """
+        Entries inside a longer entry's window are offered if they are free, even if the longer one isn't
+        """
+        self.booking.cancelled = timezone.now()
+        self.booking.save()
+        Booking.objects.create(user=self.u1, vehicle=self.v1, schedule_start=aware(2999, 1, 1, 15),
+                               schedule_end=aware(2999, 1, 1, 16))
+        self.wait(self.u2, aware(2999, 1, 1, 9), aware(2999, 1, 1, 18), vehicle=self.v1)
+        inside = self.wait(self.u3, aware(2999, 1, 1, 11), aware(2999, 1, 1, 12), vehicle=self.v1)
+        self.assertEqual(find_offers(self.v1, aware(2999, 1, 1, 10), aware(2999, 1, 1, 14)), [inside])
+
+    def test_offer_freed_slot(self):
+        """
+        Cancelling emails everyone waiting in one batch, and each entry is only offered once
+        """
+        self.wait(self.u2, aware(2999, 1, 1, 10), aware(2999, 1, 1, 12), vehicle=self.v1)
+        self.wait(self.u3, aware(2999, 1, 1, 11), aware(2999, 1, 1, 14), vehicle_type=self.vt)
+        offers = self.cancel()
+        self.assertEqual(len(offers), 2)
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertEqual([m.to for m in mail.outbox], [['test2@test.com'], ['test3@test.com']])
+        self.assertIn('http://testserver/bookings/new/{0}/2999/1/1/10/2/'.format(self.v1.id),
+                      mail.outbox[0].alternatives[0][0])
+        self.assertIn('http://testserver/bookings/new/{0}/2999/1/1/11/3/'.format(self.v1.id),
+                      mail.outbox[1].alternatives[0][0])
+        self.assertFalse(WaitlistEntry.objects.waiting().exists())
+        self.assertEqual(offer_freed_slot(self.booking, build_absolute_uri), [])
+        self.assertEqual(len(mail.outbox), 2)
+
+    def test_nobody_waiting(self):
+        self.assertEqual(self.cancel(), [])
+        self.assertEqual(len(mail.outbox), 0)
+
+
+class CarshareWaitlistTemplateTests(TestCase):
+    def test_template_migrated(self):
+        """
+        The offer template is created by a migration, so existing sites don't have to reload the fixture
+        """
+        self.assertTrue(EmailTemplate.objects.filter(name='Waitlist Offer').exists())
+        self.assertTrue(EmailTemplate.objects.filter(name='Recurring Booking Confirmation').exists())
@@ -26,6 +26,9 @@ urlpatterns = [
     url(r'bookings/new/(?P<vehicle_id>[0-9]+)/(?P<year>[0-9]{4})/(?P<month>[0-9]{1,2})/(?P<day>[0-9]{1,2})/(?P<hour>[0-9]{1,2})/(?P<length>[0-9]{1,4})/$',
         views.booking_create, name='booking_create_final_length'),
     url(r'bookings/confirm/$', views.booking_confirm, name='booking_confirm'),
+    url(r'bookings/new/(?P<vehicle_id>[0-9]+)/weekly/$', views.booking_recurring, name='booking_recurring'),
+    url(r'bookings/new/(?P<vehicle_id>[0-9]+)/waitlist/$', views.waitlist_join, name='waitlist_join'),
+    url(r'bookings/waitlist/(?P<entry_id>[0-9]+)/leave/$', views.waitlist_leave, name='waitlist_leave'),
     url(r'bookings/(?P<booking_id>[0-9]+)/$', views.booking_detail, name='booking_detail'),
     url(r'bookings/(?P<booking_id>[0-9]+)/extend/$', views.booking_extend, name='booking_extend'),
     url(r'bookings/$', views.my_bookings, name='my_bookings'),
@@ -34,6 +37,16 @@ urlpatterns = [
     url(r'bookings/(?P<booking_id>[0-9]+)/invoice/$', views.booking_invoice, name='booking_invoice'),
     # AJAX
     url(r'bookings/new/(?P<vehicle_id>[0-9]+)/calculate-cost/', views.booking_calculate_cost, name='ajax_booking_calculate_cost'),
+    url(r'find-a-car/markers/$', views.vehicle_markers, name='ajax_vehicle_markers'),
+    url(r'find-a-car/nearest/$', views.nearest_vehicles, name='ajax_nearest_vehicles'),
+    url(r'find-a-car/quotes/$', views.vehicle_type_quotes, name='ajax_vehicle_type_quotes'),
+    url(r'bookings/new/(?P<vehicle_id>[0-9]+)/availability/$', views.vehicle_availability,
+        name='ajax_vehicle_availability'),
+    url(r'bookings/(?P<booking_id>[0-9]+)/extend/quote/$', views.booking_extend_quote,
+        name='ajax_booking_extend_quote'),
+    url(r'bookings/more/$', views.my_bookings_more, name='ajax_my_bookings_more'),
+    url(r'bookings/(?P<booking_id>[0-9]+)/invoice/status/$', views.booking_invoice_status,
+        name='ajax_booking_invoice_status'),
 ]
 
 
@@ -4,20 +4,45 @@
 #
 
 from django.contrib import messages
+from django.core.files.storage import default_storage
 from django.core.mail import EmailMessage, BadHeaderError
-from django.http import HttpResponse
+from django.db import transaction
+from django.http import HttpResponse, Http404
+from django.urls import reverse
+from django.utils.cache import get_conditional_response, patch_cache_control
 from django.shortcuts import render, redirect, get_object_or_404
+from django.template.loader import render_to_string
 from django.contrib.auth.decorators import login_required
 from django.utils import timezone
-from django.db.models import Q
-
-from wkhtmltopdf.views import PDFTemplateResponse
+from django.utils.http import http_date
 
 import datetime as dt
+import hashlib
 import json
+import re
+
+from .availability import (get_hourly_availability, get_availability_bitmaps, get_free_vehicles,
+                           get_nearest_available_vehicles, get_vehicle_type_quotes)
+from .drafts import dump_draft, load_draft, InvalidDraft
+from .forms import ContactForm, BookingForm, ExtendBookingForm, RecurringBookingForm, WaitlistForm
+from .invoices import get_invoice_pdf, get_invoice_status, get_template_version, queue_invoice
+from .managers import BookingClash
+from .paging import get_page, InvalidCursor
+from .models import Vehicle, Booking, BookingHold, Invoice, WaitlistEntry
+from .quotes import get_quote
+from .recurring import weekly_intervals, create_recurring_bookings
+from .stats import get_site_stats
+from .waitlist import offer_freed_slot
+
+
+# Most vehicles that can be requested from nearest_vehicles()
+MAX_NEAREST_VEHICLES = 50
 
-from .forms import ContactForm, BookingForm, ExtendBookingForm
-from .models import Vehicle, Booking, Invoice, Pod
+# Seconds browsers may reuse a quote from booking_calculate_cost()
+QUOTE_MAX_AGE = 60
+
+# A single byte range, e.g. bytes=0-499, bytes=500- or bytes=-500
+BYTE_RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
 
 
 def index(request):
@@ -50,15 +75,13 @@ def about_us(request):
     """
     # Owner cost: $75 per trip, calculated using values from GoGet (10,000 kms per annum, car is used 20
     # hours per week, petrol $1.44 per litre). Assuming 20 hours is two trips on average.
-    owner_cost = 75 * Booking.objects.count()
-    vroom_cost = 0.0
-    for b in Booking.objects.filter(schedule_end__lt=timezone.now()):
-        vroom_cost += b.calculate_cost()
-    estimated_savings = owner_cost - vroom_cost
+    stats = get_site_stats()
+    owner_cost = 75 * stats.num_bookings
+    estimated_savings = owner_cost - stats.completed_cost
     context = {
-        'num_vehicles': Vehicle.objects.count(),
-        'num_locations': Pod.objects.count(),
-        'num_shares': Booking.objects.count(),
+        'num_vehicles': stats.num_vehicles,
+        'num_locations': stats.num_pods,
+        'num_shares': stats.num_bookings,
         'estimated_savings': int(estimated_savings),
     }
     return render(request, 'carshare/about_us.html', context)
@@ -97,14 +120,10 @@ def contact_us(request):
 
 def find_a_car(request):
     """
-    Interactive map page
+    Interactive map page. Vehicles are loaded for the visible area of the map from vehicle_markers(), which is
+    passed this page's GET parameters so the map can be filtered to a time window.
     """
-    # Get all active vehicles that have been assigned to a pod
-    active_vehicles_with_pods = Vehicle.objects.filter(active=True).exclude(pod__isnull=True)
-    context = {
-        'vehicles': active_vehicles_with_pods
-    }
-    return render(request, "carshare/find_a_car.html", context)
+    return render(request, "carshare/find_a_car.html")
 
 
 @login_required
@@ -123,19 +142,9 @@ def booking_timeline(request, vehicle_id, year=None, month=None, day=None):
         date = dt.date(int(year), int(month), int(day))
     else:
         date = timezone.localtime().date()
-    # Build dict of hours and whether that hour is available
-    hours = {}
-    for i in range(0, 24):
-        datetime = timezone.make_aware(dt.datetime.combine(date, dt.time(hour=i, minute=0)), timezone.get_current_timezone())
-        if vehicle.is_available_at(datetime=datetime) and datetime > timezone.localtime() - dt.timedelta(hours=1):
-            hours[i] = 'available'
-        elif not vehicle.get_booking_at(datetime=datetime) is None and vehicle.get_booking_at(datetime=datetime).user == request.user:
-            hours[i] = 'booked_by_user'
-        else:
-            hours[i] = 'unavailable'
     context = {
         'vehicle': vehicle,
-        'hours': hours,
+        'hours': get_hourly_availability(vehicle, date, request.user),
         'date': date,
         'today': timezone.localtime().today().date(),
     }
@@ -155,6 +164,7 @@ def booking_create(request, vehicle_id, year=None, month=None, day=None, hour=No
     if not vehicle.is_active():
         return redirect('carshare:find_a_car')
 
+    waitlist = False
     if request.method == 'POST':
         booking_form = BookingForm(request.POST)
         if booking_form.is_valid():
@@ -162,33 +172,22 @@ def booking_create(request, vehicle_id, year=None, month=None, day=None, hour=No
             booking_start = data['schedule_start']
             booking_end = data['schedule_end']
 
-            # Custom validation
-            is_valid_booking = True
-            # Prevent booking overlapping with existing booking
-            existing_bookings = Booking.objects.filter(vehicle=vehicle, cancelled__isnull=True)
-            for b in existing_bookings:
-                if (b.schedule_start <= booking_start < b.schedule_end or
-                        b.schedule_start < booking_end <= b.schedule_end or
-                        booking_start <= b.schedule_start and booking_end >= b.schedule_end):
-                    is_valid_booking = False
-                    booking_form.add_error(None, "The selected vehicle is unavailable within the chosen times")
-                    break
-            # Prevent multiple bookings for the same user during the same time period
-            user_bookings = request.user.booking_set.filter(cancelled__isnull=True)
-            for b in user_bookings:
-                if (b.schedule_start <= booking_start < b.schedule_end or
-                        b.schedule_start < booking_end <= b.schedule_end or
-                        booking_start <= b.schedule_start and booking_end >= b.schedule_end):
-                    is_valid_booking = False
-                    booking_form.add_error(None, "You already have a booking within the selected time frame")
-                    break
-
-            if is_valid_booking:
-                # Save details in session, but also provide to template context. When confirmed, we'll create the
-                # booking from the session vars.
-                request.session['vehicle_id'] = vehicle.id
-                request.session['booking_start'] = booking_start
-                request.session['booking_end'] = booking_end
+            # Hold the slot while the user reviews the booking. This fails if it overlaps an existing booking or
+            # another user's hold, or the user already has a booking during the same time period.
+            try:
+                hold = BookingHold.objects.hold(request.user, vehicle, booking_start, booking_end)
+            except BookingClash as e:
+                hold = None
+                # Offer to join the waitlist for the slot instead
+                waitlist = True
+                # Show every reason the slot is unavailable, not just the first one found
+                clashes = Booking.objects.clashes(request.user, vehicle, booking_start, booking_end) or [e]
+                for clash in clashes:
+                    booking_form.add_error(None, str(clash))
+
+            if hold is not None:
+                # Sign the details into the review form, so confirming doesn't need the session. Each review gets
+                # its own draft, so bookings can be reviewed in several tabs at once.
                 booking = Booking(
                     user=request.user,
                     vehicle=vehicle,
@@ -200,6 +199,8 @@ def booking_create(request, vehicle_id, year=None, month=None, day=None, hour=No
                 length_hours = length.days * 24 + length.seconds / 60 / 60
                 context = {
                     'booking': booking,
+                    'hold': hold,
+                    'draft': dump_draft(request.user, vehicle, booking_start, booking_end),
                     'datetime': booking_start,
                     'length': int(length_hours),
                 }
@@ -215,6 +216,7 @@ def booking_create(request, vehicle_id, year=None, month=None, day=None, hour=No
         'booking_form': booking_form,
         'date': datetime.date,
         'booking_length': length,
+        'waitlist': waitlist,
     }
     return render(request, "carshare/bookings/create.html", context)
 
@@ -222,27 +224,23 @@ def booking_create(request, vehicle_id, year=None, month=None, day=None, hour=No
 @login_required
 def booking_confirm(request):
     """
-    Creates booking from session variables (which should be set in booking_create())
+    Creates booking from the signed draft submitted by the review page (see booking_create())
     """
-    # Create booking from session vars, since form was previously submitted
+    if request.method != 'POST':
+        return redirect('carshare:index')
     try:
-        vehicle_id = request.session['vehicle_id']
-        vehicle = get_object_or_404(Vehicle, id=vehicle_id)
-        schedule_start = request.session['booking_start']
-        schedule_end = request.session['booking_end']
-        del request.session['vehicle_id']
-        del request.session['booking_start']
-        del request.session['booking_end']
-    except KeyError:
+        vehicle_id, schedule_start, schedule_end = load_draft(request.POST.get('draft', ''), request.user)
+    except InvalidDraft:
+        messages.error(request, 'Your booking review has expired, please try again')
         return redirect('carshare:index')
+    vehicle = get_object_or_404(Vehicle, id=vehicle_id)
 
-    booking = Booking(
-        user=request.user,
-        vehicle=vehicle,
-        schedule_start=schedule_start,
-        schedule_end=schedule_end,
-    )
-    booking.save()
+    # Converts the slot held at review into a booking. The hold may have expired, so check again for clashes.
+    try:
+        booking = Booking.objects.create_if_available(request.user, vehicle, schedule_start, schedule_end)
+    except BookingClash as e:
+        messages.error(request, str(e))
+        return redirect('carshare:booking_create', vehicle.id)
 
     # Send confirmation email
     request.user.send_email(
@@ -256,6 +254,91 @@ def booking_confirm(request):
     return redirect('carshare:booking_detail', booking.id)
 
 
+@login_required
+def booking_recurring(request, vehicle_id):
+    """
+    Books the vehicle at the same time every week. Weeks the vehicle or user is already booked are skipped, and the
+    rest are created at once, with a single confirmation email.
+    """
+    vehicle = get_object_or_404(Vehicle.objects.select_related('type'), id=vehicle_id)
+
+    # Redirect if vehicle is inactive
+    if not vehicle.is_active():
+        return redirect('carshare:find_a_car')
+
+    if request.method == 'POST':
+        booking_form = RecurringBookingForm(request.POST)
+        if booking_form.is_valid():
+            data = booking_form.cleaned_data
+            intervals = weekly_intervals(data['schedule_start'], data['schedule_end'], data['weeks'])
+            bookings, skipped = create_recurring_bookings(request.user, vehicle, intervals)
+            if bookings:
+                # Send one confirmation email for all the bookings
+                request.user.send_email(
+                    template_name='Recurring Booking Confirmation',
+                    context={
+                        'user': request.user,
+                        'vehicle': vehicle,
+                        'bookings': bookings,
+                        'skipped': skipped,
+                    },
+                )
+                messages.success(request, '{0} bookings created successfully'.format(len(bookings)))
+                for start, end, clash in skipped:
+                    messages.warning(request, '{0:%d/%m/%Y %H:%M} was not booked: {1}'.format(
+                        timezone.localtime(start), clash))
+                return redirect('carshare:my_bookings')
+            booking_form.add_error(None, 'None of the selected times are available')
+    else:
+        # Start from the next hour
+        next_hour = timezone.localtime().replace(minute=0, second=0, microsecond=0) + dt.timedelta(hours=1)
+        booking_form = RecurringBookingForm(initial_start_datetime=next_hour)
+
+    context = {
+        'vehicle': vehicle,
+        'booking_form': booking_form,
+    }
+    return render(request, 'carshare/bookings/recurring.html', context)
+
+
+@login_required
+def waitlist_join(request, vehicle_id):
+    """
+    Adds the user to the waitlist for the vehicle, or any vehicle of its type, over the times from the booking form.
+    They are emailed if a cancellation frees the slot (see carshare.waitlist).
+    """
+    vehicle = get_object_or_404(Vehicle, id=vehicle_id)
+    if request.method != 'POST':
+        return redirect('carshare:booking_create', vehicle.id)
+    waitlist_form = WaitlistForm(request.POST)
+    if not waitlist_form.is_valid():
+        messages.error(request, 'Please choose valid times to wait for')
+        return redirect('carshare:booking_create', vehicle.id)
+    data = waitlist_form.cleaned_data
+    if data['any_vehicle']:
+        WaitlistEntry.objects.create(user=request.user, vehicle_type=vehicle.type,
+                                     schedule_start=data['schedule_start'], schedule_end=data['schedule_end'])
+        waiting_for = 'a {0} vehicle'.format(vehicle.type.description)
+    else:
+        WaitlistEntry.objects.create(user=request.user, vehicle=vehicle,
+                                     schedule_start=data['schedule_start'], schedule_end=data['schedule_end'])
+        waiting_for = vehicle.name
+    messages.success(request, 'You are on the waitlist. We will email you if {0} becomes free.'.format(waiting_for))
+    return redirect('carshare:my_bookings')
+
+
+@login_required
+def waitlist_leave(request, entry_id):
+    """
+    Removes a waitlist entry
+    """
+    entry = get_object_or_404(WaitlistEntry, pk=entry_id, user=request.user)
+    if request.method == 'POST':
+        entry.delete()
+        messages.success(request, 'You have left the waitlist')
+    return redirect('carshare:my_bookings')
+
+
 @login_required
 def booking_detail(request, booking_id):
     """
@@ -268,6 +351,7 @@ def booking_detail(request, booking_id):
         return redirect('carshare:index')
     context = {
         'booking': booking,
+        'invoice_status': get_invoice_status(booking.invoice) if booking.is_paid() else None,
     }
     return render(request, "carshare/bookings/detail.html", context)
 
@@ -275,23 +359,52 @@ def booking_detail(request, booking_id):
 @login_required
 def my_bookings(request):
     """
-    Page displaying all of a user's bookings, split into logical groups
+    Page displaying all of a user's bookings, split into logical groups. Upcoming and past bookings are paged, and
+    further pages are loaded with my_bookings_more.
     """
-    # Get list past and upcoming bookings, as well as the current booking
-    now = timezone.localtime()
-    current_booking = request.user.get_current_booking()
-    upcoming_bookings = request.user.booking_set.filter(
-        schedule_start__gt=now).filter(cancelled__isnull=True).order_by('schedule_start')
-    past_bookings = request.user.booking_set.filter(
-        Q(schedule_end__lte=now) | Q(cancelled__isnull=False)).order_by('-schedule_start')
+    # Get the first page of past and upcoming bookings, as well as the current booking. Vehicles and invoices are
+    # fetched in the same queries, since every row shows the vehicle and whether the booking has been paid.
+    now = timezone.now()
+    bookings = request.user.booking_set.select_related('vehicle', 'invoice')
+    current_booking = bookings.active().order_by('schedule_end', 'id').first()
+    upcoming = get_page(bookings.upcoming(now))
+    past = get_page(bookings.past(now))
+    waitlist = request.user.waitlistentry_set.waiting().select_related('vehicle', 'vehicle_type').order_by(
+        'schedule_start')
     context = {
         'current_booking': current_booking,
-        'upcoming_bookings': upcoming_bookings,
-        'past_bookings': past_bookings,
+        'waitlist': waitlist,
+        'upcoming_bookings': upcoming.bookings,
+        'upcoming_cursor': upcoming.next_cursor,
+        'past_bookings': past.bookings,
+        'past_cursor': past.next_cursor,
     }
     return render(request, "carshare/bookings/my_bookings.html", context)
 
 
+@login_required
+def my_bookings_more(request):
+    """
+    Returns the next page of upcoming or past bookings (from GET) as table rows, with the cursor for the page after
+    """
+    now = timezone.now()
+    bookings = request.user.booking_set.select_related('vehicle', 'invoice')
+    booking_lists = {
+        'upcoming': bookings.upcoming,
+        'past': bookings.past,
+    }
+    try:
+        page = get_page(booking_lists[request.GET['list']](now), request.GET['cursor'])
+    except (KeyError, InvalidCursor):
+        return HttpResponse(json.dumps({'error': 'A list (upcoming or past) and a valid cursor are required'}),
+                            content_type='application/json', status=400)
+    rows = ''.join(
+        render_to_string('carshare/bookings/table_row_snippet.html', {'booking': booking}, request=request)
+        for booking in page.bookings
+    )
+    return HttpResponse(json.dumps({'html': rows, 'next_cursor': page.next_cursor}), content_type='application/json')
+
+
 @login_required
 def booking_extend(request, booking_id):
     """
@@ -306,41 +419,19 @@ def booking_extend(request, booking_id):
         messages.error(request, 'You cannot extend a booking that has already been paid')
         return redirect('carshare:my_bookings')
 
+    latest_end = booking.get_latest_end()
     if request.method == 'POST':
-        # Create form from POST data and validate
-        extend_booking_form = ExtendBookingForm(request.POST, current_booking_end=booking.schedule_end)
+        # Create form from POST data and validate. The form rejects ends after the next booking of the vehicle or user.
+        extend_booking_form = ExtendBookingForm(request.POST, current_booking_end=booking.schedule_end,
+                                                latest_booking_end=latest_end)
         if extend_booking_form.is_valid():
             new_schedule_end = extend_booking_form.cleaned_data['new_schedule_end']
-            # Custom validation
-            is_valid_booking = True
-            # Make sure new end date doesn't clash with existing booking
-            existing_bookings = Booking.objects.filter(
-                vehicle=booking.vehicle, cancelled__isnull=True
-            ).exclude(user=request.user)
-            for b in existing_bookings:
-                if (b.schedule_start <= booking.schedule_start <= b.schedule_end or
-                        b.schedule_start <= new_schedule_end <= b.schedule_end or
-                        booking.schedule_start <= b.schedule_start and new_schedule_end >= b.schedule_end):
-                    is_valid_booking = False
-                    extend_booking_form.add_error(None, "The new end date overlaps with existing booking. "
-                                                        "The latest date you can choose is {0}".format(b.schedule_start))
-                    break
-            user_bookings = request.user.booking_set.filter(cancelled__isnull=True).exclude(id__exact=booking.id)
-            for b in user_bookings:
-                if (b.schedule_start <= booking.schedule_start <= b.schedule_end or
-                        b.schedule_start <= new_schedule_end <= b.schedule_end or
-                        booking.schedule_start <= b.schedule_start and new_schedule_end >= b.schedule_end):
-                    is_valid_booking = False
-                    extend_booking_form.add_error(
-                        None, "The new booking end overlaps with one of your existing bookings"
-                    )
-                    break
-
-            # New booking end is valid? Save booking send email
-            if is_valid_booking:
-                booking.schedule_end = new_schedule_end
-                booking.save()
-
+            # Check again while saving, since another booking may have been made since the latest end was found
+            try:
+                Booking.objects.extend_if_available(booking, new_schedule_end)
+            except BookingClash as e:
+                extend_booking_form.add_error(None, str(e))
+            else:
                 # Send confirmation email
                 request.user.send_email(
                     template_name='Booking Extended',
@@ -354,15 +445,45 @@ def booking_extend(request, booking_id):
                 )
                 return redirect('carshare:booking_detail', booking_id)
     else:
-        extend_booking_form = ExtendBookingForm(current_booking_end=booking.schedule_end)
+        extend_booking_form = ExtendBookingForm(current_booking_end=booking.schedule_end,
+                                                latest_booking_end=latest_end)
 
     context = {
         'booking': booking,
         'extend_booking_form': extend_booking_form,
+        'latest_end': latest_end,
     }
     return render(request, "carshare/bookings/extend.html", context)
 
 
+@login_required
+def booking_extend_quote(request, booking_id):
+    """
+    Returns the latest possible end of a booking, and if a new end is given (from GET), the cost of the extended
+    booking and how much more it costs than the booking does now
+    """
+    booking = get_object_or_404(Booking.objects.select_related('vehicle__type'), pk=booking_id, user=request.user)
+    latest_end = booking.get_latest_end()
+    result = {
+        'latest_end': timezone.localtime(latest_end).isoformat(),
+    }
+    if 'new_end_date' in request.GET:
+        extend_booking_form = ExtendBookingForm(request.GET, current_booking_end=booking.schedule_end,
+                                                latest_booking_end=latest_end)
+        if extend_booking_form.is_valid():
+            new_end = extend_booking_form.cleaned_data['new_schedule_end']
+            booking_price = get_quote(booking.vehicle_id, booking.schedule_start, new_end)
+            result.update({
+                'total': '${0:.2f}'.format(booking_price.cost),
+                'days': booking_price.days,
+                'hours': booking_price.hours,
+                'difference': '${0:.2f}'.format(booking_price.cost - booking.get_cost()),
+            })
+        else:
+            result['error'] = extend_booking_form.errors
+    return HttpResponse(json.dumps(result), content_type='application/json')
+
+
 def booking_cancel(request, booking_id):
     """
     Logic for cancelling a booking
@@ -392,6 +513,8 @@ def booking_cancel(request, booking_id):
             'booking': booking,
         },
     )
+    # Offer the freed slot to anyone waiting for it
+    offer_freed_slot(booking, request.build_absolute_uri)
     messages.success(request, 'Successfully cancelled booking for {0} the {1} {2}'.format(booking.vehicle.name,
                                                                                           booking.vehicle.make,
                                                                                           booking.vehicle.model))
@@ -416,40 +539,71 @@ def booking_pay(request, booking_id):
         messages.info(request, 'This booking has already been paid')
         return redirect('carshare:booking_detail', booking.id)
 
-    # Create invoice and email it to user
-    invoice = Invoice(booking=booking, amount=booking.calculate_cost())
-    invoice.save()
-    context = {'invoice': invoice}
-    invoice_filename = 'invoice_{0}.pdf'.format(invoice.id)
-    response = PDFTemplateResponse(
-        request=request,
-        template='carshare/pdf/invoice.html',
-        context=context,
-    )
-    request.user.send_email(
-        template_name='Booking Invoice',
-        context=context,
-        attachment_filename=invoice_filename,
-        attachment_data=response.rendered_content,
-    )
-    messages.success(request, 'Thank you for your booking. An invoice has been emailed to you.')
+    # Create invoice, and queue emailing it to the user. Rendering the PDF takes seconds, so it is left to a worker
+    # (see carshare.invoices), and the booking page shows when it is ready.
+    with transaction.atomic():
+        invoice = Invoice.objects.create(booking=booking, amount=booking.get_cost())
+        queue_invoice(invoice)
+    messages.success(request, 'Thank you for your booking. Your invoice will be emailed to you shortly.')
     return redirect('carshare:booking_detail', booking.id)
 
 
 def booking_invoice(request, booking_id):
     """
-    Creates and displays an invoice as PDF for a booking
+    Displays the invoice for a booking as PDF. The PDF is only rendered the first time (see carshare.invoices), and
+    is served with an ETag and Last-Modified, and in byte ranges if requested, so it can be cached and resumed.
     """
-    booking = get_object_or_404(Booking, pk=booking_id)
+    booking = get_object_or_404(Booking.objects.select_related('invoice'), pk=booking_id)
     if request.user != booking.user:
         messages.error(request, 'You do not have permission to view that invoice')
         return redirect('carshare:index')
-    # Render PDF invoice
-    return PDFTemplateResponse(
-        request=request,
-        template='carshare/pdf/invoice.html',
-        context={'invoice': booking.invoice},
-    )
+    if not booking.is_paid():
+        raise Http404
+    name = get_invoice_pdf(booking.invoice)
+    etag = '"{0}-{1}"'.format(booking.invoice.id, get_template_version())
+    # HTTP dates are in whole seconds
+    last_modified = int(default_storage.get_modified_time(name).timestamp())
+    # Revalidating cached copies doesn't need to read the file
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        with default_storage.open(name) as f:
+            response = pdf_range_response(request, f, default_storage.size(name), etag)
+        response['Content-Disposition'] = 'inline; filename="invoice_{0}.pdf"'.format(booking.invoice.id)
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    # Invoices are private to the user, but never change
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def pdf_range_response(request, f, size, etag):
+    """
+    Responds with a PDF file, or the part of it given by a single byte range in the Range header (RFC 7233).
+    Requests for several ranges, invalid ranges, or with an If-Range that doesn't match the ETag get the whole file.
+    :param f: open file
+    :param size: size of the file, in bytes
+    """
+    match = BYTE_RANGE_RE.match(request.META.get('HTTP_RANGE', ''))
+    if match and any(match.groups()) and request.META.get('HTTP_IF_RANGE', etag) == etag:
+        first, last = match.groups()
+        if first:
+            start, end = int(first), min(int(last), size - 1) if last else size - 1
+        else:
+            # Suffix range, e.g. bytes=-500 for the last 500 bytes
+            start, end = max(size - int(last), 0), size - 1
+        if start >= size or not first and not int(last):
+            response = HttpResponse(status=416)
+            response['Content-Range'] = 'bytes */{0}'.format(size)
+            return response
+        if start <= end:
+            f.seek(start)
+            response = HttpResponse(f.read(end - start + 1), content_type='application/pdf', status=206)
+            response['Content-Range'] = 'bytes {0}-{1}/{2}'.format(start, end, size)
+            response['Accept-Ranges'] = 'bytes'
+            return response
+    response = HttpResponse(f.read(), content_type='application/pdf')
+    response['Accept-Ranges'] = 'bytes'
+    return response
 
 
 #
@@ -457,25 +611,177 @@ def booking_invoice(request, booking_id):
 #
 def booking_calculate_cost(request, vehicle_id):
     """
-    Calculates booking cost given start and end times (from POST)
+    Calculates booking cost given start and end times (from GET, or POST). Quotes come from the quote cache, and GET
+    responses may be cached by the browser for a short time.
+    """
+    if request.method not in ('GET', 'POST'):
+        return HttpResponse(status=405)
+    booking_form = BookingForm(request.GET if request.method == 'GET' else request.POST)
+    if booking_form.is_valid():
+        data = booking_form.cleaned_data
+        try:
+            booking_price = get_quote(int(vehicle_id), data['schedule_start'], data['schedule_end'])
+        except Vehicle.DoesNotExist:
+            raise Http404('No such vehicle')
+        cost = {
+            'total': '${0:.2f}'.format(booking_price.cost),
+            'days': booking_price.days,
+            'hours': booking_price.hours,
+        }
+        # Return calculated cost as string
+        response = HttpResponse(json.dumps(cost))
+        if request.method == 'GET':
+            patch_cache_control(response, private=True, max_age=QUOTE_MAX_AGE)
+        return response
+    else:
+        return HttpResponse(json.dumps({'error': booking_form.errors}))
+
+
+@login_required
+def vehicle_availability(request, vehicle_id):
+    """
+    Returns per-hour availability bitmaps for a vehicle over a number of days (from GET), so the timeline can page
+    through dates without reloading. Responses carry an ETag so unchanged ranges return 304 Not Modified.
     """
     vehicle = get_object_or_404(Vehicle, id=vehicle_id)
-    if request.method == 'POST':
-        booking_form = BookingForm(request.POST)
-        if booking_form.is_valid():
-            # Create booking object using provided data and use its method
-            data = booking_form.cleaned_data
-            booking_start = data['schedule_start']
-            booking_end = data['schedule_end']
-            booking = Booking(user=request.user, vehicle=vehicle, schedule_start=booking_start, schedule_end=booking_end)
-            # DO NOT SAVE BOOKING!
-            days, hours = booking.calculate_daily_hourly_billable_counts()
-            cost = {
-                'total': '${0:.2f}'.format(booking.calculate_cost()),
-                'days': days,
-                'hours': hours,
-            }
-            # Return calculated cost as string
-            return HttpResponse(json.dumps(cost))
-        else:
-            return HttpResponse(json.dumps({'error': booking_form.errors}))
+    try:
+        start_date = dt.datetime.strptime(request.GET['start'], '%Y-%m-%d').date()
+    except KeyError:
+        start_date = timezone.localtime().date()
+    except ValueError:
+        return HttpResponse(json.dumps({'error': 'Start date must be in the format YYYY-MM-DD'}),
+                            content_type='application/json')
+    try:
+        days = int(request.GET.get('days', 1))
+    except ValueError:
+        return HttpResponse(json.dumps({'error': 'Number of days must be a whole number'}),
+                            content_type='application/json')
+    if not 1 <= days <= Booking.MAX_LENGTH_DAYS:
+        return HttpResponse(json.dumps({
+            'error': 'Number of days must be between 1 and {0}'.format(Booking.MAX_LENGTH_DAYS)
+        }), content_type='application/json')
+
+    availability = {
+        'vehicle': vehicle.id,
+        'start': start_date.isoformat(),
+        'days': days,
+    }
+    availability.update(get_availability_bitmaps(vehicle, start_date, days, request.user))
+    content = json.dumps(availability)
+    etag = '"{0}"'.format(hashlib.md5(content.encode('utf-8')).hexdigest())
+    response = HttpResponse(content, content_type='application/json')
+    response['ETag'] = etag
+    response = get_conditional_response(request, etag=etag, response=response)
+    # Availability depends on the logged in user, so must not be stored by shared caches
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def vehicle_marker(car, available):
+    """
+    Map marker details for a vehicle, with its pod and type loaded
+    """
+    return {
+        'id': car.id,
+        'lat': float(car.pod.latitude),
+        'lng': float(car.pod.longitude),
+        'available': available,
+        'carname': car.name,
+        'make': car.make,
+        'model': car.model,
+        'pod_description': car.pod.description,
+        'booking_url': reverse('carshare:booking_create', args=[car.id]),
+        'daily_rate': '${0}'.format(car.type.daily_rate),
+        'hourly_rate': '${0}'.format(car.type.hourly_rate),
+        'car_type': car.type.description,
+    }
+
+
+def vehicle_markers(request):
+    """
+    Returns map markers for the active vehicles whose pod lies inside a bounding box (from GET). Can be filtered to
+    vehicles that are free for a whole time window, using the same fields as the booking form.
+    """
+    try:
+        south, west, north, east = (float(request.GET[key]) for key in ('south', 'west', 'north', 'east'))
+    except (KeyError, ValueError):
+        return HttpResponse(json.dumps({'error': 'A bounding box (south, west, north, east) is required'}),
+                            content_type='application/json')
+    # Get all active vehicles that have been assigned to a pod within the bounds
+    vehicles = Vehicle.objects.filter(active=True).exclude(pod__isnull=True).within_bounds(
+        south, west, north, east
+    ).select_related('pod', 'type').with_available_now()
+    if 'booking_start_date' in request.GET:
+        search_form = BookingForm(request.GET)
+        if not search_form.is_valid():
+            return HttpResponse(json.dumps({'error': search_form.errors}), content_type='application/json')
+        vehicles = get_free_vehicles(
+            search_form.cleaned_data['schedule_start'],
+            search_form.cleaned_data['schedule_end'],
+            vehicles=vehicles,
+        )
+    markers = [vehicle_marker(car, car.available_now) for car in vehicles]
+    return HttpResponse(json.dumps({'markers': markers}), content_type='application/json')
+
+
+def nearest_vehicles(request):
+    """
+    Returns markers for the closest vehicles to a point (lat, lng from GET) that are free right now, or free for a
+    whole time window if the booking form fields are given. Results are sorted nearest first and include the
+    distance in km.
+    """
+    try:
+        latitude, longitude = float(request.GET['lat']), float(request.GET['lng'])
+    except (KeyError, ValueError):
+        return HttpResponse(json.dumps({'error': 'A location (lat, lng) is required'}), content_type='application/json')
+    try:
+        k = min(max(int(request.GET.get('k', 5)), 1), MAX_NEAREST_VEHICLES)
+    except ValueError:
+        return HttpResponse(json.dumps({'error': 'Number of vehicles must be a whole number'}),
+                            content_type='application/json')
+    start = end = None
+    if 'booking_start_date' in request.GET:
+        search_form = BookingForm(request.GET)
+        if not search_form.is_valid():
+            return HttpResponse(json.dumps({'error': search_form.errors}), content_type='application/json')
+        start, end = search_form.cleaned_data['schedule_start'], search_form.cleaned_data['schedule_end']
+    markers = []
+    for car in get_nearest_available_vehicles(latitude, longitude, k, start=start, end=end):
+        marker = vehicle_marker(car, True)
+        marker['distance'] = round(car.distance, 3)
+        markers.append(marker)
+    return HttpResponse(json.dumps({'markers': markers}), content_type='application/json')
+
+
+def vehicle_type_quotes(request):
+    """
+    Returns the price of a booking for a time window (booking form fields from GET) for every vehicle type, with the
+    number of vehicles of each type that are free for the whole window. Cheapest first.
+    """
+    search_form = BookingForm(request.GET)
+    if not search_form.is_valid():
+        return HttpResponse(json.dumps({'error': search_form.errors}), content_type='application/json')
+    quotes = [
+        {
+            'id': quote['vehicle_type'].id,
+            'description': quote['vehicle_type'].description,
+            'total': '${0:.2f}'.format(quote['price'].cost),
+            'days': quote['price'].days,
+            'hours': quote['price'].hours,
+            'free': quote['free'],
+        }
+        for quote in get_vehicle_type_quotes(search_form.cleaned_data['schedule_start'],
+                                             search_form.cleaned_data['schedule_end'])
+    ]
+    return HttpResponse(json.dumps({'quotes': quotes}), content_type='application/json')
+
+
+@login_required
+def booking_invoice_status(request, booking_id):
+    """
+    Whether the booking's invoice has been emailed yet (pending, running, done or failed), polled by the booking page
+    """
+    booking = get_object_or_404(Booking.objects.select_related('invoice'), pk=booking_id, user=request.user)
+    if not booking.is_paid():
+        raise Http404
+    return HttpResponse(json.dumps({'status': get_invoice_status(booking.invoice)}), content_type='application/json')
@@ -0,0 +1,74 @@
+#
+#   Author(s): Huon Imberger
+#   Description: Offers slots freed by cancellations to users on the waitlist for them. Entries overlapping the freed
+#                slot are found through the waitlist indexes, checked for other bookings in one sweep, and offered
+#                in a single batch of emails.
+#
+
+from django.urls import reverse
+from django.utils import timezone
+
+from emails.utils import send_templated_emails
+from .models import Booking, BookingHold, WaitlistEntry
+from .recurring import sweep_overlaps
+
+
+def find_offers(vehicle, start, end):
+    """
+    Finds the waitlist entries that can be offered the vehicle, now that [start, end) is free. Entries are only
+    offered if the vehicle is free for their whole window.
+    Takes three queries however many entries there are: one for the entries, and one each for the vehicle's
+    bookings and holds over all their windows.
+    :return: list of WaitlistEntry, in the order they joined the waitlist
+    """
+    entries = list(
+        WaitlistEntry.objects.waiting().for_vehicle(vehicle).overlapping(start, end).select_related('user')
+        .order_by('schedule_start')
+    )
+    if not entries:
+        return []
+    first = entries[0].schedule_start
+    last = max(entry.schedule_end for entry in entries)
+    fields = ('user_id', 'vehicle_id', 'schedule_start', 'schedule_end')
+    conflicts = (list(Booking.objects.overlapping(first, last).filter(vehicle=vehicle).only(*fields)) +
+                 list(BookingHold.objects.live().overlapping(first, last).filter(vehicle=vehicle).only(*fields)))
+    overlaps = sweep_overlaps([(entry.schedule_start, entry.schedule_end) for entry in entries], conflicts)
+    offers = [entry for entry, active in zip(entries, overlaps) if not active]
+    return sorted(offers, key=lambda entry: (entry.created, entry.id))
+
+
+def offer_freed_slot(booking, build_absolute_uri):
+    """
+    Emails everyone waiting for the slot freed by a cancelled booking, with a link to book it. Each entry is only
+    offered a slot once; the first user to book it gets it.
+    :param build_absolute_uri: makes an absolute URL from a path, e.g. request.build_absolute_uri
+    :return: list of WaitlistEntry offered
+    """
+    vehicle = booking.vehicle
+    now = timezone.now()
+    offers = find_offers(vehicle, max(booking.schedule_start, now), booking.schedule_end)
+    if not offers:
+        return []
+    WaitlistEntry.objects.filter(pk__in=[entry.pk for entry in offers]).update(offered=now)
+    messages = []
+    for entry in offers:
+        entry.offered = now
+        start = timezone.localtime(entry.schedule_start)
+        length = entry.schedule_end - entry.schedule_start
+        book_url = reverse('carshare:booking_create_final_length', kwargs={
+            'vehicle_id': vehicle.id,
+            'year': start.year,
+            'month': start.month,
+            'day': start.day,
+            'hour': start.hour,
+            'length': int(length.total_seconds() // 3600),
+        })
+        context = {
+            'user': entry.user,
+            'entry': entry,
+            'vehicle': vehicle,
+            'book_url': build_absolute_uri(book_url),
+        }
+        messages.append((context, [entry.user.email]))
+    send_templated_emails('Waitlist Offer', messages)
+    return offers
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+# Templates added after the email_templates fixture was first loaded, which the code sends by name. Created here so
+# existing sites don't need to reload the fixture. Their ids match the fixture, so loading it later doesn't add
+# duplicates.
+TEMPLATES = [
+    {
+        'pk': 7,
+        'name': 'Recurring Booking Confirmation',
+        'subject': 'Vroom Weekly Bookings',
+        'body': (
+            '<h1><span style="font-size:36px"><strong><span style="color:#2980b9">Weekly Booking Confirmation</span></strong></span></h1>\r\n'
+            '\r\n'
+            '<p>Your weekly bookings have been confirmed.<br />\r\n'
+            'If you would like to extend or cancel any of these bookings, please login to the website.</p>\r\n'
+            '\r\n'
+            '<p>&nbsp;</p>\r\n'
+            '\r\n'
+            '<h2><span style="color:#2980b9">Vehicle</span></h2>\r\n'
+            '\r\n'
+            '<p>{{ vehicle }}</p>\r\n'
+            '\r\n'
+            '<h2><span style="color:#2980b9">Location</span></h2>\r\n'
+            '\r\n'
+            '<p>{{ vehicle.pod.description }}</p>\r\n'
+            '\r\n'
+            '<h2><span style="color:#2980b9">Bookings</span></h2>\r\n'
+            '\r\n'
+            '<ul>\r\n'
+            '{% for booking in bookings %}\r\n'
+            '\t<li>{{ booking.schedule_start }} to {{ booking.schedule_end }}</li>\r\n'
+            '{% endfor %}\r\n'
+            '</ul>\r\n'
+            '\r\n'
+            '{% if skipped %}\r\n'
+            '<h2><span style="color:#2980b9">Not booked</span></h2>\r\n'
+            '\r\n'
+            '<p>The vehicle was unavailable, or you already had a booking, at these times:</p>\r\n'
+            '\r\n'
+            '<ul>\r\n'
+            '{% for start, end, clash in skipped %}\r\n'
+            '\t<li>{{ start }} to {{ end }}</li>\r\n'
+            '{% endfor %}\r\n'
+            '</ul>\r\n'
+            '{% endif %}'
+        ),
+    },
+    {
+        'pk': 8,
+        'name': 'Waitlist Offer',
+        'subject': 'Vroom - A Car is Free',
+        'body': (
+            '<h1><span style="font-size:36px"><strong><span style="color:#2980b9">Good news, {{ user.first_name }}!</span></strong></span></h1>\r\n'
+            '\r\n'
+            '<p>A booking has been cancelled, and the car you were waiting for is now free.<br />\r\n'
+            'Other people may be waiting too, so book it soon: <a href="{{ book_url }}" rel="noreferrer nofollow noopener" target="_blank"><strong>Book now</strong></a></p>\r\n'
+            '\r\n'
+            '<p>&nbsp;</p>\r\n'
+            '\r\n'
+            '<h2><span style="color:#2980b9">Vehicle</span></h2>\r\n'
+            '\r\n'
+            '<p>{{ vehicle }}</p>\r\n'
+            '\r\n'
+            '<h2><span style="color:#2980b9">Location</span></h2>\r\n'
+            '\r\n'
+            '<p>{{ vehicle.pod.description }}</p>\r\n'
+            '\r\n'
+            '<h2><span style="color:#2980b9">Booking start</span></h2>\r\n'
+            '\r\n'
+            '<p>{{ entry.schedule_start }}</p>\r\n'
+            '\r\n'
+            '<h2><span style="color:#2980b9">Booking end</span></h2>\r\n'
+            '\r\n'
+            '<p>{{ entry.schedule_end }}</p>'
+        ),
+    },
+]
+
+
+def add_templates(apps, schema_editor):
+    EmailTemplate = apps.get_model('emails', 'EmailTemplate')
+    for template in TEMPLATES:
+        if EmailTemplate.objects.filter(name=template['name']).exists():
+            continue
+        fields = dict(template)
+        if EmailTemplate.objects.filter(pk=fields['pk']).exists():
+            del fields['pk']
+        EmailTemplate.objects.create(**fields)
+
+
+def remove_templates(apps, schema_editor):
+    EmailTemplate = apps.get_model('emails', 'EmailTemplate')
+    EmailTemplate.objects.filter(name__in=[template['name'] for template in TEMPLATES]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('emails', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_templates, remove_templates),
+    ]
@@ -4,7 +4,7 @@
 #
 
 from django.template import Engine, Context
-from django.core.mail import EmailMultiAlternatives
+from django.core.mail import EmailMultiAlternatives, get_connection
 from django.template.loader import render_to_string
 from django.utils.html import strip_tags
 from django.conf import settings
@@ -12,14 +12,13 @@ from django.conf import settings
 from .models import EmailTemplate
 
 
-def send_templated_email(template_name, context, recipient_list, from_email=settings.DEFAULT_FROM_EMAIL, attachment_filename=None, attachment_data=None):
+def render_templated_email(email_template, context, recipient_list, from_email=settings.DEFAULT_FROM_EMAIL):
     """
-    Sends an email using a template stored in the database (based on the template name)
-    Also supports attaching a file
+    Renders an email from a template stored in the database
+    :param email_template: EmailTemplate
+    :return: EmailMultiAlternatives, ready to send
     """
-    # Get template from database, render it using the provided context
     template_engine = Engine()
-    email_template = EmailTemplate.objects.get(name=template_name)
     subject_template = template_engine.from_string(email_template.subject)
     body_template = template_engine.from_string(email_template.body)
     email_context = Context(context)
@@ -30,7 +29,6 @@ def send_templated_email(template_name, context, recipient_list, from_email=sett
         context = {'rendered_email_body': email_body}
     )
 
-    # Send the email
     text_message = strip_tags(email_body_full)
     email = EmailMultiAlternatives(
         to=recipient_list,
@@ -39,6 +37,18 @@ def send_templated_email(template_name, context, recipient_list, from_email=sett
         body=text_message,
     )
     email.attach_alternative(email_body_full, "text/html")
+    return email
+
+
+def send_templated_email(template_name, context, recipient_list, from_email=settings.DEFAULT_FROM_EMAIL, attachment_filename=None, attachment_data=None):
+    """
+    Sends an email using a template stored in the database (based on the template name)
+    Also supports attaching a file
+    """
+    # Get template from database, render it using the provided context
+    email_template = EmailTemplate.objects.get(name=template_name)
+    email = render_templated_email(email_template, context, recipient_list, from_email=from_email)
+
     # Attachment?
     if attachment_filename:
         if attachment_data:
@@ -48,3 +58,18 @@ def send_templated_email(template_name, context, recipient_list, from_email=sett
     elif attachment_data:
         email.attach('attachment', attachment_data)
     email.send()
+
+
+def send_templated_emails(template_name, messages, from_email=settings.DEFAULT_FROM_EMAIL):
+    """
+    Sends a batch of emails using the same template, loading the template once and sending every email over a single
+    connection
+    :param messages: list of (context, recipient_list)
+    :return: number of emails sent
+    """
+    if not messages:
+        return 0
+    email_template = EmailTemplate.objects.get(name=template_name)
+    emails = [render_templated_email(email_template, context, recipient_list, from_email=from_email)
+              for context, recipient_list in messages]
+    return get_connection().send_messages(emails)
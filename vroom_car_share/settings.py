@@ -29,7 +29,6 @@ SECRET_KEY = os.environ.get('SECRET_KEY', 'djlJvjsjdivOIJ98j4cn2oi4unf2p9eufp298
 DEBUG = os.environ.get('DEBUG', False)
 
 # Application definition
-SESSION_SERIALIZER = 'django.contrib.sessions.serializers.PickleSerializer'
 
 INSTALLED_APPS = [
     'flat_responsive',
@@ -76,6 +75,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'carshare.context_processors.current_booking',
             ],
             'debug': DEBUG,
         },
@@ -126,6 +126,23 @@ USE_TZ = True
 # Change 'default' database configuration with $DATABASE_URL.
 DATABASES['default'].update(dj_database_url.config(conn_max_age=500))
 
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Booking quotes and vehicle rates (see carshare.quotes). Set these to a backend shared by every worker, such as
+    # memcached, so rate changes are seen by all workers at once; with a per-process cache, other workers see them
+    # once their entries expire.
+    'quotes': {
+        'BACKEND': os.environ.get('QUOTE_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('QUOTE_CACHE_LOCATION', 'quotes'),
+        'TIMEOUT': 300,
+        'OPTIONS': {
+            'MAX_ENTRIES': 4096,
+        },
+    },
+}
+
 # Honor the 'X-Forwarded-Proto' header for request.is_secure()
 SECURE_PROXY_SSL_HEADER = ('HTTP_X_FORWARDED_PROTO', 'https')
 